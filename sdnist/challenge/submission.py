@@ -7,7 +7,7 @@ import pandas as pd
 import sdnist
 import sdnist.strs as strs
 from sdnist.load import load_dataset, TestDatasetName
-from sdnist.metrics.kmarg_old import CensusKMarginalScore
+from sdnist.metrics.kmarg_old import CensusKMarginalScore, KMarginalScorer
 
 from loguru import logger
 
@@ -92,6 +92,17 @@ def run(submission: Model,
                                                                      bins=config[strs.BINS],
                                                                      **config[strs.K_MARGINAL])
 
+    # census k-marginal scorer, discretizes the private dataset and computes
+    # its marginals once for all epsilon values
+    census_scorer = None
+    if challenge == "census":
+        census_scorer = KMarginalScorer(private,
+                                        schema,
+                                        discretize=True,
+                                        bins=config[strs.BINS],
+                                        score_cls=CensusKMarginalScore,
+                                        **config[strs.K_MARGINAL])
+
     for eps in EPS:
         # Attempt to skip already computed scores
         score_location = results / f"eps={eps}.json"
@@ -122,12 +133,14 @@ def run(submission: Model,
         # Compute score
         logger.info(f"Computing scores for eps={eps}.")
 
-        # TODO score object can be reused for marginal speed gains.
-        score = sdnist.score(private_dataset=private,
-                             synthetic_dataset=synthetic,
-                             schema=schema,
-                             config=config,
-                             challenge=challenge)
+        if census_scorer is not None:
+            score = census_scorer.score(synthetic)
+        else:
+            score = sdnist.score(private_dataset=private,
+                                 synthetic_dataset=synthetic,
+                                 schema=schema,
+                                 config=config,
+                                 challenge=challenge)
         logger.success(f"eps={eps}\tscore={score.score:.2f}")
 
         if results is not None:
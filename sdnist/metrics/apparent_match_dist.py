@@ -4,30 +4,61 @@ Author: Mary Ann Wall
 import argparse
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from sdnist.metrics.row_hash import encode_rows, RowHashIndex
+
 
 def cellchange(df1, df2, quasi, exclude_cols):
-    # use drop duplicates with keep argument as False,
-    # to retain only those records that occur only
-    # once in the data.
-    uniques1 = df1.drop_duplicates(subset=quasi, keep=False)
-    uniques2 = df2.drop_duplicates(subset=quasi, keep=False)
-    matcheduniq = uniques1.merge(uniques2, how='inner', on=quasi)
+    # retain only those records whose quasi identifiers occur
+    # only once in the data, as drop duplicates with keep=False
+    q_codes1, q_codes2 = encode_rows([df1, df2], quasi)
+    index1 = RowHashIndex(q_codes1)
+    index2 = RowHashIndex(q_codes2)
+    rows1 = np.flatnonzero(index1.unique_rows())
+    rows2 = np.flatnonzero(index2.unique_rows())
+    uniques1 = df1.iloc[rows1]
+    uniques2 = df2.iloc[rows2]
+
+    # unique records of df1 and the unique record of df2 with the same
+    # quasi identifiers, in df1 order
+    pos = RowHashIndex(index1.codes[rows1]).lookup(RowHashIndex(index2.codes[rows2]))
+    left = np.flatnonzero(pos >= 0)
+    matched1 = uniques1.iloc[left]
+    matched2 = uniques2.iloc[pos[left]]
+
     allcols = set(df1.columns).intersection(set(df2.columns))
-    cols = allcols - set(quasi) - set(exclude_cols)
-    return match(matcheduniq, cols), uniques1, uniques2, matcheduniq
-
-
-def match(df, cols):
-    S = pd.Series(data=0, index=df.index)
-    for c in cols:
-        c_x = c + "_x"
-        c_y = c + "_y"
-        S = S + (df[c_x] == df[c_y]).astype(int)
-    S = (S/len(cols)) * 100
-    return S
+    cols = list(allcols - set(quasi) - set(exclude_cols))
+    codes1, codes2 = encode_rows([matched1, matched2], cols)
+    missing = matched1[cols].isna().to_numpy(dtype=bool) \
+        | matched2[cols].isna().to_numpy(dtype=bool)
+    percents = pd.Series(match(codes1, codes2, missing, len(cols)))
+
+    matcheduniq = _matched_frame(matched1, matched2, quasi)
+    return percents, uniques1, uniques2, matcheduniq
+
+
+def match(codes1: np.ndarray, codes2: np.ndarray,
+          missing: np.ndarray, n_cols: int) -> np.ndarray:
+    # percent of columns with equal values in aligned records,
+    # missing values are never equal
+    n_equal = ((codes1 == codes2) & ~missing).sum(axis=1)
+    if n_cols == 0:
+        return np.full(len(n_equal), np.nan)
+    return (n_equal / n_cols) * 100
+
+
+def _matched_frame(left: pd.DataFrame, right: pd.DataFrame, on) -> pd.DataFrame:
+    # aligned records in the layout of left.merge(right, how='inner', on=on)
+    right_cols = [c for c in right.columns if c not in on]
+    shared = set(left.columns).intersection(right_cols)
+    left = left.reset_index(drop=True)
+    right = right[right_cols].reset_index(drop=True)
+    left.columns = [f'{c}_x' if c in shared else c for c in left.columns]
+    right.columns = [f'{c}_y' if c in shared else c for c in right_cols]
+    return pd.concat([left, right], axis=1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import NearestNeighbors
+
+# quantiles of distances reported for each group of records
+DCR_QUANTILES = [0.05, 0.25, 0.5, 0.75]
+
+
+def min_max_scale(target: np.ndarray, synthetic: np.ndarray):
+    """
+    Scales each feature of both datasets to [0, 1] using the range of
+    the feature in the target data. Constant features are set to 0.
+    """
+    t_min = target.min(axis=0)
+    t_range = target.max(axis=0) - t_min
+    t_range[t_range == 0] = 1
+    return (target - t_min) / t_range, (synthetic - t_min) / t_range
+
+
+class DCR:
+    NAME = 'Distance to Closest Record'
+
+    def __init__(self,
+                 target: pd.DataFrame,
+                 synthetic: pd.DataFrame,
+                 groups: Optional[pd.Series] = None,
+                 features: Optional[List[str]] = None,
+                 block_size: int = 10000,
+                 n_workers: Optional[int] = None):
+        """
+        Euclidean distance from each synthetic record to its closest target
+        record, over min-max scaled features of the all integer (t_) data.
+        Synthetic records are searched in blocks of block_size records against
+        a kd-tree of the target data, so memory is bounded by the block size.
+
+        Parameters
+        ----------
+            target : pd.DataFrame
+                all integer target data
+            synthetic : pd.DataFrame
+                all integer synthetic data
+            groups : pd.Series
+                group (e.g. PUMA) of each synthetic record, for the
+                distributions of distances per group
+            features : List[str]
+                features over which distances are computed. If None,
+                features common to both datasets are used.
+            block_size : int
+                number of synthetic records searched at once
+            n_workers : int
+                number of threads of the nearest neighbor search,
+                all cpus if None
+        """
+        if features is None:
+            features = [f for f in target.columns if f in synthetic.columns]
+        self.features = features
+        self.groups = groups
+        self.block_size = block_size
+        self.n_workers = -1 if n_workers is None else n_workers
+        self.tar, self.syn = min_max_scale(target[features].to_numpy(dtype=np.float64),
+                                           synthetic[features].to_numpy(dtype=np.float64))
+        self.syn_index = synthetic.index
+
+        self.distances: Optional[np.ndarray] = None  # distance of each synthetic record
+        self.summary: Optional[pd.DataFrame] = None
+        self.group_summary: Optional[pd.DataFrame] = None
+
+    def compute(self):
+        nn = NearestNeighbors(n_neighbors=1, algorithm='kd_tree', n_jobs=self.n_workers)
+        nn.fit(self.tar)
+        self.distances = np.empty(self.syn.shape[0])
+        for start in range(0, self.syn.shape[0], self.block_size):
+            block = self.syn[start: start + self.block_size]
+            d, _ = nn.kneighbors(block, return_distance=True)
+            self.distances[start: start + block.shape[0]] = d[:, 0]
+
+        distances = pd.Series(self.distances, index=self.syn_index)
+        counts = {'records': int, 'exact matches': int}
+        self.summary = _distribution(distances).to_frame().T.astype(counts)
+        if self.groups is not None:
+            groups = self.groups.reindex(self.syn_index)
+            self.group_summary = distances.groupby(groups.values, sort=True)\
+                .apply(_distribution).unstack().astype(counts)
+            self.group_summary.index.name = 'group'
+
+
+def _distribution(distances: pd.Series) -> pd.Series:
+    d = {'records': len(distances),
+         'exact matches': int((distances == 0).sum()),
+         'mean': distances.mean()}
+    for q in DCR_QUANTILES:
+        d[f'{int(q * 100)}%'] = distances.quantile(q)
+    return pd.Series(d)
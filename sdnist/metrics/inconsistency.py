@@ -1,87 +1,65 @@
+import ast
+import json
 from pathlib import Path
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 
 from sdnist.utils import *
 from sdnist.report.column_combs.column_combs import ColumnCombs
 
+# Inconsistency rules, each with a group ('a' age, 'w' work or 'h' housing),
+# a name, a description, the features to highlight and a list of checks.
+# Each check is a predicate expression over the features of a table that is
+# True for the violating records, evaluated only on tables that have all its
+# 'requires' features (the rule features by default) and none of its 'absent'
+# features. Predicates refer to a feature F by:
+#   F      the feature values
+#   F_N    whether the value is 'N'
+#   F_num  the numeric values, NaN for 'N'
+#   F_int  int() of the numeric values
+DEFAULT_RULES_PATH = Path(Path(__file__).parent, 'inconsistency_rules.json')
+RULE_KEYS = ['group', 'name', 'description', 'features', 'checks']
+
 # List of tuples with all the information associated with each inconsistency (abbreviated ic)
 # [(category for ic, name for ic, explanation string for ic, features to highlight for ic)]
 [GROUP, NAME, DESCRIPTION, FEATURES] = [0, 1, 2, 3]
 
-ic_types = [
-    ("a", "child_DVET", "Children (< 15) can't be disabled military veterans",
-     ["AGEP", "DVET"]),
-    ("a", "child_MSP", "Children (< 15) can't be married",
-     ["AGEP", "MSP"]),
-    ("a", "child_PINCP", "Children (< 15) don't have personal incomes",
-     ["AGEP", "PINCP"]),
-    ("a", "child_PINCP_DECILE", "Children (< 15) don't have personal incomes",
-     ["AGEP", "PINCP_DECILE"]),
-    ("a", "child_INDP", "Children (< 15) don't have work industries",
-     ["AGEP", "INDP"]),
-    ("a", "child_INDP_CAT", "Children (< 15) don't have work industries",
-     ["AGEP", "INDP_CAT"]),
-    ("a", "child_phd", "Children (< 15) don't have PhDs",
-     ["AGEP", "EDU"]),
-    ("a", "adult_child", "Even when the AGEP feature is not explicitly used, "
-                         "features which use N to indicate children ( < 15) must agree",
-     ["MSP", "PINCP", "PINCP_DECILE"]),
-    ("a", "adult_N_MSP", "Adults ( > 14) must specify values (other than N) for MSP",
-     ["AGEP", "MSP"]),
-    ("a", "adult_N_PINCP", "Adults ( > 14) must specify values (other than N) for PINCP",
-     ["AGEP", "PINCP"]),
-    ("a", "adult_N_PINCP_DECILE", "Adults ( > 14) must specify values (other than N) for PINCP_DECILE",
-     ["AGEP", "PINCP_DECILE"]),
-    ("a", "adult_N_EDU", "Adults ( > 14) must specify values (other than N) for EDU",
-     ["AGEP", "EDU"]),
-    ("a", "adult_N_DPHY", "Adults ( > 14) must specify values (other than N) for DPHY",
-     ["AGEP", "DPHY"]),
-    ("a", "adult_N_DREM", "Adults ( > 14) must specify values (other than N) for DREM",
-     ["AGEP", "DREM"]),
-    ("a", "toddler_DPHY", "Toddlers (< 5) naturally toddle, it's not a physical disability",
-     ["AGEP", "DPHY"]),
-    ("a", "toddler_DREM", "Toddlers (< 5) are naturally forgetful, it's not a cognitive disability",
-     ["AGEP", "DREM"]),
-    ("a", "toddler_diploma", "Toddlers (< 5) don't have high school diplomas",
-     ["AGEP", "EDU"]),
-    ("a", "infant_EDU", "Infants (< 3) aren't in school",
-     ["AGEP", "EDU"]),
-    ("w", "wealthy_poor_POVPIP", "Individuals in top 5% income backet (> $300K) aren't in poverty",
-     ["PINCP", "POVPIP"]),
-    ("w", "wealthy_poor_DECILE",
-     "Individuals in top 5% income backet (> $300K) aren't in the lowest income deciles",
-     ["PINCP", "PINCP_DECILE"]),
-    ("w", "invalid_INDP", "Industry codes must be valid; see data dictionary",
-     ["INDP"]),
-    ("w", "invalid_INDP_CAT",
-     "Industry codes should agree with industry categories; see data dictionary",
-     ["INDP", "INDP_CAT"]),
-    ("h", "too_many_children",
-     "Adults needed: Family size must be at least one greater than number of children",
-     ["NOC", "NPF"]),
-    ("h", "gq_own_jail",
-     "Inmates don't own jails, patients don't own hospitals: Group quarters residents aren't owners",
-     ["HOUSING_TYPE", "OWN_RENT"]),
-    ("h", "gq_own_dorm",
-     "Students don't own dorms, soldiers don't own barracks: Group quarters residents aren't owners",
-     ["HOUSING_TYPE", "OWN_RENT"]),
-    ("h", "gq_h_family_NPF",
-     "Individuals who live in group quarters aren't considered family households",
-     ["HOUSING_TYPE", "NPF"]),
-    ("h", "gq_h_family_NOC",
-     "Individuals who live in group quarters aren't considered family households",
-     ["HOUSING_TYPE", "NOC"]),
-    ("h", "gq_ro_family_NPF",
-     "Individuals who live in group quarters aren't considered family households",
-     ["HOUSING_TYPE", "NPF"]),
-    ("h", "gq_ro_family_NOC",
-     "Individuals who live in group quarters aren't considered family households",
-     ["HOUSING_TYPE", "NOC"]),
-    ("h", "house_NOC", "Individuals who live in houses must provide number of children",
-     ["HOUSING_TYPE", "NOC"]),
-    ("h", "house_OWN_RENT", "Individuals who live in houses must specify if they rent or own",
-     ["HOUSING_TYPE", "OWN_RENT"]),
-]
+
+def load_rules(path: Optional[Path] = None) -> List[Dict]:
+    """Reads inconsistency rules from a json file, the default rules if path is None"""
+    path = DEFAULT_RULES_PATH if path is None else Path(path)
+    with open(path) as f:
+        rules = json.load(f)
+    for r in rules:
+        missing = [k for k in RULE_KEYS if k not in r]
+        if len(missing):
+            raise Exception(f'Inconsistency rule {r.get("name")} in {path} '
+                            f'is missing {missing}')
+        for c in r['checks']:
+            try:
+                ast.parse(c['predicate'], mode='eval')
+            except SyntaxError as e:
+                raise Exception(f'Invalid predicate of inconsistency rule {r["name"]} '
+                                f'in {path}: {e}')
+    return rules
+
+
+def get_ic_types(rules: List[Dict]) -> List[Tuple[str, str, str, List[str]]]:
+    return [(r['group'], r['name'], r['description'], r['features']) for r in rules]
+
+
+def get_ic_checks(rules: List[Dict]) -> Tuple[Tuple[str, FrozenSet[str], FrozenSet[str], str], ...]:
+    # (ic name, required features, absent features, predicate) of each check
+    return tuple((r['name'],
+                  frozenset(c.get('requires', r['features'])),
+                  frozenset(c.get('absent', [])),
+                  c['predicate'])
+                 for r in rules for c in r['checks'])
+
+
+ic_types = get_ic_types(load_rules())
 
 
 class Inconsistencies:
@@ -89,10 +67,14 @@ class Inconsistencies:
     def __init__(self,
                  synthetic_data: pd.DataFrame,
                  out_directory: Path,
-                 col_comb: Optional[ColumnCombs] = None):
+                 col_comb: Optional[ColumnCombs] = None,
+                 rules_path: Optional[Path] = None):
         self.s = synthetic_data
         self.col_comb = col_comb
         self.out_path = out_directory
+        rules = load_rules(rules_path)
+        self.ic_types = get_ic_types(rules)
+        self.ic_checks = get_ic_checks(rules)
 
         # dict containing headers and paragraphs for each inconsistency group
         # this is used for populating report user interface
@@ -131,8 +113,8 @@ class Inconsistencies:
 
     def compute(self):
         # inconsistency names
-        ic_names = [i[NAME] for i in ic_types]
-        ic_features_list_all = [i[FEATURES] for i in ic_types]
+        ic_names = [i[NAME] for i in self.ic_types]
+        ic_features_list_all = [i[FEATURES] for i in self.ic_types]
         ic_features_list_distinct = [list(x) for x in set(tuple(x) for x in ic_features_list_all) ]
 
         # inconsistency dictionary--stores lists of violators
@@ -144,7 +126,7 @@ class Inconsistencies:
         for features in ic_features_list_distinct:
             if self.col_comb is not None:
                 syn = self.col_comb.getDataframeByColumns(features, version = 'c_')
-            _one_compute_pass(syn, ic_dict)
+            _one_compute_pass(syn, ic_dict, self.ic_checks)
 
         # ------- Output Statistics ------------------------
         # n here is just used in a general statistical sense, so ok if it is off a bit
@@ -156,12 +138,12 @@ class Inconsistencies:
 
         age_path = Path(self.out_path, 'age')
         create_path(age_path)
-        for i in ic_types:
+        for i in self.ic_types:
             if i[GROUP] == 'a':  # cycle through age ic's
                 ic_age[i[NAME]] = ic_dict[i[NAME]]
                 if len(ic_dict[i[NAME]]) > 0:  # if this ic actually occurred
                     age_violators = age_violators.union(ic_dict[i[NAME]])
-                    syn = self.col_comb.getDataframeByColumns(_get_features_from_name(i[NAME]), version = 'c_')
+                    syn = self.col_comb.getDataframeByColumns(_get_features_from_name(i[NAME], self.ic_types), version = 'c_')
                     example_row = syn.loc[[ic_dict[i[NAME]][0]], :]
 
                     ic_data = [i[NAME], i[DESCRIPTION], i[FEATURES], f'{len(ic_dict[i[NAME]])} '
@@ -187,12 +169,12 @@ class Inconsistencies:
 
         age_path = Path(self.out_path, 'work')
         create_path(age_path)
-        for i in ic_types:
+        for i in self.ic_types:
             if i[0] == 'w':
                 ic_work[i[NAME]] = ic_dict[i[NAME]]
                 if len(ic_dict[i[NAME]]) > 0:
                     work_violators = work_violators.union(ic_dict[i[NAME]])
-                    syn = self.col_comb.getDataframeByColumns(_get_features_from_name(i[NAME]), version = 'c_')
+                    syn = self.col_comb.getDataframeByColumns(_get_features_from_name(i[NAME], self.ic_types), version = 'c_')
                     example_row = syn.loc[[ic_dict[i[NAME]][0]], :]
 
                     ic_data = [i[NAME], i[DESCRIPTION], i[FEATURES], f'{len(ic_dict[i[NAME]])} '
@@ -218,12 +200,12 @@ class Inconsistencies:
 
         age_path = Path(self.out_path, 'work')
         create_path(age_path)
-        for i in ic_types:
+        for i in self.ic_types:
             if i[0] == 'h':
                 if len(ic_dict[i[NAME]]) > 0:
                     ic_house[i[NAME]] = ic_dict[i[NAME]]
                     house_violators = house_violators.union(ic_dict[i[NAME]])
-                    syn = self.col_comb.getDataframeByColumns(_get_features_from_name(i[NAME]), version = 'c_')
+                    syn = self.col_comb.getDataframeByColumns(_get_features_from_name(i[NAME], self.ic_types), version = 'c_')
                     example_row = syn.loc[[ic_dict[i[NAME]][0]], :]
 
                     ic_data = [i[NAME], i[DESCRIPTION], i[FEATURES], f'{len(ic_dict[i[NAME]])} violations',
@@ -259,130 +241,66 @@ class Inconsistencies:
                                         'Percent Records Inconsistent': r[2]}
                                  for r in overall_stats]
 
-def _get_features_from_name(name):
+def _get_features_from_name(name, ic_types):
     for ic_type in ic_types:
         if ic_type[NAME] == name:
             return ic_type[FEATURES]
 
-def _one_compute_pass(data, ic_dict):
-    # look through records, register violations for each row
-    # i = record id, r = record values
-    fl = list(data.columns)
-    for i, r in data.iterrows():
-        # -------------------age related inconsistencies---------------
-        if "AGEP" in fl and r["AGEP"] < 15:
-            if "DVET" in fl and not (r["DVET"] == 'N'):
-                ic_dict["child_DVET"].append(i)
-            if "MSP" in fl and not (r["MSP"] == 'N'):
-                ic_dict["child_MSP"].append(i)
-            if "PINCP" in fl and not (r["PINCP"] == 'N'):
-                ic_dict["child_PINCP"].append(i)
-            if "PINCP_DECILE" in fl and not (r["PINCP_DECILE"] == 'N'):
-                ic_dict["child_PINCP_DECILE"].append(i)
-            if "INDP" in fl and not (r["INDP"] == 'N'):
-                ic_dict["child_INDP"].append(i)
-            if "INDP_CAT" in fl and not (r["INDP_CAT"] == 'N'):
-                ic_dict["child_INDP_CAT"].append(i)
-            if "EDU" in fl and not (r["EDU"] == 'N') and not (int(r["EDU"]) < 12):
-                ic_dict["child_phd"].append(i)
-
-            if r["AGEP"] < 10:
-                # if "NOC" in fl and not (r["NOC"] == 'N'):
-                #     ic_dict["child_NOC"].append(i)
-
-                if r["AGEP"] < 5:
-                    if "DPHY" in fl and not (r["DPHY"] == 'N'):
-                        ic_dict["toddler_DPHY"].append(i)
-                    if "DREM" in fl and not (r["DREM"] == 'N'):
-                        ic_dict["toddler_DREM"].append(i)
-                    if "EDU" in fl and not (r["EDU"] == 'N') and not (int(r["EDU"]) < 5):
-                        ic_dict["toddler_diploma"].append(i)
-
-                    if r["AGEP"] < 3:
-                        if "EDU" in fl and not (r["EDU"] == 'N'):
-                            ic_dict["infant_EDU"].append(i)
-
-        if not ("AGEP" in fl):
-            # This forces agreement on MSP, PINCP and PINCP_DECILE if at least 2 exist.
-            if ("MSP" in fl and (r["MSP"] == 'N')) and (
-                    ("PINCP" in fl and not (r["PINCP"] == 'N')) or (
-                    "PINCP_DECILE" in fl and not (r["PINCP_DECILE"] == 'N'))):
-                ic_dict["adult_child"].append(i)
-            if ("MSP" in fl and not (r["MSP"] == 'N')) and (
-                    ("PINCP" in fl and (r["PINCP"] == 'N')) or (
-                    "PINCP_DECILE" in fl and (r["PINCP_DECILE"] == 'N'))):
-                ic_dict["adult_child"].append(i)
-            if not ("MSP" in fl) and ("PINCP" in fl) and ("PINCP_DECILE" in fl):
-                if ((r["PINCP"] == 'N') and not (r["PINCP_DECILE"] == 'N')) or (
-                        not (r["PINCP"] == 'N') and (r["PINCP_DECILE"] == 'N')):
-                    ic_dict["adult_child"].append(i)
-
-        # this catches adults who still have the child 'N' for their features.
-        if "AGEP" in fl and r["AGEP"] > 15:
-            if "MSP" in fl and (r["MSP"] == 'N'):
-                ic_dict["adult_N_MSP"].append(i)
-            if "PINCP" in fl and (r["PINCP"] == 'N'):
-                ic_dict["adult_N_PINCP"].append(i)
-            if "PINCP_DECILE" in fl and (r["PINCP_DECILE"] == 'N'):
-                ic_dict["adult_N_PINCP_DECILE"].append(i)
-            if "EDU" in fl and (r["EDU"] == 'N'):
-                ic_dict["adult_N_EDU"].append(i)
-            if "DPHY" in fl and (r["DPHY"] == 'N'):
-                ic_dict["adult_N_DPHY"].append(i)
-            if "DREM" in fl and (r["DREM"] == 'N'):
-                ic_dict["adult_N_DREM"].append(i)
-
-
-        # -------------------work and finance related inconsistencies---------------
-        # income > 300K
-        if "PINCP" in fl and not (r["PINCP"] == 'N') and float(r["PINCP"]) > 3000000:
-            if "POVPIP" in fl and not (r["POVPIP"] == "501"):
-                ic_dict["wealthy_poor_POVPIP"].append(i)
-            if "PINCP_DECILE" in fl and not (int(r["PINCP_DECILE"]) > 1):
-                ic_dict["wealthy_poor_POVPIP"].append(i)
-
-        # this currently just checks null value agreement,
-        # if one is null the other should be too
-        if "INDP" in fl and "INDP_CAT" in fl:
-            if ((r["INDP"] == "N") and (r["INDP_CAT"] != "N") or (r["INDP"] != "N") and (
-                    r["INDP_CAT"] == "N")):
-                ic_dict["invalid_INDP_CAT"].append(i)
-                # TODO: add INDP CAT and INDP code agreement checks
-
-        # -------------------housing and family related inconsistencies---------------
-        if ("NOC" in fl) and ("NPF" in fl) and (r["NOC"] != "N") and (r["NPF"] != "N"):
-            if not (int(r["NOC"]) < int(r["NPF"])):
-                ic_dict["too_many_children"].append(i)
-
-        # if group quarters (according to HOUSING_TYPE)
-        if ("HOUSING_TYPE" in fl) and (r["HOUSING_TYPE"] > 1):
-            if "NOC" in fl and not (r["NOC"] == 'N'):
-                ic_dict["gq_h_family_NOC"].append(i)
-
-            if "NPF" in fl and not (r["NPF"] == 'N'):
-                ic_dict["gq_h_family_NPF"].append(i)
-
-            if "OWN_RENT" in fl and (r["OWN_RENT"] == 2):
-                ic_dict["gq_own_jail"].append(i)
-
-            if (r["HOUSING_TYPE"] == 2) and "OWN_RENT" in fl and (r["OWN_RENT"] == 1):
-                ic_dict["gq_own_jail"].append(i)
-
-            if (r["HOUSING_TYPE"] == 3) and "OWN_RENT" in fl and (r["OWN_RENT"] == 1):
-                ic_dict["gq_own_dorm"].append(i)
-
-        # if house (according to HOUSING_TYPE)
-        if ("HOUSING_TYPE" in fl) and (int(r["HOUSING_TYPE"]) == 1):
-            if "OWN_RENT" in fl and (r["OWN_RENT"] == 0):
-                ic_dict["house_OWN_RENT"].append(i)
-
-            if "NOC" in fl and (r["NOC"] == 'N'):
-                ic_dict["house_NOC"].append(i)
-
-        # if group quarters (according to RENT_OWN)
-        if ("RENT_OWN" in fl) and (int(r["RENT_OWN"]) == 0):
-            if "NOC" in fl and not (r["NOC"] == 'N'):
-                ic_dict["gq_ro_family_NOC"].append(i)
-
-            if "NPF" in fl and not (r["NPF"] == 'N'):
-                ic_dict["gq_ro_family_NPF"].append(i)
+class _EncodedColumns(dict):
+    def __init__(self, data: pd.DataFrame):
+        """
+        Columns of a table referred to by the rule predicates, see
+        DEFAULT_RULES_PATH. Each column is encoded once per table, when
+        first used.
+        """
+        super().__init__()
+        self.data = data
+
+    def __missing__(self, key: str):
+        if key in self.data.columns:
+            value = self.data[key]
+        elif key.endswith('_N') and key[:-2] in self.data.columns:
+            value = (self.data[key[:-2]] == 'N').to_numpy(dtype=bool)
+        elif key.endswith('_num') and key[:-4] in self.data.columns:
+            f = key[:-4]
+            value = pd.to_numeric(self.data[f].where(~self[f'{f}_N']), errors='coerce')\
+                .to_numpy(dtype=np.float64)
+        elif key.endswith('_int') and key[:-4] in self.data.columns:
+            value = np.trunc(self[f'{key[:-4]}_num'])
+        else:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+
+def _predicate_names(predicate: str) -> Tuple[str, ...]:
+    return tuple(sorted({n.id for n in ast.walk(ast.parse(predicate, mode='eval'))
+                         if isinstance(n, ast.Name)}))
+
+
+@lru_cache(maxsize=None)
+def _compile_rules(ic_checks: Tuple[Tuple[str, FrozenSet[str], FrozenSet[str], str], ...],
+                   features: FrozenSet[str]) -> Tuple[Tuple[str, str, Tuple[str, ...]], ...]:
+    # (ic name, predicate, columns of the predicate) of the checks that
+    # apply to tables with the features
+    return tuple((name, predicate, _predicate_names(predicate))
+                 for name, required, absent, predicate in ic_checks
+                 if features.issuperset(required) and features.isdisjoint(absent))
+
+
+def _one_compute_pass(data: pd.DataFrame,
+                      ic_dict: Dict[str, List],
+                      ic_checks: Optional[Tuple] = None):
+    # evaluate each check over whole columns, and register the violating
+    # records in record order, once for each check they violate
+    if ic_checks is None:
+        ic_checks = get_ic_checks(load_rules())
+    columns = _EncodedColumns(data)
+    violations = dict()
+    for name, predicate, names in _compile_rules(ic_checks, frozenset(data.columns)):
+        mask = pd.eval(predicate, engine='python', parser='pandas',
+                       resolvers=({n: columns[n] for n in names},))
+        v = np.broadcast_to(np.asarray(mask, dtype=bool), len(data)).astype(np.int64)
+        violations[name] = violations[name] + v if name in violations else v
+    for name, v in violations.items():
+        ic_dict[name].extend(data.index.repeat(v).tolist())
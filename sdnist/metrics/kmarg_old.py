@@ -1,4 +1,4 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 import json
 
@@ -88,10 +88,7 @@ class KMarginalScore:
             return self._compute_score()
 
     def _compute_score_grouped(self):
-        total_tv = None
-
-        column_scores = {}
-        column_score_counts = {}
+        tv = []
 
         # Compute KMarginal per group in ALWAYS_GROUPBY
         if self.loading_bar:
@@ -107,19 +104,47 @@ class KMarginalScore:
 
             p0 = self._p0_cache[idx]
             p1 = compute_marginal_grouped(self._synthetic_dataset, columns, self.ALWAYS_GROUPBY)
-            tv = p0.subtract(p1, fill_value=0).abs().groupby(self.ALWAYS_GROUPBY).sum()
+            tv.append((columns, p0.subtract(p1, fill_value=0).abs().groupby(self.ALWAYS_GROUPBY).sum()))
 
-            if total_tv is None:
-                total_tv = tv
-            else:
-                total_tv = total_tv.add(tv)
+        return self.set_tv(tv)
 
+    def _compute_score(self):
+        tv = []
+        if self.loading_bar:
+            c_list = tqdm(self.columns(), total=self.N_PERMUTATIONS)
+        else:
+            c_list = self.columns()
+        # Compute KMarginal per group in ALWAYS_GROUPBY
+        for columns in c_list:
+            p0 = compute_marginal(self._private_dataset, columns)
+            p1 = compute_marginal(self._synthetic_dataset, columns)
+            tv.append((columns, pd.Series([p0.subtract(p1, fill_value=0).abs().sum()])))
+
+        return self.set_tv(tv)
+
+    def set_tv(self, tv: List[Tuple[List[str], pd.Series]]):
+        """
+        Sets scores from the total variation distance of each permutation of
+        columns, a Series indexed by group feature values (a single value
+        Series when there are no group features).
+        """
+        if not self.ALWAYS_GROUPBY:
+            mean_tv = sum(v.iloc[0] for _, v in tv) / self.N_PERMUTATIONS
+            # Remap to 0-1000 (worst to best)
+            self.score = (2 - mean_tv) * 500
+            return self.score
+
+        total_tv = None
+        column_scores = {}
+        column_score_counts = {}
+        for columns, v in tv:
+            total_tv = v if total_tv is None else total_tv.add(v)
             for col in columns:
                 if col not in column_scores:
-                    column_scores[col] = tv
+                    column_scores[col] = v
                     column_score_counts[col] = 1
                 else:
-                    column_scores[col] = column_scores[col] + tv
+                    column_scores[col] = column_scores[col] + v
                     column_score_counts[col] += 1
 
         mean_tv = total_tv / self.N_PERMUTATIONS
@@ -142,26 +167,125 @@ class KMarginalScore:
 
         return self.score
 
-    def _compute_score(self):
-        total_tv = 0
-        if self.loading_bar:
-            c_list = tqdm(self.columns(), total=self.N_PERMUTATIONS)
-        else:
-            c_list = self.columns()
-        # Compute KMarginal per group in ALWAYS_GROUPBY
-        for columns in c_list:
-            p0 = compute_marginal(self._private_dataset, columns)
-            p1 = compute_marginal(self._synthetic_dataset, columns)
-            tv = p0.subtract(p1, fill_value=0).abs().sum()
 
-            total_tv += tv
+class KMarginalScorer:
+    def __init__(self,
+                 private_dataset: pd.DataFrame,
+                 schema: dict,
+                 seed: int = None,
+                 bins: Optional[Dict] = None,
+                 discretize: bool = False,
+                 group_features: Optional[List[str]] = None,
+                 ignore_features: Optional[List[str]] = None,
+                 bias_penalty_cutoff: Optional[int] = None,
+                 score_cls: type = KMarginalScore):
+        """
+        Reusable k-marginal scorer of many synthetic datasets against one
+        private dataset. The private dataset is discretized, encoded and
+        its marginal densities computed only once, the marginals of each
+        synthetic dataset are counted with np.bincount over encoded columns.
+
+        Parameters
+        ----------
+            private_dataset : pd.DataFrame
+                private dataset
+            schema : dict
+                dataset schema
+            seed, bins, discretize, group_features, ignore_features, bias_penalty_cutoff
+                same as KMarginalScore
+            score_cls : type
+                KMarginalScore class of the score objects returned by score
+        """
+        # sdnist.report imports this module
+        from sdnist.report.dataset.codec import FeatureCodec
 
-        mean_tv = total_tv / self.N_PERMUTATIONS
+        self.schema = schema
+        self.seed = seed
+        self.bins = bins
+        self.discretize = discretize
+        self.group_features = group_features or []
+        self.ignore_features = ignore_features or []
+        self.bias_penalty_cutoff = bias_penalty_cutoff
+        self.score_cls = score_cls
 
-        # Remap to 0-1000 (worst to best)
-        self.score = (2 - mean_tv) * 500
+        if discretize:
+            private_dataset = sdnist.utils.discretize(private_dataset, schema, bins)
+        self._private_dataset = private_dataset
+
+        # permutations of columns, same as the permutations of score_cls
+        self.permutations = list(self._new_score(private_dataset).columns())
+        columns = sorted(set(c for p in self.permutations for c in p))
+        self.codec = FeatureCodec([private_dataset], columns)
+        self._p_codes = {c: self.codec.encode_column(private_dataset[c], c).astype(np.int64)
+                         for c in columns}
+
+        # private group of each record
+        if self.group_features:
+            p_groups = private_dataset.groupby(self.group_features)
+            self._p_group_ids = p_groups.ngroup().values
+            self._p_group_index = p_groups.size().index
+        else:
+            self._p_group_ids = np.zeros(len(private_dataset), dtype=np.int64)
+            self._p_group_index = pd.RangeIndex(1)
 
-        return self.score
+        # private marginal densities (groups x cells) of each permutation
+        self._p0_cache = {}
+        for columns in self.permutations:
+            idx = tuple(columns)
+            if idx not in self._p0_cache:
+                self._p0_cache[idx] = self._densities(self._p_group_ids,
+                                                      len(self._p_group_index),
+                                                      [self._p_codes[c] for c in columns],
+                                                      columns)
+
+    def _new_score(self, synthetic_dataset: pd.DataFrame) -> KMarginalScore:
+        return self.score_cls(self._private_dataset,
+                              synthetic_dataset,
+                              self.schema,
+                              seed=self.seed,
+                              bins=self.bins,
+                              discretize=False,
+                              group_features=self.group_features,
+                              ignore_features=self.ignore_features,
+                              bias_penalty_cutoff=self.bias_penalty_cutoff)
+
+    def _densities(self, group_ids: np.ndarray, n_groups: int,
+                   codes: List[np.ndarray], columns: List[str]) -> np.ndarray:
+        # marginal densities in each group, one row per group
+        index = group_ids.astype(np.int64)
+        for c, col in zip(codes, columns):
+            index = index * self.codec.cardinality(col) + c
+        n_cells = int(np.prod([self.codec.cardinality(col) for col in columns]))
+        counts = np.bincount(index, minlength=n_groups * n_cells).reshape(n_groups, n_cells)
+        return counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+
+    def score(self, synthetic_dataset: pd.DataFrame) -> KMarginalScore:
+        """Returns score_cls object with the scores of the synthetic dataset"""
+        if self.discretize:
+            synthetic_dataset = sdnist.utils.discretize(synthetic_dataset, self.schema, self.bins)
+        k_marg = self._new_score(synthetic_dataset)
+
+        # groups of private and synthetic datasets
+        if self.group_features:
+            s_groups = synthetic_dataset.groupby(self.group_features)
+            group_index = self._p_group_index.union(s_groups.size().index)
+            s_group_ids = group_index.get_indexer(s_groups.size().index)[s_groups.ngroup().values]
+            p_rows = group_index.get_indexer(self._p_group_index)
+        else:
+            group_index = self._p_group_index
+            s_group_ids = np.zeros(len(synthetic_dataset), dtype=np.int64)
+            p_rows = np.zeros(1, dtype=np.int64)
+
+        tv = []
+        for columns in self.permutations:
+            s_codes = [self.codec.encode_column(synthetic_dataset[c], c).astype(np.int64)
+                       for c in columns]
+            p1 = self._densities(s_group_ids, len(group_index), s_codes, columns)
+            p1[p_rows] -= self._p0_cache[tuple(columns)]
+            tv.append((columns, pd.Series(np.abs(p1).sum(axis=1), index=group_index)))
+
+        k_marg.set_tv(tv)
+        return k_marg
 
 
 class CensusKMarginalScore(KMarginalScore):
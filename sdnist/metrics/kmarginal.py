@@ -1,21 +1,15 @@
-from typing import List, Optional
+from typing import Iterable, List, Optional, Tuple
+import itertools
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
 from sdnist.report.dataset import Dataset
-from sdnist.report.column_combs.column_combs import ColumnCombs
+from sdnist.report.dataset.codec import FeatureCodec
+from sdnist.report.column_combs.column_combs import ColumnCombs, _joint_counts
 import sdnist.load as load
 import sdnist.utils as utils
 
-def compute_marginal_densities(data, marginals,
-                               col_comb: Optional[ColumnCombs] = None):
-    data = data.copy()
-    if col_comb is not None:
-        data = col_comb.getDataframeByColumns(marginals, version = 'd_')
-    counts = data.groupby(marginals).size()
-    return counts / data.shape[0]
-
-
 class KMarginal:
     """
     [t1, t2, t3, t4] are target densities.   t1 = count / tN
@@ -53,24 +47,68 @@ class KMarginal:
     because the target population size for every PUMA is reasonable)
     """
     NAME = 'K-Marginal'
+    # largest number of (group, cell) counts of a marginal counted in a
+    # dense array, larger marginals are counted over their occupied cells only
+    MAX_DENSE_CELLS = 2 ** 22
+
     def __init__(self,
                  target_data: pd.DataFrame,
                  deidentified_data: pd.DataFrame,
                  group_features: Optional[List[str]] = None,
-                 col_comb: Optional[ColumnCombs] = None):
+                 col_comb: Optional[ColumnCombs] = None,
+                 k: int = 2,
+                 n_marginals: Optional[int] = None,
+                 random_state: Optional[int] = None):
+        """
+        Parameters
+        ----------
+            target_data : pd.DataFrame
+                binned target data
+            deidentified_data : pd.DataFrame
+                binned deidentified data
+            group_features : List[str]
+                features for which a score is computed for each feature value
+            col_comb : ColumnCombs
+                column combination tables from which deidentified marginals are read
+            k : int
+                number of features in each marginal
+            n_marginals : int
+                number of k-marginals randomly sampled from all k-marginals.
+                If None, all k-marginals are evaluated.
+            random_state : int
+                seed of the k-marginals sampling
+        """
         self.td = target_data
         self.deid = deidentified_data
         self.col_comb = col_comb
         self.group_features = group_features or []
         self.features = self.td.columns.tolist()
+        self.k = k
         marg_cols = list(set(self.features).difference(['PUMA', 'INDP']))
         marg_cols = sorted(marg_cols)
-        self.marginals = [(f1, f2)
-                           for i, f1 in enumerate(marg_cols)
-                           for j, f2 in enumerate(marg_cols)
-                           if i < j]
+        self.marginals = list(itertools.combinations(marg_cols, k))
+        if n_marginals is not None and n_marginals < len(self.marginals):
+            rng = np.random.default_rng(random_state)
+            sample = rng.choice(len(self.marginals), size=n_marginals, replace=False)
+            self.marginals = [self.marginals[i] for i in sorted(sample)]
 
-    def marginal_pairs(self):
+        # codes of target data values, deidentified data values not
+        # present in the target data share a single overflow code
+        self.codec = FeatureCodec([self.td])
+        self._t_codes = dict()  # target data codes of each feature
+        # (cells, counts) of deidentified data of each marginal, set by from_stream
+        self.s_counts = None
+        self._deid_rows = None  # distinct rows of the deidentified data
+        self.score = None  # set by compute_score
+        # bootstrap confidence intervals and their alpha, set by compute_ci
+        self.score_ci = None
+        self.scores_ci = None
+        self.ci_alpha = None
+        # number of distinct group feature values (including overflow)
+        self.n_groups = int(np.prod([self.codec.cardinality(f)
+                                     for f in self.group_features]))
+
+    def marginal_sets(self):
         for _ in self.marginals:
             yield list(_)
 
@@ -80,29 +118,123 @@ class KMarginal:
         else:
             return self._compute_score()
 
-    def marginal_densities(self, data: pd.DataFrame, marginal: List[str]):
-        # target data marginal densities
-        t_den = compute_marginal_densities(self.td, marginal)
-        # deidentified data marginal densities
-        s_den = compute_marginal_densities(self.deid, marginal,
-                                           col_comb = self.col_comb)
-        # target and deidentified densities absolute differences
-        abs_den_diff = t_den.subtract(s_den, fill_value=0).abs()
-        return t_den, s_den, abs_den_diff
+    def _target_codes(self, feature: str) -> np.ndarray:
+        if feature not in self._t_codes:
+            self._t_codes[feature] = self.codec.encode_column(self.td[feature], feature)
+        return self._t_codes[feature]
+
+    def _cell_index(self, codes: List[np.ndarray], features: List[str]) -> np.ndarray:
+        # mixed radix index of the joint cell of each record
+        index = np.zeros(len(codes[0]) if len(codes) else 0, dtype=np.int64)
+        for c, f in zip(codes, features):
+            index = index * self.codec.cardinality(f) + c
+        return index
+
+    def _marginal_size(self, features: List[str]) -> int:
+        size = np.prod([self.codec.cardinality(f) for f in features], dtype=np.float64)
+        if size >= np.iinfo(np.int64).max:
+            raise Exception(f'Too many cells in marginal {features} '
+                            f'to be indexed with 64 bit keys')
+        return int(size)
+
+    def _deid_index(self, data: pd.DataFrame, features: List[str]) -> np.ndarray:
+        return self._cell_index(list(self.codec.encode(data, features).T), features)
+
+    def marginal_counts(self, marginal: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns group index, target data count and deidentified data count
+        of the cells of the marginal within each group feature value.
+        Small marginals are counted over all of their cells, large marginals
+        only over the cells occupied in the target or deidentified data.
+        """
+        features = self.group_features + marginal
+        size = self._marginal_size(features)
+
+        t_index = self._cell_index([self._target_codes(f) for f in features], features)
+
+        if self.s_counts is not None:
+            # deidentified counts accumulated by from_stream
+            s_index, s_weights = self.s_counts[tuple(marginal)]
+        elif self.col_comb is not None:
+            # distinct rows of the combination table weighted by their counts
+            s, s_weights = self.col_comb.getCountsByColumns(features)
+            s_index = self._deid_index(s, features)
+        else:
+            s_index, s_weights = self._deid_index(self.deid, features), None
+
+        n_cells = size // self.n_groups
+        if size <= self.MAX_DENSE_CELLS:
+            cells = np.arange(size)
+            t_counts = np.bincount(t_index, minlength=size)
+            s_counts = np.bincount(s_index, weights=s_weights, minlength=size)
+        else:
+            # hash aggregation over the 64 bit keys of the occupied cells
+            codes, cells = pd.factorize(np.concatenate([t_index, s_index]))
+            t_counts = np.bincount(codes[:len(t_index)], minlength=len(cells))
+            s_counts = np.bincount(codes[len(t_index):], weights=s_weights,
+                                   minlength=len(cells))
+        return cells // n_cells, t_counts, s_counts
+
+    @classmethod
+    def from_stream(cls,
+                    target_data: pd.DataFrame,
+                    chunks: Iterable[pd.DataFrame],
+                    group_features: Optional[List[str]] = None,
+                    k: int = 2,
+                    n_marginals: Optional[int] = None,
+                    random_state: Optional[int] = None) -> 'KMarginal':
+        """
+        Creates KMarginal from an iterator over chunks of the binned
+        deidentified data. Only the deidentified count of each cell of each
+        marginal is kept in memory, so the deidentified data can be larger
+        than memory. Scores are the same as the scores of the whole
+        deidentified data.
+        """
+        km = cls(target_data, None, group_features,
+                 k=k, n_marginals=n_marginals, random_state=random_state)
+        counts = dict()
+        for chunk in chunks:
+            for marg in km.marginal_sets():
+                features = km.group_features + marg
+                size = km._marginal_size(features)
+                index = km._deid_index(chunk, features)
+                key = tuple(marg)
+                if size <= km.MAX_DENSE_CELLS:
+                    c_counts = np.bincount(index, minlength=size)
+                    counts[key] = counts[key] + c_counts if key in counts else c_counts
+                else:
+                    # merge occupied cells of this chunk with the previous chunks
+                    weights = np.ones(len(index))
+                    if key in counts:
+                        index = np.concatenate([counts[key][0], index])
+                        weights = np.concatenate([counts[key][1], weights])
+                    cells, inverse = np.unique(index, return_inverse=True)
+                    counts[key] = (cells, np.bincount(inverse.ravel(), weights=weights))
+
+        km.s_counts = dict()
+        for marg in km.marginal_sets():
+            key = tuple(marg)
+            if key not in counts:
+                # no chunks
+                km.s_counts[key] = (np.zeros(0, dtype=np.int64), np.zeros(0))
+            elif isinstance(counts[key], tuple):
+                km.s_counts[key] = counts[key]
+            else:
+                cells = np.flatnonzero(counts[key])
+                km.s_counts[key] = (cells, counts[key][cells])
+        return km
 
     def _compute_score(self):
         # sum total of densities absolute differences over all marginals
         tdds = 0
 
-        # For each 2-marginal find sum of absolute density differences
-        for marg in self.marginal_pairs():
-            # t_den: target data marginal densities
-            # s_den: deidentified data marginal densities
-            # abs_den_diff: target and deidentified densities absolute differences
-            t_den, s_den, abs_den_diff = self.marginal_densities(self.td, marg)
+        # For each k-marginal find sum of absolute density differences
+        for marg in self.marginal_sets():
+            _, t_counts, s_counts = self.marginal_counts(marg)
+            # target and deidentified densities absolute differences
+            abs_den_diff = np.abs(t_counts / t_counts.sum() - s_counts / s_counts.sum())
             # sum of target and deidentified densities absolute differences
-            den_diff_sum = abs_den_diff.sum()
-            tdds += den_diff_sum
+            tdds += abs_den_diff.sum()
 
         # find average of overall score and each group feature score
         mean_tdds = tdds/len(self.marginals)
@@ -110,31 +242,42 @@ class KMarginal:
         self.score = (2 - mean_tdds) * 500
         return self.score
 
+    def _target_groups(self) -> Tuple[pd.Series, np.ndarray]:
+        # record count and group index of each target data group
+        gf = self.group_features
+        group_N = self.td.groupby(gf).size()
+        group_rows = self._cell_index([self.codec.encode_column(group_N.index.get_level_values(f), f)
+                                       for f in gf], gf)
+        return group_N, group_rows
+
     def _compute_score_grouped(self):
         # sum total of densities absolute differences over all marginals
         tdds = 0
-        gf = self.group_features
-        group_N = self.td.groupby(gf).size()
-        group_tdds = group_N * 0
+        group_N, group_rows = self._target_groups()
+        group_tdds = np.zeros(len(group_N))
 
-        # For each 2-marginal find sum of absolute density differences, and
+        # For each k-marginal find sum of absolute density differences, and
         # for group feature find sum of absolute density differences for each
         # feature value
-        for marg in self.marginal_pairs():
-            marg = gf + marg
+        for marg in self.marginal_sets():
+            cell_groups, t_counts, s_counts = self.marginal_counts(marg)
             # t_den: target data marginal densities
             # s_den: deidentified data marginal densities
-            # abs_den_diff: target and deidentified densities absolute differences
-            t_den, s_den, abs_den_diff = self.marginal_densities(self.td, marg)
+            t_den = t_counts / t_counts.sum()
+            s_den = s_counts / s_counts.sum()
+            # target and deidentified densities absolute differences
+            abs_den_diff = np.abs(t_den - s_den)
 
-            # get sum of abs densities differences for group feature
-            group_t_den_sum = t_den.groupby(gf).sum()
+            # get sum of target densities for group feature
+            group_t_den_sum = np.bincount(cell_groups, weights=t_den,
+                                          minlength=self.n_groups)[group_rows]
             # sum density differences in each group
-            group_den_sum = abs_den_diff.groupby(gf).sum()
+            group_den_sum = np.bincount(cell_groups, weights=abs_den_diff,
+                                        minlength=self.n_groups)[group_rows]
             # take minimum of target density difference sum and group density difference sum
-            group_den_sum = group_t_den_sum.where(group_t_den_sum <= group_den_sum).fillna(group_den_sum)
+            group_den_sum = np.minimum(group_t_den_sum, group_den_sum)
             # scale back group feature density different sums
-            group_den_scaled = (group_den_sum * len(self.td)) / group_N
+            group_den_scaled = (group_den_sum * len(self.td)) / group_N.values
             # add this marginal's scaled density differences to other marginals aggregate
             group_tdds = group_tdds + group_den_scaled
 
@@ -147,11 +290,123 @@ class KMarginal:
         mean_group_tdds = group_tdds / len(self.marginals)
 
         # convert to NIST 0 - 1000 score range
-        self.scores = (1 - mean_group_tdds) * 1000
+        self.scores = pd.Series((1 - mean_group_tdds) * 1000, index=group_N.index)
         self.score = (2 - mean_tdds) * 500
 
         return self.score
 
+    def _bootstrap_rows(self, features: List[str]) -> Tuple[str, np.ndarray, np.ndarray]:
+        # key of the deidentified table from which the marginal is read, cell
+        # index of the distinct rows of the table and their record counts
+        if self.col_comb is not None:
+            key, rows, counts = self.col_comb.getJointCountsByColumns(features)
+        else:
+            if self._deid_rows is None:
+                self._deid_rows = _joint_counts(self.deid)
+            key, (rows, counts) = None, self._deid_rows
+        return key, self._deid_index(rows, features), counts
+
+    def compute_ci(self,
+                   n_replicates: int = 200,
+                   alpha: float = 0.05,
+                   random_state: Optional[int] = None,
+                   block_size: int = 50) -> Tuple[float, float]:
+        """
+        Poisson bootstrap confidence intervals of the score and of the
+        score of each group feature value (scores_ci).
+
+        In each replicate every deidentified record is drawn Poisson(1)
+        times, so each distinct row of a deidentified table gets a
+        Poisson(count) weight. The weights of a table are drawn once per
+        replicate and shared by all marginals read from that table, and the
+        replicate counts of a marginal are a weighted bincount of the cell
+        index of the distinct rows, computed once for all replicates.
+
+        The score is a sum of absolute density differences, so resampling
+        the deidentified records adds noise that moves replicate scores
+        below the score. Intervals are bias-corrected: the percentile
+        interval of the replicate scores is shifted by the difference between
+        the mean replicate score and the score, and clipped to [0, 1000].
+
+        Parameters
+        ----------
+            n_replicates : int
+                number of bootstrap replicates
+            alpha : float
+                confidence intervals cover 1 - alpha of the replicate scores
+            random_state : int
+                seed of the Poisson weights
+            block_size : int
+                number of replicates computed together
+        """
+        if self.s_counts is not None:
+            raise Exception('Bootstrap confidence intervals need deidentified '
+                            'records, KMarginal created with from_stream only has counts')
+        rng = np.random.default_rng(random_state)
+        grouped = len(self.group_features) > 0
+        if self.score is None:
+            self.compute_score()
+        if grouped:
+            group_N, group_rows = self._target_groups()
+
+        # t_den: target data densities of the occupied cells of each marginal
+        # s_cells: occupied cell of each distinct deidentified row
+        marginals = []
+        for marg in self.marginal_sets():
+            features = self.group_features + marg
+            n_cells = self._marginal_size(features) // self.n_groups
+            t_index = self._cell_index([self._target_codes(f) for f in features], features)
+            key, s_index, s_counts = self._bootstrap_rows(features)
+            codes, cells = pd.factorize(np.concatenate([t_index, s_index]))
+            t_den = np.bincount(codes[:len(t_index)], minlength=len(cells)) / len(t_index)
+            marginals.append((key, codes[len(t_index):], s_counts, t_den, cells // n_cells))
+
+        tdds = np.zeros(n_replicates)
+        group_tdds = np.zeros((n_replicates, len(group_rows))) if grouped else None
+        for start in range(0, n_replicates, block_size):
+            n = min(block_size, n_replicates - start)
+            weights = dict()  # Poisson weights of each deidentified table
+            for key, s_cells, s_counts, t_den, cell_groups in marginals:
+                if key not in weights:
+                    weights[key] = rng.poisson(s_counts, size=(n, len(s_counts)))
+                n_cells = len(t_den)
+                rep_index = (np.arange(n)[:, None] * n_cells + s_cells[None, :]).ravel()
+                rep_counts = np.bincount(rep_index, weights=weights[key].ravel(),
+                                         minlength=n * n_cells).reshape(n, n_cells)
+                s_den = rep_counts / np.maximum(rep_counts.sum(axis=1, keepdims=True), 1)
+                abs_den_diff = np.abs(t_den[None, :] - s_den)
+                tdds[start: start + n] += abs_den_diff.sum(axis=1)
+
+                if grouped:
+                    group_t_den_sum = np.bincount(cell_groups, weights=t_den,
+                                                  minlength=self.n_groups)[group_rows]
+                    rep_groups = (np.arange(n)[:, None] * self.n_groups
+                                  + cell_groups[None, :]).ravel()
+                    group_den_sum = np.bincount(rep_groups, weights=abs_den_diff.ravel(),
+                                                minlength=n * self.n_groups)
+                    group_den_sum = group_den_sum.reshape(n, self.n_groups)[:, group_rows]
+                    group_den_sum = np.minimum(group_t_den_sum[None, :], group_den_sum)
+                    group_tdds[start: start + n] += \
+                        (group_den_sum * len(self.td)) / group_N.values[None, :]
+
+        q = [alpha / 2, 1 - alpha / 2]
+        rep_score = (2 - tdds / len(self.marginals)) * 500
+        self.score_ci = tuple(_bias_corrected_ci(rep_score, self.score, q))
+        self.ci_alpha = alpha
+        if grouped:
+            rep_scores = (1 - group_tdds / len(self.marginals)) * 1000
+            lower, upper = _bias_corrected_ci(rep_scores, self.scores.values, q)
+            self.scores_ci = pd.DataFrame({'lower': lower, 'upper': upper},
+                                          index=group_N.index)
+        return self.score_ci
+
+
+def _bias_corrected_ci(rep_scores: np.ndarray, score, q: List[float]) -> np.ndarray:
+    # percentile interval of the replicate scores (rows) minus the bootstrap
+    # estimate of the bias of the score
+    bias = rep_scores.mean(axis=0) - score
+    return np.clip(np.quantile(rep_scores, q, axis=0) - bias, 0, 1000)
+
 if __name__ == "__main__":
     THIS_DIR = Path(__file__).parent
     SCH_P = Path(THIS_DIR, '../../diverse_community_excerpts_data/national/na2019.csv')
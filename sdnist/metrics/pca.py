@@ -1,6 +1,6 @@
 import os
 import time
-from typing import Dict
+from typing import Dict, List
 from pathlib import Path
 import pandas as pd
 from scipy.stats import ks_2samp
@@ -100,6 +100,9 @@ class PCAMetric:
         return ks_scores
 
     def plot(self, output_directory: Path) -> Dict[str, any]:
+        # imported here, importing sdnist.report.plots runs sdnist.report,
+        # whose scores import this module
+        from sdnist.report.plots.render import PlotSpec, render
         s = time.time()
         plot_paths = dict()
         o_path = output_directory
@@ -113,10 +116,17 @@ class PCAMetric:
         tar_path = Path(o_path, 'target.png')
         syn_path = Path(o_path, 'deidentified.png')
 
-        plot_all_components_pairs('Target Dataset', self.t_pdf_s, tar_path, t_cp_o_path,
-                                  color='#5373d8')
-        plot_all_components_pairs('Deidentified Dataset', self.s_pdf_s, syn_path, s_cp_o_path,
-                                  color='#4eb07a')
+        # component pair scatter plots first, the grids are made of them
+        render(component_pair_specs(self.t_pdf_s, t_cp_o_path, color='#5373d8') +
+               component_pair_specs(self.s_pdf_s, s_cp_o_path, color='#4eb07a'))
+        plot_specs = [
+            PlotSpec(plot_components_grid, title='Target Dataset',
+                     components=self.t_pdf_s.columns.tolist(),
+                     file_path=tar_path, component_pairs_path=t_cp_o_path),
+            PlotSpec(plot_components_grid, title='Deidentified Dataset',
+                     components=self.s_pdf_s.columns.tolist(),
+                     file_path=syn_path, component_pairs_path=s_cp_o_path)
+        ]
 
         plot_paths[strs.ALL_COMPONENTS_PAIR_PLOT] = [tar_path, syn_path]
         plot_paths[strs.HIGHLIGHTED] = dict()
@@ -147,13 +157,24 @@ class PCAMetric:
             f_tdf = self.t_pdf_s.loc[f_tdf.index]
             f_sdf = self.s_pdf_s.loc[f_sdf.index]
 
-            plot_single_component_pair(f'Target Dataset: PC{hc[0]}-PC{hc[1]}',
-                                       f_tdf, h_tar_path, h_t_cp_o_path, t_cp_o_path, hc)
-            plot_single_component_pair(f'Deidentified Dataset: : PC{hc[0]}-PC{hc[1]}',
-                                       f_sdf, h_syn_path, h_s_cp_o_path, s_cp_o_path, hc)
+            plot_specs.append(
+                PlotSpec(plot_single_component_pair,
+                         title=f'Target Dataset: PC{hc[0]}-PC{hc[1]}',
+                         data=f_tdf, file_path=h_tar_path,
+                         highlight_type_path=h_t_cp_o_path,
+                         components_pairs_path=t_cp_o_path,
+                         components_involved=hc))
+            plot_specs.append(
+                PlotSpec(plot_single_component_pair,
+                         title=f'Deidentified Dataset: : PC{hc[0]}-PC{hc[1]}',
+                         data=f_sdf, file_path=h_syn_path,
+                         highlight_type_path=h_s_cp_o_path,
+                         components_pairs_path=s_cp_o_path,
+                         components_involved=hc))
             plot_paths[strs.HIGHLIGHTED][(h_type, h_name, h_caption)] = \
                 [h_tar_path, h_syn_path]
 
+        render(plot_specs)
         # clear temporary data from report data
         remove_path(t_cp_o_path)
         remove_path(s_cp_o_path)
@@ -169,32 +190,47 @@ def min_max_scaling(series, min_val=None, max_val=None):
 
     return (series - min_val) / (max_val - min_val)
 
-def plot_all_components_pairs(title: str,
-                              data: pd.DataFrame,
-                              file_path: Path,
-                              component_pairs_path: Path,
-                              color='b',):
+def plot_component_pair(x: np.ndarray,
+                        y: np.ndarray,
+                        file_path: Path,
+                        color='b'):
+    fig = plt.figure(figsize=(6, 6))
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.scatter(x, y, s=30, color=color)
+    ax.set_xlim([-0.02, 1.02])
+    ax.set_ylim([-0.02, 1.02])
+    plt.savefig(file_path, pad_inches=0.0, dpi=100)
+    plt.close(fig)
+
 
+def component_pair_specs(data: pd.DataFrame,
+                         component_pairs_path: Path,
+                         color='b') -> List:
+    """Plot specs of the scatter plots of all pairs of distinct components"""
+    # local import, see PCAMetric.plot
+    from sdnist.report.plots.render import PlotSpec
     d = data
-    cc = len(d.columns)
+    return [PlotSpec(plot_component_pair,
+                     x=d[pc_j].values,
+                     y=d[pc_i].values,
+                     file_path=Path(component_pairs_path, f'{pc_j}_{pc_i}.png'),
+                     color=color)
+            for pc_i in d.columns for pc_j in d.columns if pc_i != pc_j]
+
+
+def plot_components_grid(title: str,
+                         components: List[str],
+                         file_path: Path,
+                         component_pairs_path: Path):
+    """Grid of the scatter plots saved in component_pairs_path"""
+    cc = len(components)
     cp_path = component_pairs_path
     f_path = file_path
 
-    for ri, pc_i in enumerate(d.columns):
-        for ci, pc_j in enumerate(d.columns):
-            fig = plt.figure(figsize=(6, 6))
-            ax = fig.add_axes([0, 0, 1, 1])
-            ax.scatter(d[pc_j], d[pc_i], s=30, color=color)
-            ax.set_xlim([-0.02, 1.02])
-            ax.set_ylim([-0.02, 1.02])
-            plt.savefig(Path(cp_path, f'{pc_j}_{pc_i}.png'),
-                        pad_inches=0.0, dpi=100)
-            plt.close(fig)
-
     fig, ax = plt.subplots(cc, cc, figsize=(6, 6))
 
-    for i, pc_i in enumerate(d.columns):
-        for j, pc_j in enumerate(d.columns):
+    for i, pc_i in enumerate(components):
+        for j, pc_j in enumerate(components):
             ax_t = ax[i, j]
             if pc_i == pc_j:
                 ax_t.text(0.5, 0.5, pc_i,
@@ -1,7 +1,7 @@
 from typing import Optional, List
+import numpy as np
 import pandas as pd
 
-from scipy.stats import pearsonr
 from sdnist.report.column_combs.column_combs import ColumnCombs
 
 
@@ -12,7 +12,8 @@ class PearsonCorrelationDifference:
                  features: Optional[List[str]] = None,
                  col_comb: Optional[ColumnCombs] = None,
                  wpf_values: Optional[List] = None,
-                 wpf_feature: Optional[str] = None):
+                 wpf_feature: Optional[str] = None,
+                 group_feature: Optional[str] = None):
         self.features = features if features \
             else target.columns.tolist()
         self.target = target[self.features]
@@ -20,6 +21,8 @@ class PearsonCorrelationDifference:
         self.col_comb = col_comb
         self.wpf_values = wpf_values
         self.wpf_feature = wpf_feature
+        # feature whose per value moments give the moments of all records
+        self.group_feature = group_feature
 
         # pair-wise pearson correlation difference of given features
         self.pp_corr_diff = pd.DataFrame()  # pair-wise pearson correlation difference
@@ -43,17 +46,36 @@ class PearsonCorrelationDifference:
                                col_comb: Optional[ColumnCombs] = None,
                                wpf_values: Optional[List] = None,
                                wpf_feature: Optional[str] = None) -> pd.DataFrame:
-        data = data.copy()
-        corr_list = []
-        for f_a in self.features:
-            f_corr = []
-            for f_b in self.features:
-                if col_comb is not None:
-                    data = col_comb.getDataframeByColumns([f_a, f_b],
-                                                          wpf_values = wpf_values,
-                                                          wpf_feature = wpf_feature,
-                                                          version='t_')
-                corr, _ = pearsonr(data[f_a], data[f_b])
-                f_corr.append(corr)
-            corr_list.append(f_corr)
-        return pd.DataFrame(corr_list, columns=self.features, index=self.features)
+        if col_comb is None:
+            # all pairs from one dataframe
+            X = data[self.features].to_numpy(dtype=np.float64)
+            X = X - X.mean(axis=0)
+            corr = cross_product_correlations(X.T @ X)
+            return pd.DataFrame(corr, columns=self.features, index=self.features)
+
+        # each pair from the moments of its own synthetic table
+        n_f = len(self.features)
+        corr = np.full((n_f, n_f), np.nan)
+        for i, f_a in enumerate(self.features):
+            for j in range(i, n_f):
+                f_b = self.features[j]
+                columns, n, _, cp = col_comb.getMomentsByColumns([f_a, f_b],
+                                                                 wpf_values=wpf_values,
+                                                                 wpf_feature=wpf_feature,
+                                                                 version='t_',
+                                                                 group_feature=self.group_feature)
+                a, b = columns.index(f_a), columns.index(f_b)
+                pair_cp = cp[np.ix_([a, b], [a, b])]
+                corr[i, j] = corr[j, i] = cross_product_correlations(pair_cp)[0, 1]
+        return pd.DataFrame(corr, columns=self.features, index=self.features)
+
+
+def cross_product_correlations(cross_products: np.ndarray) -> np.ndarray:
+    """
+    Pearson correlations of features from the matrix of their centered
+    cross-products. Correlations of constant features are NaN.
+    """
+    std = np.sqrt(np.diag(cross_products))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cross_products / np.outer(std, std)
+    return np.clip(corr, -1, 1)
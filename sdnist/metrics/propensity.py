@@ -1,28 +1,260 @@
 import os
-import math
-from typing import List, Optional
+import json
+import time
+import hashlib
+import tempfile
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from sklearn import tree
+from scipy import stats
 from scipy.stats import ks_2samp
 
 from sdnist.utils import *
 
 
+# maximum depth of propensity trees
+MAX_DEPTH = 6
+# columns of the propensity score table of column combinations
+COMBINATION_SCORE_COLUMNS = ['pmse', 'ks_statistic', 'fit_time']
+# column of the table flagging scores read from the cache, their fit_time is 0
+CACHED_COLUMN = 'cached'
+
+
+# training matrix buffer reused by all propensity fits of this process
+_train_buffer = np.zeros(0, dtype=np.float32)
+
+
+def _training_matrix(target: np.ndarray, synthetic: np.ndarray) -> np.ndarray:
+    # rows of target and synthetic data in the (contiguous, float32) buffer,
+    # so the tree uses it as it is instead of converting a copy
+    global _train_buffer
+    n_rows, n_cols = target.shape[0] + synthetic.shape[0], target.shape[1]
+    if _train_buffer.size < n_rows * n_cols:
+        _train_buffer = np.empty(n_rows * n_cols, dtype=np.float32)
+    N = _train_buffer[:n_rows * n_cols].reshape(n_rows, n_cols)
+    np.concatenate([target, synthetic], out=N, casting='unsafe')
+    return N
+
+
+def propensity_bins(prob: np.ndarray, bins: int = 100) -> np.ndarray:
+    """
+    Returns the propensity bin of each probability. Probabilities are
+    rounded to 2 decimals as np.float64 values are, e.g. 0.475 rounds
+    to 0.48, and a probability of 1 is in the last bin.
+    """
+    # a tree predicts only a few distinct probabilities
+    u_prob, u_inv = np.unique(prob, return_inverse=True)
+    u_bins = np.minimum(np.floor(np.round(u_prob, 2) * bins), bins - 1).astype(np.int64)
+    return u_bins[u_inv.ravel()]
+
+
+def propensity_mse(target: np.ndarray,
+                   synthetic: np.ndarray,
+                   bins: int = 100,
+                   random_state: Optional[int] = None) -> Tuple[float, Any, np.ndarray, float]:
+    """
+    Fits a decision tree classifying target (0) and synthetic (1) records
+    (numeric matrices, e.g. codes of an order preserving FeatureCodec) and returns propensity mean square error, kolmogorov-smirnov test of
+    target and synthetic propensities, (bins x 2) counts of target and
+    synthetic records in each propensity bin and tree fit time in seconds.
+    """
+    # Concatenate target and synthetic dataset rows to
+    # form one single training dataset, with an indicator array to
+    # indicate either a row is sample from target data (marked with 0)
+    # or synthetic data with indicator value of 1.
+    N = _training_matrix(target, synthetic)
+    indicator = np.concatenate([np.zeros(target.shape[0], dtype=np.int64),
+                                np.ones(synthetic.shape[0], dtype=np.int64)])
+
+    clf = tree.DecisionTreeClassifier(max_depth=MAX_DEPTH, random_state=random_state)
+    fit_start = time.perf_counter()
+    clf.fit(N, indicator)
+    fit_time = time.perf_counter() - fit_start
+
+    pprob = clf.predict_proba(N)  # prediction probabilities
+    syn_prob = np.transpose(pprob)[1]  # probability of being a synthetic sample
+
+    prob_bins = propensity_bins(syn_prob, bins)
+    counts = np.stack([np.bincount(prob_bins[indicator == 0], minlength=bins),
+                       np.bincount(prob_bins[indicator == 1], minlength=bins)], axis=1)
+
+    c = synthetic.shape[0] / N.shape[0]
+    pmse_score = np.mean((syn_prob - c) ** 2)
+    ks_score = ks_2samp(syn_prob[:target.shape[0]], syn_prob[target.shape[0]:])
+    return pmse_score, ks_score, counts, fit_time
+
+
+def _combination_score(data: Tuple[np.ndarray, np.ndarray],
+                       bins: int,
+                       random_state: Optional[int]) -> List[float]:
+    pmse_score, ks_score, _, fit_time = propensity_mse(data[0], data[1], bins, random_state)
+    return [pmse_score, ks_score.statistic, fit_time]
+
+
+def propensity_mse_scores(data: Iterable[Tuple[np.ndarray, np.ndarray]],
+                          n_workers: Optional[int] = None,
+                          random_state: Optional[int] = None,
+                          bins: int = 100) -> pd.DataFrame:
+    """
+    Returns propensity mean square error, kolmogorov-smirnov statistic and
+    tree fit time of each (target, synthetic) pair of arrays, one row per
+    pair in the order of data. Pairs are scored in a pool of n_workers
+    processes (all cpus if None), or in this process if n_workers is 1.
+
+    data is consumed lazily: at most two pairs per worker are submitted
+    and not yet scored, so a generator of pairs keeps only those in memory.
+    """
+    score_fn = functools.partial(_combination_score, bins=bins, random_state=random_state)
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if n_workers == 1:
+        scores = [score_fn(d) for d in data]
+    else:
+        scores = []
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            pending = deque()
+            for d in data:
+                pending.append(executor.submit(score_fn, d))
+                if len(pending) >= 2 * n_workers:
+                    scores.append(pending.popleft().result())
+            scores.extend(f.result() for f in pending)
+    return pd.DataFrame(scores, columns=COMBINATION_SCORE_COLUMNS)
+
+
+class PropensityCache:
+    def __init__(self,
+                 path: Optional[Path] = None,
+                 max_entries: int = 10000):
+        """
+        Propensity scores of column combinations keyed by a hash of the
+        target and synthetic data and the tree parameters, so that unchanged
+        combinations are not fit again.
+
+        If path is None the cache only lives for this run. Otherwise it is
+        read from and saved to a json file, keeping the max_entries most
+        recently used scores. The file is replaced atomically, and entries
+        written by other runs since it was read are kept.
+
+        Parameters
+        ----------
+            path : Path
+                path of the json cache file, None for a cache of this run
+            max_entries : int
+                largest number of scores kept in the file
+        """
+        self.path = Path(path) if path is not None else None
+        self.max_entries = max_entries
+        # scores of each key, least recently used first
+        self.scores = self._read()
+
+    def _read(self) -> Dict[str, List[float]]:
+        if self.path is None or not self.path.exists():
+            return dict()
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def get(self, key: str) -> Optional[List[float]]:
+        if key not in self.scores:
+            return None
+        # move to the most recently used end
+        self.scores[key] = self.scores.pop(key)
+        return self.scores[key]
+
+    def put(self, key: str, scores: List[float]):
+        self.scores.pop(key, None)
+        self.scores[key] = scores
+
+    @staticmethod
+    def key(target: pd.DataFrame,
+            synthetic: pd.DataFrame,
+            random_state: Optional[int],
+            bins: int = 100) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps([target.columns.tolist(), MAX_DEPTH, random_state, bins]).encode())
+        for d in [target, synthetic]:
+            h.update(np.int64(d.shape[0]).tobytes())
+            h.update(pd.util.hash_pandas_object(d, index=False).values.tobytes())
+        return h.hexdigest()
+
+    def save(self):
+        if self.path is None:
+            return
+        # entries saved by other runs, then the entries used by this run
+        scores = {k: v for k, v in self._read().items() if k not in self.scores}
+        scores.update(self.scores)
+        self.scores = dict(list(scores.items())[-self.max_entries:])
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.scores, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
 class PropensityMSE:
     NAME = 'Propensity Mean Square Error'
     bins = 100
 
     def __init__(self,
-                 target: pd.DataFrame,
-                 synthetic: pd.DataFrame,
+                 target: Union[pd.DataFrame, np.ndarray],
+                 synthetic: Union[pd.DataFrame, np.ndarray],
                  output_directory: Path,
-                 features: Optional[List[str]] = None):
-        self.features = features if features \
-            else target.columns.tolist()
-        self.target = target[self.features]
-        self.synthetic = synthetic[self.features]
+                 features: Optional[List[str]] = None,
+                 random_state: Optional[int] = None,
+                 sample_size: Optional[int] = None,
+                 n_replicates: int = 5,
+                 strata: Optional[str] = 'PUMA'):
+        """
+        Parameters
+        ----------
+            target : pd.DataFrame or np.ndarray
+                transformed target data, or a matrix of its codes
+            synthetic : pd.DataFrame or np.ndarray
+                transformed synthetic data, or a matrix of its codes
+            output_directory : Path
+                report output directory
+            features : List[str]
+                features used to classify records (columns of code matrices).
+                If None, all target columns.
+            random_state : int
+                seed of the propensity trees and of the subsamples
+            sample_size : int
+                if target or synthetic data has more records, the score is the
+                mean score of n_replicates subsamples of at most sample_size
+                records of each data, with a confidence interval (pmse_ci).
+                pMSE grows as the number of records decreases, so a sampled
+                score is larger than the score of all records and is not
+                comparable to it, see sampled_pmse
+            n_replicates : int
+                number of subsample replicates
+            strata : str
+                feature by which subsamples are stratified, if present
+        """
+        self.random_state = random_state
+        self.sample_size = sample_size
+        self.n_replicates = n_replicates
+        self.strata = strata
+        self.sampled = False  # True if the score is the sampled pmse score
+        self.pmse_ci = None  # confidence interval of sampled pmse score
+        if isinstance(target, pd.DataFrame):
+            self.features = features if features \
+                else target.columns.tolist()
+            target = target[self.features].to_numpy()
+            synthetic = synthetic[self.features].to_numpy()
+        else:
+            self.features = features if features \
+                else list(range(target.shape[1]))
+        self.target = target
+        self.synthetic = synthetic
         self.o_dir = output_directory
         self.o_path = Path(self.o_dir, 'propensity')
         # probability of classifying a sample as belong
@@ -45,65 +277,103 @@ class PropensityMSE:
         t, s = self.target, self.synthetic
 
         # compute for all features
-        score = self.pmse(t, s)
+        if self.sample_size is not None \
+                and max(t.shape[0], s.shape[0]) > self.sample_size:
+            self.sampled = True
+            score = self.sampled_pmse(t, s)
+        else:
+            score = self.pmse(t, s)
         self.score = score
         return self.score
 
-    def pmse(self, t: pd.DataFrame, s: pd.DataFrame):
-        t, s = t.copy(), s.copy()
-        f = t.columns.tolist()
-        # 'i' is an indicator column to indicate either a row
-        # is sample from target data (marked with 0) or synthetic data
-        # with indicator value of 1.
-        t['i'], s['i'] = [0] * t.shape[0], [1] * s.shape[0]
-
-        # Concatenate target and synthetic dataset rows to
-        # form one single training dataset
-        N = pd.concat([t, s]).reset_index(drop=True)
-
-        clf = tree.DecisionTreeClassifier(max_depth=6)
-        clf.fit(N[f].values, N['i'].values)
-
-        pprob = clf.predict_proba(N[f].values)  # prediction probabilities
-        syn_prob = np.transpose(pprob)[1]  # probability of being a synthetic sample
-
-        oc = [[0, 0] for _ in range(self.bins)]
-        sc = [[0, 0] for _ in range(self.bins)]
-
-        for ir, r in N.iterrows():
-            p = round(syn_prob[ir], 2)
-            pi = math.floor(p * self.bins)
-            pi = pi - 1 if pi == self.bins else pi
-            # print(pi)
-            if N.iloc[ir]['i'] == 0:
-                oc[pi][0] += 1
-            else:
-                sc[pi][0] += 1
-        self.prob_dist = pd.DataFrame([[o[0], s[0]]
-                                      for o, s in zip(oc, sc)],
+    def pmse(self, t: np.ndarray, s: np.ndarray):
+        self.pmse_score, self.ks_score, counts, _ = \
+            propensity_mse(t, s, self.bins, self.random_state)
+        self.prob_dist = pd.DataFrame(counts,
                                       columns=['Target samples', 'Deid. samples'],
                                       index=range(self.bins))
+        return self.pmse_score
 
-        N_size = N.shape[0]
-        s_size = s.shape[0]  # size of synthetic data
+    def _subsample(self, data: np.ndarray, seed: int) -> np.ndarray:
+        if data.shape[0] <= self.sample_size:
+            return data
+        rows = pd.Series(np.arange(data.shape[0]))
+        if self.strata in self.features:
+            # keep the share of records of each stratum, sample size of each
+            # stratum is rounded so leave room for one more record per stratum
+            strata = data[:, self.features.index(self.strata)]
+            n_strata = len(np.unique(strata))
+            frac = max(self.sample_size - n_strata, 1) / data.shape[0]
+            rows = rows.groupby(strata).sample(frac=frac, random_state=seed)
+        else:
+            rows = rows.sample(n=self.sample_size, random_state=seed)
+        return data[np.sort(rows.values)]
+
+    def sampled_pmse(self, t: np.ndarray, s: np.ndarray, alpha: float = 0.05):
+        """
+        Mean pmse score of n_replicates subsamples of at most sample_size
+        records of each data, and t-interval of the mean (pmse_ci).
 
-        c = s_size / N_size
+        The interval only covers the variation between subsamples. pMSE of
+        a tree grows as the number of records decreases (the tree overfits
+        the smaller samples more), so the sampled score is biased upward
+        with respect to the score of all records and the interval does not
+        bound that bias. ks_score is the mean kolmogorov-smirnov statistic
+        of the replicates, prob_dist the counts of records of all replicates
+        in each propensity bin.
+        """
+        seeds = np.random.SeedSequence(self.random_state).generate_state(self.n_replicates)
+        pmse_scores = []
+        ks_scores = []
+        counts = np.zeros((self.bins, 2), dtype=np.int64)
+        for seed in seeds:
+            seed = int(seed)
+            pmse_score, ks_score, r_counts, _ = \
+                propensity_mse(self._subsample(t, seed),
+                               self._subsample(s, seed),
+                               self.bins, seed)
+            pmse_scores.append(pmse_score)
+            ks_scores.append(ks_score.statistic)
+            counts += r_counts
 
-        self.pmse_score = 1 / N_size * sum([(_pi - c) ** 2
-                                            for _pi in syn_prob])
-        orig_syn_prob = syn_prob[:t.shape[0]]
-        syn_syn_prob = syn_prob[t.shape[0]:]
-        self.ks_score = ks_2samp(orig_syn_prob, syn_syn_prob)
+        self.pmse_score = np.mean(pmse_scores)
+        self.ks_score = np.mean(ks_scores)
+        # t-interval of the mean of replicate scores
+        half_width = 0
+        if self.n_replicates > 1:
+            half_width = stats.t.ppf(1 - alpha / 2, self.n_replicates - 1) \
+                * np.std(pmse_scores, ddof=1) / np.sqrt(self.n_replicates)
+        self.pmse_ci = (self.pmse_score - half_width, self.pmse_score + half_width)
+        # distribution of the records of all replicates over propensity bins
+        self.prob_dist = pd.DataFrame(counts,
+                                      columns=['Target samples', 'Deid. samples'],
+                                      index=range(self.bins))
         return self.pmse_score
 
-    def save_score(self, avg_score: Optional[float] = None):
+    def save_score(self,
+                   avg_score: Optional[float] = None,
+                   combination_scores: Optional[pd.DataFrame] = None):
         ''' This must be called only on the last propensity score
             computation.
         '''
+        if combination_scores is not None:
+            self.report_data["combination_scores"] = \
+                relative_path(save_data_frame(combination_scores, self.o_path,
+                                              'propensity_combination_scores'))
         if avg_score is not None:
             self.score = avg_score
             self.report_data["pmse_score"] = avg_score
-            self.report_data["full_pmse_score"] = self.pmse_score
+            if not self.sampled:
+                self.report_data["full_pmse_score"] = self.pmse_score
         else:
             self.report_data["pmse_score"] = self.pmse_score
+        if self.sampled:
+            # not comparable to scores of all records, see sampled_pmse
+            self.report_data["sampled_pmse"] = {
+                "pmse": self.pmse_score,
+                "sample_size": self.sample_size,
+                "replicates": self.n_replicates,
+                "pmse_ci": list(self.pmse_ci),
+                "ks_statistic": self.ks_score
+            }
         self.report_data["propensity_distribution"] = relative_path(save_data_frame(self.prob_dist, self.o_path, 'propensity_distribution'))
@@ -0,0 +1,125 @@
+import os
+from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from sdnist.metrics.row_hash import RowHashIndex
+from sdnist.report.dataset.codec import FeatureCodec
+
+TABLE_ATTACK_COLUMNS = ['table', 'inferred_features', 'unique_quasi_identifiers',
+                        'matches', 'percent', 'mean_feature_match_percent']
+
+
+class QueryAttack:
+    def __init__(self,
+                 target: pd.DataFrame,
+                 quasi_features: List[str],
+                 exclude_features: Optional[List[str]] = None):
+        """
+        Query based inference attack: an attacker queries deidentified data for
+        records unique on the quasi identifiers and infers the other features
+        of the target records unique on the same quasi identifiers.
+
+        Target records unique on the quasi identifiers are found once, and
+        records of each deidentified table are matched to them with hashed
+        quasi identifier keys.
+
+        Parameters
+        ----------
+            target : pd.DataFrame
+                target data
+            quasi_features : List[str]
+                quasi identifier features
+            exclude_features : List[str]
+                features that are never inferred
+        """
+        self.quasi_features = quasi_features
+        self.exclude_features = exclude_features if exclude_features else []
+        self.codec = FeatureCodec([target], quasi_features)
+        t_index = RowHashIndex(self.codec.encode(target, quasi_features))
+        t_unique = np.flatnonzero(t_index.unique_rows())
+        self.t_unique_index = RowHashIndex(t_index.codes[t_unique])
+        self.t_unique = target.iloc[t_unique]  # target records unique on quasi identifiers
+        self.overflow = np.array([self.codec.cardinality(f) - 1 for f in quasi_features])
+
+    def inferred_features(self, synthetic: pd.DataFrame) -> List[str]:
+        return [f for f in synthetic.columns
+                if f not in self.quasi_features and f not in self.exclude_features
+                and f in self.t_unique.columns]
+
+    def attack(self,
+               synthetic: pd.DataFrame,
+               features: Optional[List[str]] = None) -> Dict[str, any]:
+        """
+        Returns the number of deidentified records unique on the quasi
+        identifiers that match a unique target record, the number of them
+        whose inferred features all equal the target ones, and the number of
+        equal values of each inferred feature. If features is None, all
+        inferred features of synthetic are used.
+        """
+        if features is None:
+            features = self.inferred_features(synthetic)
+        s_codes = self.codec.encode(synthetic, self.quasi_features)
+        # records with quasi identifier values not in the target data can
+        # not match, and their values differ from those of all other records
+        seen = np.flatnonzero((s_codes < self.overflow).all(axis=1))
+        s_index = RowHashIndex(s_codes[seen])
+        s_unique = np.flatnonzero(s_index.unique_rows())
+        t_pos = RowHashIndex(s_index.codes[s_unique]).lookup(self.t_unique_index)
+        matched = t_pos >= 0
+        s_rows = seen[s_unique[matched]]
+        t_rows = t_pos[matched]
+
+        n_matched = len(s_rows)
+        all_equal = np.ones(n_matched, dtype=bool)
+        feature_matches = dict()
+        for f in features:
+            equal = synthetic[f].to_numpy()[s_rows] == self.t_unique[f].to_numpy()[t_rows]
+            feature_matches[f] = int(equal.sum())
+            all_equal &= equal
+        matches = int(all_equal.sum())
+        return {'unique_quasi_identifiers': n_matched,
+                'matches': matches,
+                'percent': matches / n_matched if n_matched > 0 else 0,
+                'feature_matches': feature_matches}
+
+
+_attack: Optional[QueryAttack] = None
+
+
+def _init_worker(attack: QueryAttack):
+    global _attack
+    _attack = attack
+
+
+def _table_summary(args) -> List:
+    key, synthetic = args
+    res = _attack.attack(synthetic)
+    n = res['unique_quasi_identifiers']
+    f_matches = list(res['feature_matches'].values())
+    mean_f_match = np.mean(f_matches) / n * 100 if n > 0 and len(f_matches) else 0
+    return [key, len(f_matches), n, res['matches'], res['percent'], mean_f_match]
+
+
+def attack_tables(attack: QueryAttack,
+                  tables: Dict[str, pd.DataFrame],
+                  n_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    Runs the attack against each deidentified table in a pool of worker
+    processes, and returns a summary with one row per table. Each worker
+    receives the target side of the attack once.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, len(tables))
+    if n_workers <= 1:
+        _init_worker(attack)
+        rows = [_table_summary(t) for t in tables.items()]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 initializer=_init_worker,
+                                 initargs=(attack,)) as executor:
+            rows = list(executor.map(_table_summary, tables.items()))
+    return pd.DataFrame(rows, columns=TABLE_ATTACK_COLUMNS)
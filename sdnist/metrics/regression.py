@@ -103,6 +103,7 @@ class LinearRegressionMetric:
 
         # regression metric statistics for json report
         self.report_data = None
+        self.plot_spec = None
 
         self._setup()
 
@@ -162,55 +163,36 @@ class LinearRegressionMetric:
             self.s_slope = round(self.s_reg.slope, 2)
             self.s_intercept = round(self.s_reg.intercept, 2)
 
-    def plots(self) -> List[Path]:
+    def plots(self, render_plots: bool = True) -> List[Path]:
         """
         Create plots for target and deidentified data's density distribution and
         overlay regression lines on the density grid.
         Also saves the plots to the regression metric report output directory.
         Saves regression metric statistics to the json report data dictionary.
+        If render_plots is False, the plot is only described by self.plot_spec
+        and the caller renders it.
         """
+        # sdnist.report imports this module from its utility score, a module
+        # level import of its plots would be circular
+        from sdnist.report.plots.render import PlotSpec, render
 
-        # -------- Creates and saves plots for target and deidentified data
-        fig, ax = plt.subplots(1, 2, figsize=(10, 3.3))
-        plt.subplots_adjust(wspace=0.9)
-        ax0 = ax[0]
-        ax1 = ax[1]
-
-        apc0 = ax0.pcolor(self.tcm, cmap='rainbow', vmin=0, vmax=0.5)
-        fig.colorbar(apc0, ax=ax0)
-
-        apc1 = ax1.pcolor(self.diff, cmap='PuOr', vmin=-0.3, vmax=0.3)
-        fig.colorbar(apc1, ax=ax1)
-
-        tx = self.ts[self.xc].values
-
-        r_tx_df = pd.DataFrame([[_ + 0.5, self.t_intercept + self.t_slope * (_ + 0.5)]
-                                for _ in tx], columns=['x', 'y'])
+        tx = self.ts[self.xc].values + 0.5
+        r_tx_df = pd.DataFrame({'x': tx, 'y': self.t_intercept + self.t_slope * tx})
         r_tx_df = r_tx_df[(r_tx_df['y'] >= 0) & (r_tx_df['y'] <= 10)]
-        r_sx_df = pd.DataFrame([[_ + 0.5, self.s_intercept + self.s_slope * (_ + 0.5)]
-                                for _ in tx], columns=['x', 'y'])
+        r_sx_df = pd.DataFrame({'x': tx, 'y': self.s_intercept + self.s_slope * tx})
         r_sx_df = r_sx_df[(r_sx_df['y'] >= 0) & (r_sx_df['y'] <= 10)]
 
-        ax0.plot(r_tx_df['x'],
-                 r_tx_df['y'], color='red', label='Target')
-        ax1.plot(r_tx_df['x'],
-                 r_tx_df['y'], color='red')
-        ax1.plot(r_sx_df['x'],
-                 r_sx_df['y'], color='green', label='Deid.')
-
-        ax0.set_xlabel(self.xc)
-        ax0.set_ylabel(self.yc)
-        ax1.set_xlabel(self.xc)
-
-        ax0.set_title('Target Distribution Density')
-        ax1.set_title('Diff. Between Target and Deid. Density')
-        fig.legend(loc=7, title='Regression')
-        plt.tight_layout()
-        fig.subplots_adjust(right=0.88)
         file_path = Path(self.o_path, 'density_plot.svg')
-        plt.savefig(file_path, bbox_inches='tight', dpi=100)
-        plt.suptitle('Comparison between ')
-        plt.close()
+        self.plot_spec = PlotSpec(plot_density,
+                                  file_path=file_path,
+                                  target_counts=self.tcm,
+                                  counts_difference=self.diff,
+                                  target_line=r_tx_df,
+                                  deidentified_line=r_sx_df,
+                                  x_column=self.xc,
+                                  y_column=self.yc)
+        if render_plots:
+            render([self.plot_spec])
 
         # --------- saves regression metric statistics to json report dictionary
         self.report_data = {
@@ -227,3 +209,45 @@ class LinearRegressionMetric:
         }
 
         return [file_path]
+
+
+def plot_density(file_path: Path,
+                 target_counts: pd.DataFrame,
+                 counts_difference: pd.DataFrame,
+                 target_line: pd.DataFrame,
+                 deidentified_line: pd.DataFrame,
+                 x_column: str,
+                 y_column: str):
+    """
+    Target density grid with its regression line, next to the density
+    difference grid with target and deidentified regression lines
+    """
+    fig, ax = plt.subplots(1, 2, figsize=(10, 3.3))
+    plt.subplots_adjust(wspace=0.9)
+    ax0 = ax[0]
+    ax1 = ax[1]
+
+    apc0 = ax0.pcolor(target_counts, cmap='rainbow', vmin=0, vmax=0.5)
+    fig.colorbar(apc0, ax=ax0)
+
+    apc1 = ax1.pcolor(counts_difference, cmap='PuOr', vmin=-0.3, vmax=0.3)
+    fig.colorbar(apc1, ax=ax1)
+
+    ax0.plot(target_line['x'],
+             target_line['y'], color='red', label='Target')
+    ax1.plot(target_line['x'],
+             target_line['y'], color='red')
+    ax1.plot(deidentified_line['x'],
+             deidentified_line['y'], color='green', label='Deid.')
+
+    ax0.set_xlabel(x_column)
+    ax0.set_ylabel(y_column)
+    ax1.set_xlabel(x_column)
+
+    ax0.set_title('Target Distribution Density')
+    ax1.set_title('Diff. Between Target and Deid. Density')
+    fig.legend(loc=7, title='Regression')
+    plt.tight_layout()
+    fig.subplots_adjust(right=0.88)
+    plt.savefig(file_path, bbox_inches='tight', dpi=100)
+    plt.close()
@@ -0,0 +1,103 @@
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+
+from sdnist.report.dataset.codec import FeatureCodec
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer, uint64 arithmetic wraps around
+    z = x + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def row_hashes(codes: np.ndarray) -> np.ndarray:
+    """64-bit hash of each row of a (records x features) matrix of codes"""
+    h = np.zeros(codes.shape[0], dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for j in range(codes.shape[1]):
+            h = _splitmix64(h ^ codes[:, j].astype(np.uint64))
+    return h
+
+
+def encode_rows(data: List[pd.DataFrame],
+                columns: Optional[List[str]] = None) -> List[np.ndarray]:
+    """
+    Returns the matrices of codes of the columns of each dataset, encoded
+    with the same codec so that equal rows of different datasets have
+    equal codes
+    """
+    if columns is None:
+        columns = data[0].columns.tolist()
+    codec = FeatureCodec(data, columns)
+    return [codec.encode(d, columns) for d in data]
+
+
+class RowHashIndex:
+    def __init__(self, codes: np.ndarray):
+        """
+        Hashes of the encoded rows of a dataset, to find unique rows and rows
+        matching another dataset with sorted arrays of 64-bit keys instead of
+        multi-column groupby and merge. Hash collisions are detected by
+        comparing the codes of rows with equal hashes and resolved exactly.
+
+        Parameters
+        ----------
+            codes : np.ndarray
+                (records x features) matrix of codes, see encode_rows
+        """
+        self.codes = codes
+        self.hashes = row_hashes(codes)
+        self.keys, self.first, self.inverse, self.counts = \
+            np.unique(self.hashes, return_index=True,
+                      return_inverse=True, return_counts=True)
+        self.inverse = self.inverse.ravel()
+
+    def _differs_from_first(self, rows: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        # True for rows whose codes differ from the first row with the same key
+        return (self.codes[rows] != self.codes[self.first[keys]]).any(axis=1)
+
+    def counts_of_rows(self) -> np.ndarray:
+        """Number of records of the dataset equal to each record"""
+        counts = self.counts[self.inverse]
+        shared = np.flatnonzero(counts > 1)
+        collided = np.unique(self.inverse[shared[
+            self._differs_from_first(shared, self.inverse[shared])]])
+        if len(collided):
+            # count rows of colliding keys exactly
+            rows = np.flatnonzero(np.isin(self.inverse, collided))
+            _, r_inverse, r_counts = np.unique(self.codes[rows], axis=0,
+                                               return_inverse=True, return_counts=True)
+            counts[rows] = r_counts[r_inverse.ravel()]
+        return counts
+
+    def unique_rows(self) -> np.ndarray:
+        """Boolean mask of the records that appear once in the dataset"""
+        return self.counts_of_rows() == 1
+
+    def lookup(self, other: 'RowHashIndex') -> np.ndarray:
+        """
+        Position in other of a record equal to each record (the first one
+        with its hash), -1 for records that have no exact match in other
+        """
+        res = np.full(len(self.hashes), -1, dtype=np.int64)
+        if not len(other.keys):
+            return res
+        pos = np.searchsorted(other.keys, self.hashes)
+        pos[pos == len(other.keys)] = 0
+        hit = np.flatnonzero(other.keys[pos] == self.hashes)
+        res[hit] = other.first[pos[hit]]
+        collided = hit[(self.codes[hit] != other.codes[res[hit]]).any(axis=1)]
+        for r in collided:
+            # same hash as a different row, look for an equal row among all
+            # rows of other with that hash
+            o_rows = np.flatnonzero(other.inverse == pos[r])
+            equal = o_rows[(other.codes[o_rows] == self.codes[r]).all(axis=1)]
+            res[r] = equal[0] if len(equal) else -1
+        return res
+
+    def isin(self, other: 'RowHashIndex') -> np.ndarray:
+        """Boolean mask of the records that have an exact match in other"""
+        return self.lookup(other) >= 0
@@ -4,6 +4,7 @@ from pathlib import Path
 from sdnist.load import TestDatasetName
 
 from sdnist.report.dataset import Dataset
+from sdnist.metrics.row_hash import encode_rows, RowHashIndex
 import sdnist.utils as u
 
 
@@ -11,20 +12,22 @@ def unique_exact_matches(target_data: pd.DataFrame, deidentified_data: pd.DataFr
     td, dd = target_data, deidentified_data
     cols = td.columns.tolist()
 
-    # select rows that are unique in the target data
-    u_td = td.loc[td.groupby(by=cols)[cols[0]].transform('count') == 1, :]
+    t_codes, d_codes = encode_rows([td, dd], cols)
+    t_index = RowHashIndex(t_codes)
+
+    # select rows that are unique in the target data, rows with
+    # missing values are never counted as unique
+    t_unique = t_index.unique_rows() & ~td.isna().any(axis=1).to_numpy()
 
     # target unique records
-    t_unique_records = u_td.shape[0]
+    t_unique_records = int(t_unique.sum())
     perc_t_unique_records = round(t_unique_records/td.shape[0] * 100, 2)
 
-    # Keep only one copy of each duplicate row in the deidentified data
-    dd = dd.drop_duplicates(subset=cols)
-
-    merged = u_td.merge(dd, how='inner', on=cols)
+    # unique target rows that have a copy in the deidentified data
+    matched = t_unique & t_index.isin(RowHashIndex(d_codes))
 
     # number of unique target records that exactly match in deidentified data
-    t_rec_matched = merged.shape[0]
+    t_rec_matched = int(matched.sum())
 
     # percent of unique target records that exactly match in deidentified data
     perc_t_rec_matched = t_rec_matched/t_unique_records * 100
@@ -42,7 +42,8 @@ def run(synthetic_filepath: Path,
         log.end_msg()
 
         log.msg('Loading Column Combinations Synthetic Data', level=2)
-        col_comb = ColumnCombs(synthetic_filepath, dataset_name, data_root)
+        col_comb = ColumnCombs(synthetic_filepath, dataset_name, data_root,
+                               precompute_counts=True)
 
         # Create scores
         log.msg('Computing Utility Scores', level=2)
@@ -1,11 +1,13 @@
+import numpy as np
 import pandas as pd
 import os
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from sdnist.report import Dataset
 from sdnist.report.dataset.validate import validate
 from sdnist.report.dataset.binning import *
 from sdnist.report.dataset.transform import transform
+from sdnist.report.dataset.group_index import GroupMoments
 from sdnist.utils import SimpleLogger
 from sdnist.load import TestDatasetName
 
@@ -13,12 +15,19 @@ def _makeColumnsKey(columns):
     columns.sort()
     return '.'.join(columns)
 
+def _joint_counts(data: pd.DataFrame) -> Tuple[pd.DataFrame, np.ndarray]:
+    # distinct rows of the data and number of records of each distinct row
+    counts = data.groupby(data.columns.tolist(), sort=False,
+                          dropna=False, observed=True).size()
+    return counts.index.to_frame(index=False), counts.values
+
 class ColumnCombs:
     def __init__(self,
                  synthetic_filepath: Path,
                  dataset_name: TestDatasetName,
                  data_root: Path,
-                 exact_matches_only: Optional[bool] = False 
+                 exact_matches_only: Optional[bool] = False,
+                 precompute_counts: Optional[bool] = False
                  ):
         """
         Reads in all of the synthetic tables (for each column combination)
@@ -37,6 +46,11 @@ class ColumnCombs:
                 When True, throws an exception if exact match not found.
                 When False, returns table with all combinations if exact match
                     not found.
+            precompute_counts: bool
+                Set to True to count the distinct rows of each binned (d_)
+                synthetic table once at load time. Counts of any subset of
+                the table columns are then projected from these joint counts
+                by getCountsByColumns.
         """
         self.exact_matches_only = exact_matches_only
         self.col_combs_dir = synthetic_filepath.parent
@@ -44,6 +58,10 @@ class ColumnCombs:
         self.missing_combs = []
         csv_files = [f for f in os.listdir(self.col_combs_dir) if f.endswith('.csv')]
         self.comb_dataframes = {}
+        # joint counts of the distinct rows of each d_ synthetic table
+        self.comb_counts = {}
+        # moments of synthetic tables, see getGroupMomentsByColumns
+        self.comb_moments = {}
         max_num_columns = 0
         self.default_col_key = ''
         for csv_file in csv_files:
@@ -64,6 +82,8 @@ class ColumnCombs:
             if comb_dataset.synthetic_data is None:
                 raise Exception(f'Missing synthetic_data for {col_key}')
             self.comb_dataframes[col_key] = comb_dataset
+            if precompute_counts:
+                self.comb_counts[col_key] = _joint_counts(comb_dataset.d_synthetic_data)
 
     def getAllColumnCombinations(self,
                          skip_default: Optional[bool] = True) -> List[List[str]]:
@@ -74,16 +94,18 @@ class ColumnCombs:
             allCombinations.append(list(comb_dataset.synthetic_data.columns))
         return allCombinations
 
-    def getDataframeByColumns(self,
-                              columns: List[str],
-                              wpf_values: Optional[List] = None,
-                              wpf_feature: Optional[str] = None, 
-                              version: Optional[str] = 'initial') -> pd.DataFrame:
+    def getTablesWithColumns(self,
+                             columns: List[str],
+                             version: Optional[str] = 'c_') -> Dict[str, pd.DataFrame]:
         """
-        Returns the synthetic dataframe with the corresponding columns
+        Returns the synthetic dataframes of all tables that contain the
+        columns, keyed by the columns key of the table
         """
-        if wpf_feature is not None:
-            columns += [wpf_feature]
+        return {col_key: self._getVersionData(col_key, version)
+                for col_key, comb_dataset in self.comb_dataframes.items()
+                if set(columns) <= set(comb_dataset.synthetic_data.columns)}
+
+    def _getColumnsKey(self, columns: List[str], version: str) -> str:
         # Remove duplicates (can happen if for instance correlation between
         # the same column is being computed)
         columns = list(set(columns))
@@ -95,24 +117,131 @@ class ColumnCombs:
                 raise Exception(f'Could not find {col_key} in comb_dataframes')
             else:
                 col_key = self.default_col_key
+        return col_key
+
+    def _getVersionData(self, col_key: str, version: str) -> pd.DataFrame:
         if version == 'd_':
-            df_syn = self.comb_dataframes[col_key].d_synthetic_data
+            return self.comb_dataframes[col_key].d_synthetic_data
         elif version == 't_':
-            df_syn = self.comb_dataframes[col_key].t_synthetic_data
+            return self.comb_dataframes[col_key].t_synthetic_data
         elif version == 'initial':
-            df_syn = self.comb_dataframes[col_key].synthetic_data
+            return self.comb_dataframes[col_key].synthetic_data
         elif version == 'c_':
-            df_syn = self.comb_dataframes[col_key].c_synthetic_data
+            return self.comb_dataframes[col_key].c_synthetic_data
         else:
             raise Exception(f'Unexpected col_comb version {version}')
-        # make a copy, cause I'm not 100% sure that the calling code won't modify df_syn
-        df_syn = df_syn.copy()
+
+    def getJointCountsByColumns(self,
+                                columns: List[str]) -> Tuple[str, pd.DataFrame, np.ndarray]:
+        """
+        Returns the key of the binned (d_) synthetic dataframe with the
+        corresponding columns, its distinct rows over all of its columns and
+        the number of records of each distinct row
+        """
+        col_key = self._getColumnsKey(columns, 'd_')
+        if col_key not in self.comb_counts:
+            self.comb_counts[col_key] = \
+                _joint_counts(self.comb_dataframes[col_key].d_synthetic_data)
+        rows, counts = self.comb_counts[col_key]
+        return col_key, rows, counts
+
+    def getCountsByColumns(self,
+                           columns: List[str],
+                           version: Optional[str] = 'd_') -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Returns the distinct rows of the synthetic dataframe with
+        the corresponding columns, projected on the given columns, and the
+        number of records of each distinct row. Only counts of the binned (d_)
+        version are precomputed.
+        """
+        col_key = self._getColumnsKey(columns, version)
+        columns = list(dict.fromkeys(columns))
+        if version != 'd_' or col_key not in self.comb_counts:
+            return _joint_counts(self._getVersionData(col_key, version)[columns])
+        rows, counts = self.comb_counts[col_key]
+        if len(columns) == rows.shape[1]:
+            return rows[columns], counts
+        # project joint counts on the requested columns
+        p_counts = pd.Series(counts).groupby([rows[c] for c in columns], sort=False,
+                                             dropna=False, observed=True).sum()
+        return p_counts.index.to_frame(index=False), p_counts.values
+
+    def _getGroupMoments(self,
+                         col_key: str,
+                         version: str,
+                         group_feature: Optional[str]) -> GroupMoments:
+        # moments of each group_feature value in the table, or of all
+        # records as one group if the table has no group_feature
+        initial = self.comb_dataframes[col_key].synthetic_data
+        if group_feature not in initial.columns:
+            group_feature = None
+        moments_key = (col_key, version, group_feature)
+        if moments_key not in self.comb_moments:
+            df_syn = self._getVersionData(col_key, version)
+            if group_feature is None:
+                groups = pd.Series(0, index=df_syn.index)
+            else:
+                # group feature values of the initial dataframe, as for wpf values
+                groups = initial[group_feature].reindex(df_syn.index)
+            self.comb_moments[moments_key] = GroupMoments(df_syn, groups)
+        return self.comb_moments[moments_key]
+
+    def getGroupMomentsByColumns(self,
+                                 columns: List[str],
+                                 group_feature: str,
+                                 version: Optional[str] = 't_') -> GroupMoments:
+        """
+        Returns the moments of each group_feature value in the numeric
+        synthetic dataframe with the corresponding columns and group_feature,
+        computed once per dataframe and version
+        """
+        col_key = self._getColumnsKey(columns + [group_feature], version)
+        return self._getGroupMoments(col_key, version, group_feature)
+
+    def getMomentsByColumns(self,
+                            columns: List[str],
+                            wpf_values: Optional[List] = None,
+                            wpf_feature: Optional[str] = None,
+                            version: Optional[str] = 't_',
+                            group_feature: Optional[str] = None) \
+            -> Tuple[List[str], int, np.ndarray, np.ndarray]:
+        """
+        Returns the columns, record count, column means and matrix of centered
+        cross-products (sums of products of deviations from the means) of the
+        numeric synthetic dataframe with the corresponding columns, restricted
+        to records whose wpf_feature is one of wpf_values. Records of all
+        wpf values are summarized once, so any set of wpf values is cheap.
+        Moments of all records are summed from the moments of each
+        group_feature value, which later wpf_values requests on the same
+        dataframe reuse.
+        """
+        if wpf_feature is not None:
+            return self.getGroupMomentsByColumns(columns, wpf_feature, version)\
+                .moments(wpf_values)
+        col_key = self._getColumnsKey(columns, version)
+        return self._getGroupMoments(col_key, version, group_feature).moments()
+
+    def getDataframeByColumns(self,
+                              columns: List[str],
+                              wpf_values: Optional[List] = None,
+                              wpf_feature: Optional[str] = None, 
+                              version: Optional[str] = 'initial') -> pd.DataFrame:
+        """
+        Returns the synthetic dataframe with the corresponding columns
+        """
+        if wpf_feature is not None:
+            columns = columns + [wpf_feature]
+        col_key = self._getColumnsKey(columns, version)
+        df_syn = self._getVersionData(col_key, version)
         if wpf_feature:
             # Select subset of rows where column wpf_feature matches wpf_values
             # TODO: here we assume we need the initial dataframe, but cleaner if this
             # knowledge is handed to us from the caller
-            df_syn_initial = self.comb_dataframes[col_key].synthetic_data
-            df_syn = df_syn[df_syn_initial[wpf_feature].isin(wpf_values)]
+            group_index = self.comb_dataframes[col_key].synthetic_group_index[wpf_feature]
+            df_syn = group_index.take(df_syn, wpf_values)
+        else:
+            # make a copy, cause I'm not 100% sure that the calling code won't modify df_syn
+            df_syn = df_syn.copy()
         return df_syn
 
     def saveEncounteredColumns(self):
@@ -15,6 +15,7 @@ from sdnist.load import \
 from sdnist.report.dataset.transform import transform
 from sdnist.report.dataset.validate import validate
 from sdnist.report.dataset.binning import *
+from sdnist.report.dataset.group_index import GroupIndex
 
 import sdnist.strs as strs
 
@@ -230,6 +231,15 @@ class Dataset:
             self._fix_corr_features(self.features,
                                     self.config[strs.CORRELATION_FEATURES])
 
+        # row positions of each group feature value, used to select the
+        # records of a few feature values (e.g. worst performing PUMAs)
+        group_features = [f for f in self.config[strs.K_MARGINAL][strs.GROUP_FEATURES]
+                          if f in self.features]
+        self.target_group_index = {f: GroupIndex(self.target_data[f])
+                                   for f in group_features}
+        self.synthetic_group_index = {f: GroupIndex(self.synthetic_data[f])
+                                      for f in group_features}
+
     def _fix_features(self, drop_features: List[str], group_features: List[str]):
         t_d_f = []
         for f in drop_features:
@@ -0,0 +1,68 @@
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+
+def _vocabulary(values: List[np.ndarray]) -> pd.Index:
+    v = pd.unique(np.concatenate(values))
+    try:
+        v = np.sort(v)
+    except TypeError:
+        # mixed value types (e.g. 'N' and integers) cannot be ordered,
+        # keep the order of appearance instead
+        pass
+    return pd.Index(v)
+
+
+class FeatureCodec:
+    def __init__(self,
+                 data: List[pd.DataFrame],
+                 features: Optional[List[str]] = None):
+        """
+        Encodes feature values into dense integer codes that can be
+        counted with np.bincount.
+
+        Codes of a feature are positions of its values in the sorted union
+        of values found in the input data, so codes are order preserving
+        whenever the values are comparable. Values not seen in the input data
+        are all mapped to one extra overflow code, which is enough for the
+        count based metrics: cells that have zero mass in the data used to fit the
+        codec contribute the same absolute difference whether they are merged or not.
+
+        Parameters
+        ----------
+            data : List[pd.DataFrame]
+                datasets (target, deidentified, ...) from which to read feature values
+            features : List[str]
+                features to encode. If None, all columns of the input datasets are used.
+        """
+        if features is None:
+            features = []
+            for d in data:
+                features.extend([c for c in d.columns if c not in features])
+        self.features = features
+        self.values: Dict[str, pd.Index] = dict()
+        for f in features:
+            f_values = [np.asarray(d[f]) for d in data if f in d.columns]
+            self.values[f] = _vocabulary(f_values)
+
+        max_card = max([self.cardinality(f) for f in features], default=0)
+        self.dtype = np.int16 if max_card <= np.iinfo(np.int16).max else np.int32
+
+    def cardinality(self, feature: str) -> int:
+        """Number of codes of the feature, including the overflow code"""
+        return len(self.values[feature]) + 1
+
+    def encode_column(self, values, feature: str) -> np.ndarray:
+        vocab = self.values[feature]
+        codes = vocab.get_indexer(np.asarray(values))
+        codes[codes < 0] = len(vocab)
+        return codes.astype(self.dtype)
+
+    def encode(self, data: pd.DataFrame, features: List[str]) -> np.ndarray:
+        """Returns (records x features) matrix of codes"""
+        codes = np.empty((data.shape[0], len(features)), dtype=self.dtype)
+        for j, f in enumerate(features):
+            codes[:, j] = self.encode_column(data[f], f)
+        return codes
+
@@ -0,0 +1,97 @@
+from typing import List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+
+class GroupIndex:
+    def __init__(self, values: pd.Series):
+        """
+        Row positions of each distinct value of a feature, stored CSR-style:
+        positions of the rows with the i-th distinct value are
+        positions[offsets[i]: offsets[i + 1]], in increasing order.
+
+        Parameters
+        ----------
+            values : pd.Series
+                feature values of the indexed data
+        """
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        counts = np.bincount(codes, minlength=len(uniques))
+        self.index = values.index
+        self.values = pd.Index(uniques)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        # stable sort keeps the rows of each value in data order
+        self.positions = np.argsort(codes, kind='stable')
+
+    def row_positions(self, values: List) -> np.ndarray:
+        """Sorted positions of the rows having any of the given values"""
+        value_ids = self.values.get_indexer(pd.unique(np.asarray(values, dtype=object)))
+        pos = [self.positions[self.offsets[i]: self.offsets[i + 1]]
+               for i in value_ids if i >= 0]
+        if not len(pos):
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(pos))
+
+    def take(self, data: pd.DataFrame, values: List) -> pd.DataFrame:
+        """
+        Returns the rows of data having any of the given values, in data order.
+        data must have the rows of the indexed data, or a subset of them.
+        """
+        pos = self.row_positions(values)
+        if data.index.equals(self.index):
+            return data.iloc[pos]
+        # data has only some of the indexed rows, select them by label
+        return data[data.index.isin(self.index[pos])]
+
+
+class GroupMoments:
+    def __init__(self, data: pd.DataFrame, groups: pd.Series):
+        """
+        Record count, sums and cross-products of numeric features in each
+        group of records. They add up over groups, so the moments of any set
+        of groups are computed without going back to the records.
+
+        Parameters
+        ----------
+            data : pd.DataFrame
+                numeric data
+            groups : pd.Series
+                group feature value of each record of data
+        """
+        self.columns = data.columns.tolist()
+        X = data.to_numpy(dtype=np.float64)
+        # shift features by their means to keep cross-products small
+        self.shift = X.mean(axis=0) if X.shape[0] else np.zeros(X.shape[1])
+        X = X - self.shift
+        codes, uniques = pd.factorize(np.asarray(groups), use_na_sentinel=False)
+        self.values = pd.Index(uniques)
+        n_groups, n_features = len(uniques), X.shape[1]
+        self.counts = np.bincount(codes, minlength=n_groups)
+        self.sums = np.zeros((n_groups, n_features))
+        self.cross_products = np.zeros((n_groups, n_features, n_features))
+        for i in range(n_features):
+            self.sums[:, i] = np.bincount(codes, weights=X[:, i], minlength=n_groups)
+            for j in range(i, n_features):
+                self.cross_products[:, i, j] = \
+                    np.bincount(codes, weights=X[:, i] * X[:, j], minlength=n_groups)
+                self.cross_products[:, j, i] = self.cross_products[:, i, j]
+
+    def moments(self, values: Optional[List] = None) \
+            -> Tuple[List[str], int, np.ndarray, np.ndarray]:
+        """
+        Returns columns, record count, column means and matrix of centered
+        cross-products of the records in the groups of the given values
+        (all records if None)
+        """
+        if values is None:
+            selected = np.arange(len(self.values))
+        else:
+            selected = self.values.get_indexer(pd.unique(np.asarray(values, dtype=object)))
+            selected = selected[selected >= 0]
+        n = int(self.counts[selected].sum())
+        sums = self.sums[selected].sum(axis=0)
+        cross_products = self.cross_products[selected].sum(axis=0)
+        if n == 0:
+            return self.columns, 0, self.shift, cross_products
+        cross_products = cross_products - np.outer(sums, sums) / n
+        return self.columns, n, self.shift + sums / n, cross_products
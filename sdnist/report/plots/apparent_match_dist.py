@@ -7,6 +7,7 @@ import matplotlib.pyplot as plt
 import pandas as pd
 
 from sdnist.metrics.apparent_match_dist import cellchange
+from sdnist.metrics.query_attack import QueryAttack, attack_tables
 from sdnist.utils import *
 from sdnist.report.column_combs.column_combs import ColumnCombs
 
@@ -47,6 +48,7 @@ class ApparentMatchDistributionPlot:
                  quasi_features: List[str],
                  exclude_features: List[str],
                  col_comb: Optional[ColumnCombs] = None,
+                 n_workers: Optional[int] = None,
                  ):
         """
         Computes and plots apparent records match distribution between
@@ -64,6 +66,11 @@ class ApparentMatchDistributionPlot:
                 Subset of features for which to find apparent record matches
             exclude_features:
                 features to exclude from matching between dataset
+            col_comb: ColumnCombs
+                deidentified data tables of combinations of features
+            n_workers: int
+                number of processes attacking the tables of col_comb,
+                all cpus if None
         """
         self.syn = synthetic
         self.tar = target
@@ -74,6 +81,8 @@ class ApparentMatchDistributionPlot:
         self.quasi_matched_df = pd.DataFrame()
         self.report_data = dict()
         self.col_comb = col_comb
+        self.n_workers = n_workers
+        self.table_matches = pd.DataFrame()
         self._setup()
 
     def _setup(self):
@@ -104,24 +113,27 @@ class ApparentMatchDistributionPlot:
         '''
         self.report_data['query_unique_matches'] = {}
         self.report_data['quasi_identifiers'] = self.quasi_features
+        # target records unique on the quasi identifiers are the same for
+        # every query, find them once
+        attack = QueryAttack(self.tar, self.quasi_features, self.exclude_features)
         non_qi_features = list(set(self.quasi_features) ^ set(self.tar.columns))
         for non_qi_feature in non_qi_features:
             if non_qi_feature in self.exclude_features:
                 continue
             all_features = self.quasi_features + [non_qi_feature]
             df_syn = self.col_comb.getDataframeByColumns(all_features, version = 'c_')
-            percents, u1, u2, mu = cellchange(df_syn[all_features],
-                                              self.tar[all_features],
-                                              self.quasi_features,
-                                              self.exclude_features)
-            unique_matches = len(percents[percents == 100.0])
-            if len(percents) > 0:
-                percent = unique_matches / len(percents)
-            else:
-                percent = 0
+            res = attack.attack(df_syn, [non_qi_feature])
             self.report_data['query_unique_matches'][non_qi_feature] = \
-                {'matches': unique_matches,
-                 'unique_quasi_identifiers':len(percents),
-                 'percent': percent,
+                {'matches': res['matches'],
+                 'unique_quasi_identifiers': res['unique_quasi_identifiers'],
+                 'percent': res['percent'],
                 }
+
+        # the same attack inferring all features of every table that
+        # contains the quasi identifiers and some feature to infer
+        tables = self.col_comb.getTablesWithColumns(self.quasi_features, version='c_')
+        tables = {k: t for k, t in tables.items() if attack.inferred_features(t)}
+        self.table_matches = attack_tables(attack, tables, self.n_workers)
+        self.report_data['table_query_matches'] = \
+            relative_path(save_data_frame(self.table_matches, self.o_path, 'table_query_matches'))
         return [save_file_path]
@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import List, Tuple
 from pathlib import Path
 
 import matplotlib.pyplot
@@ -10,6 +10,7 @@ import pandas as pd
 
 from sdnist.utils import *
 from sdnist.report.column_combs.column_combs import ColumnCombs
+from sdnist.report.plots.render import heatmap_chart
 
 plt.style.use('seaborn-v0_8-deep')
 
@@ -20,7 +21,8 @@ class CorrelationDifferencePlot:
                  target: pd.DataFrame,
                  output_directory: Path,
                  features: List[str],
-                 col_comb: Optional[ColumnCombs]=None):
+                 col_comb: Optional[ColumnCombs]=None,
+                 chart_data: bool = False):
         """
         Computes and plots features correlation difference between
         synthetic and target data
@@ -35,6 +37,9 @@ class CorrelationDifferencePlot:
                 path of the directory to which plots will will be saved
             features: List[str]
                 List of names of features for which to compute correlation
+            chart_data: bool
+                if True, no plot image is saved and self.chart holds
+                the data of the chart instead
         """
         self.syn = synthetic
         self.tar = target
@@ -42,6 +47,8 @@ class CorrelationDifferencePlot:
         self.o_dir = output_directory
         self.o_path = Path(self.o_dir, 'correlation_difference')
         self.features = features
+        self.chart_data = chart_data
+        self.chart = None
         self.report_data = dict()
 
         self._setup()
@@ -55,29 +62,76 @@ class CorrelationDifferencePlot:
     def save(self) -> List[Path]:
         corr_df = correlation_difference(self.syn, self.tar, self.features,
                                          col_comb=self.col_comb)
-        plot_paths = save_correlation_difference_plot(corr_df, self.o_path)
         self.report_data = {"correlation_difference": relative_path(save_data_frame(corr_df,
                                                                       self.o_path,
-                                                                      'correlation_difference')),
-                            "plot": relative_path(plot_paths[0])}
+                                                                      'correlation_difference'))}
+        if self.chart_data:
+            self.chart = heatmap_chart('Correlation Diff. Between Target and Deid. Data',
+                                       corr_df.abs(), 0.15)
+            return []
+        plot_paths = save_correlation_difference_plot(corr_df, self.o_path)
+        self.report_data["plot"] = relative_path(plot_paths[0])
         return plot_paths
 
 
+def _contingency_table(a: np.ndarray, b: np.ndarray,
+                       weights: Optional[np.ndarray] = None) -> np.ndarray:
+    # joint counts of the distinct (sorted) values of a and b, records
+    # with missing values are ignored
+    valid = ~(pd.isna(a) | pd.isna(b))
+    if weights is not None:
+        weights = weights[valid]
+    a_values, a_ranks = np.unique(a[valid], return_inverse=True)
+    b_values, b_ranks = np.unique(b[valid], return_inverse=True)
+    index = a_ranks.ravel() * len(b_values) + b_ranks.ravel()
+    table = np.bincount(index, weights=weights, minlength=len(a_values) * len(b_values))
+    return table.astype(np.int64).reshape(len(a_values), len(b_values))
+
+
+def _kendall_tau_b(table: np.ndarray) -> Tuple[float, float]:
+    """
+    Kendall tau-b of features a and b from their contingency table, with the
+    same arithmetic as scipy.stats.kendalltau(a, b) and kendalltau(b, a)
+    """
+    n = int(table.sum())
+    # pairs of records with a greater value of a and a smaller value of b
+    a_greater = np.cumsum(table[::-1], axis=0)[::-1]
+    a_greater = np.concatenate([a_greater[1:], np.zeros((1, table.shape[1]), dtype=np.int64)])
+    b_smaller = np.cumsum(a_greater, axis=1) - a_greater
+    dis = int((table * b_smaller).sum())  # discordant pairs
+
+    def ties(counts: np.ndarray) -> int:
+        return int((counts * (counts - 1) // 2).sum())
+
+    ntie = ties(table)  # joint ties
+    a_tie = ties(table.sum(axis=1))
+    b_tie = ties(table.sum(axis=0))
+    tot = (n * (n - 1)) // 2
+    if a_tie == tot or b_tie == tot:
+        return np.nan, np.nan
+    con_minus_dis = tot - a_tie - b_tie + ntie - 2 * dis
+    tau_ab = con_minus_dis / np.sqrt(tot - a_tie) / np.sqrt(tot - b_tie)
+    tau_ba = con_minus_dis / np.sqrt(tot - b_tie) / np.sqrt(tot - a_tie)
+    # Limit range to fix computational errors
+    return np.minimum(1., max(-1., tau_ab)), np.minimum(1., max(-1., tau_ba))
+
+
 def correlations(data: pd.DataFrame, features: List[str],
                  col_comb: Optional[ColumnCombs] = None):
-    corr_list = []
-
-    data = data.copy()
-    for f_a in features:
-        f_a_corr = []
-        for f_b in features:
+    # kendall tau-b correlations computed from the contingency table of
+    # each pair of features, once for both (f_a, f_b) and (f_b, f_a)
+    corr = np.full((len(features), len(features)), np.nan)
+    for i, f_a in enumerate(features):
+        for j in range(i, len(features)):
+            f_b = features[j]
             if col_comb is not None:
-                data = col_comb.getDataframeByColumns([f_a, f_b], version='t_')
-            c_val = data[f_a].corr(data[f_b], method='kendall')
-            f_a_corr.append(c_val)
-        corr_list.append(f_a_corr)
+                rows, counts = col_comb.getCountsByColumns([f_a, f_b], version='t_')
+                table = _contingency_table(rows[f_a].values, rows[f_b].values, counts)
+            else:
+                table = _contingency_table(data[f_a].values, data[f_b].values)
+            corr[i, j], corr[j, i] = _kendall_tau_b(table)
 
-    return pd.DataFrame(corr_list, columns=features, index=features)
+    return pd.DataFrame(corr, columns=features, index=features)
 
 
 def correlation_difference(synthetic: pd.DataFrame,
@@ -5,14 +5,19 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 from sdnist.utils import *
+from sdnist.report.plots.render import heatmap_chart
 
 
 class PearsonCorrelationPlot:
     def __init__(self,
                  correlation_differences: pd.DataFrame,
-                 output_directory: Path):
+                 output_directory: Path,
+                 chart_data: bool = False):
         self.cd = correlation_differences
         self.o_dir = output_directory
+        # if True, no plot image is saved and self.chart holds the chart data
+        self.chart_data = chart_data
+        self.chart = None
         self.o_path = Path(self.o_dir, 'pearson_correlation')
 
         self.report_data = dict()
@@ -32,8 +37,12 @@ class PearsonCorrelationPlot:
                                                                     self.o_path,
                                                                     'correlation_difference'),
                                                      level=path_level),
-            "plot": relative_path(file_path, level=path_level)
         }
+        title = 'Pearson Correlation Diff. Between Target and Deid. Data'
+        if self.chart_data:
+            self.chart = heatmap_chart(title, self.cd.abs(), 0.15)
+            return []
+        self.report_data["plot"] = relative_path(file_path, level=path_level)
         cd = self.cd
         cd = cd.abs()
         fig = plt.figure(figsize=(6, 6), dpi=100)
@@ -44,7 +53,7 @@ class PearsonCorrelationPlot:
         plt.xticks(range(cd.shape[1]), cd.columns)
         plt.xticks(rotation=90)
         plt.yticks(range(cd.shape[0]), cd.index)
-        plt.title('Pearson Correlation Diff. Between Target and Deid. Data')
+        plt.title(title)
         fig.tight_layout()
         plt.savefig(file_path, bbox_inches='tight')
         plt.close()
@@ -0,0 +1,80 @@
+import os
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+
+class PlotSpec:
+    def __init__(self, plot: Callable[..., Any], **kwargs):
+        """
+        Data of a figure and the function drawing it, rendered later by render
+        together with the other figures of the report.
+
+        Parameters
+        ----------
+            plot : Callable
+                module level function that draws the figure from kwargs
+                and saves it to a file
+            kwargs :
+                data and options of the figure, passed to plot
+        """
+        self.plot = plot
+        self.kwargs = kwargs
+
+    def __call__(self):
+        return self.plot(**self.kwargs)
+
+
+def _init_worker():
+    matplotlib.use('Agg')
+
+
+def _render_spec(spec: PlotSpec):
+    return spec()
+
+
+def render(specs: List[PlotSpec], n_workers: Optional[int] = None) -> List[Any]:
+    """
+    Renders the figures of specs in a pool of worker processes using the
+    Agg backend, and returns the results of their plot functions in order.
+    If n_workers is None, all cpus are used.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, len(specs))
+    if n_workers <= 1:
+        return [_render_spec(s) for s in specs]
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as executor:
+        return list(executor.map(_render_spec, specs))
+
+
+def _json_values(values) -> List:
+    # NaN is not valid JSON, charts show it as missing
+    return [None if pd.isna(v) else v for v in np.asarray(values).tolist()]
+
+
+def counts_chart(title: str,
+                 labels: List[str],
+                 target_counts: np.ndarray,
+                 deidentified_counts: np.ndarray) -> Dict[str, Any]:
+    """Chart data of target and deidentified record counts of feature values"""
+    return {"kind": "bars",
+            "title": title,
+            "labels": [str(v) for v in labels],
+            "target": _json_values(target_counts),
+            "deidentified": _json_values(deidentified_counts)}
+
+
+def heatmap_chart(title: str,
+                  data: pd.DataFrame,
+                  v_max: float) -> Dict[str, Any]:
+    """Chart data of a matrix of values in [0, v_max]"""
+    return {"kind": "heatmap",
+            "title": title,
+            "columns": [str(c) for c in data.columns],
+            "index": [str(i) for i in data.index],
+            "values": [_json_values(row) for row in data.values],
+            "vmax": v_max}
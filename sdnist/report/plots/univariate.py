@@ -1,5 +1,5 @@
 import os
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
 import matplotlib.pyplot as plt
@@ -9,6 +9,7 @@ from scipy.stats import entropy
 
 from sdnist.report import Dataset
 from sdnist.report.column_combs.column_combs import ColumnCombs
+from sdnist.report.plots.render import PlotSpec, render, counts_chart
 from sdnist.strs import *
 from sdnist.utils import *
 
@@ -34,6 +35,126 @@ def l1(pk: List[int], qk: List[int]):
     return div
 
 
+def plot_counts(file_path: Path,
+                title: str,
+                labels: List[str],
+                target_counts: np.ndarray,
+                deidentified_counts: np.ndarray,
+                tick_fontsize: int = 8,
+                tick_rotation: int = 45):
+    bar_width = 0.4
+    x_axis = np.arange(len(labels))
+    plt.figure(figsize=(8, 3), dpi=100)
+    plt.bar(x_axis - 0.2, target_counts, width=bar_width, label='Target')
+    plt.bar(x_axis + 0.2, deidentified_counts, width=bar_width, label='Deidentified')
+    plt.xlabel('Feature Values')
+    plt.ylabel('Record Counts')
+    plt.gca().set_xticks(x_axis, labels)
+    plt.legend(loc='upper right')
+    plt.xticks(fontsize=tick_fontsize, rotation=tick_rotation)
+    plt.tight_layout()
+    plt.title(title, fontdict={'fontsize': 12})
+    plt.savefig(file_path, bbox_inches='tight')
+    plt.close()
+
+
+def _count_column(counts: np.ndarray) -> np.ndarray:
+    # counts of values missing from one dataset are filled with 0 and
+    # the column becomes float, as after a left merge
+    return counts.astype(float) if (counts == 0).any() else counts
+
+
+class UnivariateCounts:
+    def __init__(self,
+                 target: pd.DataFrame,
+                 features: List[str],
+                 col_comb: ColumnCombs,
+                 wpf_values: Optional[List] = None,
+                 wpf_feature: Optional[str] = None):
+        """
+        Record counts of each value of the features in target and synthetic
+        (binned) data, computed once and shared by the divergence and the
+        distribution plots.
+
+        Parameters
+        ----------
+            target : pd.Dataframe
+                binned target dataset
+            features : List[str]
+                features to count values of
+            col_comb : ColumnCombs
+                source of the synthetic data
+            wpf_values : List
+                if given, count only synthetic records whose wpf_feature
+                is one of wpf_values
+            wpf_feature : str
+                feature of the wpf_values
+        """
+        self.values: Dict[str, List] = dict()
+        self.target_counts: Dict[str, np.ndarray] = dict()
+        self.synthetic_counts: Dict[str, np.ndarray] = dict()
+        for f in features:
+            if wpf_feature is None:
+                rows, s_weights = col_comb.getCountsByColumns([f], version='d_')
+                s_values = rows[f].to_numpy()
+            else:
+                s_values = col_comb.getDataframeByColumns(columns=[f],
+                                                          wpf_values=wpf_values,
+                                                          wpf_feature=wpf_feature,
+                                                          version='d_')[f].to_numpy()
+                s_weights = None
+            t_values = target[f].to_numpy()
+            values = sorted(set(pd.unique(t_values).tolist())
+                            .union(pd.unique(s_values).tolist()))
+            vocab = pd.Index(values)
+            self.values[f] = values
+            self.target_counts[f] = np.bincount(vocab.get_indexer(t_values),
+                                                minlength=len(values))
+            self.synthetic_counts[f] = np.bincount(vocab.get_indexer(s_values),
+                                                   weights=s_weights,
+                                                   minlength=len(values)).astype(np.int64)
+
+    def divergence(self, feature: str) -> float:
+        return l1(pk=self.synthetic_counts[feature].tolist(),
+                  qk=self.target_counts[feature].tolist())
+
+    def counts(self, feature: str) -> pd.DataFrame:
+        """Returns dataframe of feature values with their target and synthetic counts"""
+        return pd.DataFrame({feature: self.values[feature],
+                             'count_target': _count_column(self.target_counts[feature]),
+                             'count_deidentified':
+                                 _count_column(self.synthetic_counts[feature])})
+
+
+def sector_counts(target: pd.DataFrame,
+                  synthetic: pd.DataFrame,
+                  feature: str,
+                  sector_feature: str) -> List[Tuple[str, pd.DataFrame]]:
+    """
+    Returns, for each sector (value of sector_feature except 'N') of the
+    target data, the target and synthetic counts of the feature values found
+    in the target records of the sector. Counts come from one joint
+    [sector_feature, feature] count of each dataset.
+    """
+    target = target.loc[target[sector_feature] != 'N', [sector_feature, feature]]
+    t_values = pd.to_numeric(target[feature]).astype(int).astype(str)
+    t_counts = target.groupby([target[sector_feature], t_values], sort=False).size()
+    s_counts = synthetic.groupby([synthetic[sector_feature],
+                                  synthetic[feature].astype(str)], sort=False).size()
+    s_counts = dict(zip(s_counts.index, s_counts.values))
+
+    res = []
+    for sector, sector_counts in t_counts.groupby(level=0, sort=False):
+        values = sector_counts.index.get_level_values(1).tolist()
+        s_sector = int(sector)
+        syn_counts = np.array([s_counts.get((s_sector, v), 0) for v in values],
+                              dtype=np.int64)
+        res.append((sector, pd.DataFrame({feature: values,
+                                          'count_target': sector_counts.values,
+                                          'count_deidentified': _count_column(syn_counts)})))
+    return res
+
+
 class UnivariatePlots:
     def __init__(self,
                  synthetic: pd.DataFrame,
@@ -44,7 +165,8 @@ class UnivariatePlots:
                  worst_univariates_to_display: Optional[int] = None,
                  col_comb: Optional[ColumnCombs] = None,
                  wpf_values: Optional[List] = None,
-                 wpf_feature: Optional[str] = None):
+                 wpf_feature: Optional[str] = None,
+                 chart_data: bool = False):
         """
         Computes and creates univariate distribution plots of the worst
         performing variables in synthetic data
@@ -63,12 +185,16 @@ class UnivariatePlots:
                 For which challenge type to compute univariates for, CENSUS or TAXI
             n : pd.Dataframe
                 n worst performing univariates to save plots for
+            chart_data: bool
+                if True, no plot images are saved and the displayed features
+                carry the data of their charts instead
         """
         self.syn = synthetic
         self.tar = target
         self.col_comb = col_comb
         self.wpf_values = wpf_values
         self.wpf_feature = wpf_feature
+        self.chart_data = chart_data
 
         self.schema = dataset.schema
         self.dataset = dataset
@@ -81,6 +207,7 @@ class UnivariatePlots:
 
         self.div_data = None  # feature divergence data
         self.uni_counts = dict()  # univariate counts of target and synthetic data
+        self.counts: Optional[UnivariateCounts] = None
 
     def _setup(self):
         if not self.o_dir.exists():
@@ -102,6 +229,11 @@ class UnivariatePlots:
         else:
             raise Exception(f'Invalid Challenge Name: {self.challenge}. '
                             f'Unable to save univariate plots')
+        features = [f for f in self.schema
+                    if f in self.tar.columns and f in self.syn.columns
+                    and f not in ignore_features]
+        self.counts = UnivariateCounts(self.tar, features, self.col_comb,
+                                       self.wpf_values, self.wpf_feature)
         # divergence dataframe
         div_df = divergence(self.syn,
                             self.tar,
@@ -109,7 +241,8 @@ class UnivariatePlots:
                             ignore_features,
                             col_comb = self.col_comb,
                             wpf_values = self.wpf_values,
-                            wpf_feature = self.wpf_feature)
+                            wpf_feature = self.wpf_feature,
+                            counts = self.counts)
         self.div_data = div_df
         # select 3 features with worst divergence
         # div_df = div_df.head(3)
@@ -122,6 +255,7 @@ class UnivariatePlots:
                                     col_comb = self.col_comb,
                                     wpf_values = self.wpf_values,
                                     wpf_feature = self.wpf_feature,
+                                    counts = self.counts,
                                     level=level)
         return self.feat_data
 
@@ -134,13 +268,14 @@ class UnivariatePlots:
                                col_comb: Optional[ColumnCombs] = None,
                                wpf_values: Optional[List] = None,
                                wpf_feature: Optional[str] = None,
+                               counts: Optional[UnivariateCounts] = None,
                                level=2):
         # Need to make a copy because may overwrite this with synthetic version
         synthetic = synthetic.copy()
         ds = dataset
         o_path = output_directory
-        bar_width = 0.4
         saved_file_paths = []
+        plot_specs = []
         INDP = 'INDP'
         INDP_CAT = "INDP_CAT"
         # PF: TODO not sure if this synthetic.index thing will hurt me
@@ -151,37 +286,12 @@ class UnivariatePlots:
         for i, f in enumerate(features):
             self.uni_counts[f] = dict()
             if f == INDP and INDP_CAT in target.columns.tolist():
-                all_sectors = o_tar[INDP_CAT].unique().tolist()
-                # We don't need to copy c_synthetic_data because o_syn is only a reference to it
                 o_syn = col_comb.getDataframeByColumns([f, INDP_CAT],version='c_')
                 o_syn = o_syn.loc[synthetic.index]
-                set(all_sectors).update(set(o_syn[INDP_CAT].unique().tolist()))
                 selected = []
-                # print(all_sectors)
-                for s in all_sectors:
-                    if s == 'N':
-                        continue
-                    st_df = o_tar[o_tar[INDP_CAT].isin([s])].copy()
-                    st_df.loc[:, f] = pd.to_numeric(st_df[f]).astype(int)
-                    ss_df = o_syn[o_syn[INDP_CAT].isin([int(s)])]
-
-                    unique_ind_codes = st_df[f].unique().tolist()
-                    set(unique_ind_codes).update(set(ss_df[f].unique().tolist()))
-                    unique_ind_codes = list(unique_ind_codes)
-                    val_df = pd.DataFrame(unique_ind_codes, columns=[f])
-                    val_df[f] = val_df.astype(str)
-
-                    t_counts_df = st_df.groupby(by=f)[f].size().reset_index(name='count_target')
-                    s_counts_df = ss_df.groupby(by=f)[f].size().reset_index(name='count_deidentified')
-                    t_counts_df[f] = t_counts_df[f].astype(str)
-                    s_counts_df[f] = s_counts_df[f].astype(str)
-
-                    merged = pd.merge(left=val_df, right=t_counts_df, on=f, how='left')\
-                        .fillna(0)
-                    merged = pd.merge(left=merged, right=s_counts_df, on=f, how='left')\
-                        .fillna(0)
-                    div = l1(pk=merged['count_target'], qk=merged['count_deidentified'])
-
+                for s, merged in sector_counts(o_tar, o_syn, f, INDP_CAT):
+                    div = l1(pk=merged['count_target'].tolist(),
+                             qk=merged['count_deidentified'].tolist())
                     selected.append([merged, div, s])
                 selected = sorted(selected, key=lambda l: l[1], reverse=True)
 
@@ -190,58 +300,43 @@ class UnivariatePlots:
                     div = data[1]
                     s = data[2]
                     merged = merged.sort_values(by=f)
-                    x_axis = np.arange(merged.shape[0])
-                    plt.figure(figsize=(8, 3), dpi=100)
-                    plt.bar(x_axis - 0.2, merged['count_target'], width=bar_width, label='Target')
-                    plt.bar(x_axis + 0.2, merged['count_deidentified'], width=bar_width, label='Deidentified')
-                    plt.xlabel('Feature Values')
-                    plt.ylabel('Record Counts')
-                    plt.gca().set_xticks(x_axis, merged[f].values.tolist())
-                    plt.legend(loc='upper right')
-                    if merged.shape[0] > 30:
-                        plt.xticks(fontsize=6, rotation=90)
-                    else:
-                        plt.xticks(fontsize=8, rotation=45)
-                    plt.tight_layout()
                     title = f'Industries in Industry Category ' \
                             f'{dataset.data_dict["INDP_CAT"]["values"][str(s)]}'
-                    plt.title(title,
-                              fontdict={'fontsize': 12})
-
                     file_path = Path(o_path, f'indp_indp_cat_{s}.jpg')
-                    plt.savefig(file_path, bbox_inches='tight')
-
-                    plt.close()
+                    if merged.shape[0] > 30:
+                        tick_font, tick_rotation = 6, 90
+                    else:
+                        tick_font, tick_rotation = 8, 45
+                    # sector charts are not displayed in the report
+                    if not self.chart_data:
+                        plot_specs.append(PlotSpec(plot_counts,
+                                                   file_path=file_path,
+                                                   title=title,
+                                                   labels=merged[f].values.tolist(),
+                                                   target_counts=merged['count_target'].values,
+                                                   deidentified_counts=
+                                                   merged['count_deidentified'].values,
+                                                   tick_fontsize=tick_font,
+                                                   tick_rotation=tick_rotation))
+                        saved_file_paths.append(file_path)
                     self.uni_counts[f][f"Industry Category {s}"] = {
                         "divergence": div,
                         "counts": relative_path(save_data_frame(merged,
                                                 o_path,
                                                 f"Industry Category {s}"),
                                                 level=level),
-                        "plot": relative_path(file_path, level=level)
+                        "plot": None if self.chart_data
+                        else relative_path(file_path, level=level)
                     }
-                    # if j < 2:
-                    saved_file_paths.append(file_path)
-
                     self.feat_data[title] = {
                         "path": ''
                     }
             else:
-                plt.figure(figsize=(8, 3), dpi=100)
                 file_path = Path(o_path, f'{f}.jpg')
-                synthetic = col_comb.getDataframeByColumns(columns = [f],
-                                                           wpf_values = wpf_values,
-                                                           wpf_feature = wpf_feature,
-                                                           version = 'd_')
-                values = set(target[f].unique().tolist()).union(synthetic[f].unique().tolist())
-                values = sorted(values)
-                val_df = pd.DataFrame(values, columns=[f])
-                t_counts_df = target.groupby(by=f)[f].size().reset_index(name='count_target')
-                s_counts_df = synthetic.groupby(by=f)[f].size().reset_index(name='count_deidentified')
-                merged = pd.merge(left=val_df, right=t_counts_df, on=f, how='left')\
-                    .fillna(0)
-                merged = pd.merge(left=merged, right=s_counts_df, on=f, how='left')\
-                    .fillna(0)
+                if counts is None:
+                    counts = UnivariateCounts(target, features, col_comb,
+                                              wpf_values, wpf_feature)
+                merged = counts.counts(f)
                 # merged = merged.sort_values(by=f)
                 title = f"{f}: {dataset.data_dict[f]['description']}"
                 c_sort_merged = merged.sort_values(by='count_target', ascending=False)
@@ -256,7 +351,7 @@ class UnivariatePlots:
                                                             o_path,
                                                             f'{f}_counts'),
                                             level=level),
-                    "plot": relative_path(file_path, level)
+                    "plot": None if self.chart_data else relative_path(file_path, level)
                 }
 
                 if self.worst_univariates_to_display is None \
@@ -277,24 +372,13 @@ class UnivariatePlots:
 
                 merged = c_sort_merged.sort_values(by=f)
 
-                x_axis = np.arange(merged.shape[0])
-                plt.bar(x_axis - 0.2, merged['count_target'], width=bar_width, label='Target')
-                plt.bar(x_axis + 0.2, merged['count_deidentified'], width=bar_width, label='Deidentified')
-                plt.xlabel('Feature Values')
-                plt.ylabel('Record Counts')
                 vals = merged[f].values.tolist()
 
                 if f in ['AGEP', 'POVPIP', 'PINCP', 'PWGTP', 'WGTP']:
-                    updated_vals = []
-                    for v in vals:
-                        mv1 = o_tar[target[f].isin([v])][f].values.tolist()
-                        mv = mv1
-                        if len(mv) and v != -1:
-                            nv = min(mv)
-                            updated_vals.append(nv)
-                        else:
-                            updated_vals.append(v)
-                    vals = updated_vals
+                    # label bins with the smallest target value they contain
+                    bin_min = o_tar[f].groupby(target[f].values).min()
+                    vals = [bin_min[v] if v in bin_min.index and v != -1 else v
+                            for v in vals]
 
                 vals = [str(v) for v in vals]
 
@@ -306,22 +390,27 @@ class UnivariatePlots:
                     f_val_dict = {i: v for i, v in enumerate(ds.schema[f]['values'])}
                     vals = [f_val_dict[int(v)] if v != 'N' else 'N' for v in vals]
 
-                plt.gca().set_xticks(x_axis, vals)
-                plt.legend(loc='upper right')
-                plt.xticks(fontsize=8, rotation=45)
-                plt.tight_layout()
-
-                plt.title(title,
-                          fontdict={'fontsize': 12})
-
-                plt.savefig(Path(o_path, f'{f}.jpg'), bbox_inches='tight')
-                plt.close()
-
-                if self.worst_univariates_to_display is None \
-                        or i < self.worst_univariates_to_display:
-                    saved_file_paths.append(file_path)
-                    self.feat_data[title]['path'] = file_path
-
+                displayed = self.worst_univariates_to_display is None \
+                    or i < self.worst_univariates_to_display
+                if not self.chart_data:
+                    plot_specs.append(PlotSpec(plot_counts,
+                                               file_path=file_path,
+                                               title=title,
+                                               labels=vals,
+                                               target_counts=merged['count_target'].values,
+                                               deidentified_counts=
+                                               merged['count_deidentified'].values))
+                    if displayed:
+                        saved_file_paths.append(file_path)
+                        self.feat_data[title]['path'] = file_path
+                elif displayed:
+                    # no image is saved, the chart is drawn from its data
+                    self.feat_data[title]['chart'] = \
+                        counts_chart(title, vals,
+                                     merged['count_target'].values,
+                                     merged['count_deidentified'].values)
+
+        render(plot_specs)
         return saved_file_paths
 
 def divergence(synthetic: pd.DataFrame,
@@ -330,38 +419,18 @@ def divergence(synthetic: pd.DataFrame,
                ignore_features: Optional[List[str]] = None,
                col_comb: Optional[ColumnCombs] = None,
                wpf_values: Optional[List] = None,
-               wpf_feature: Optional[str] = None):
+               wpf_feature: Optional[str] = None,
+               counts: Optional[UnivariateCounts] = None):
     if not ignore_features:
         ignore_features = []
 
-    # Need to make a copy because may overwrite this with synthetic version
-    synthetic = synthetic.copy()
-    div_data = []  # divergence data
     tfeats = target.columns.tolist()
     sfeats = synthetic.columns.tolist()
-    for var, var_schema in schema.items():
-        if var not in tfeats or var not in sfeats:
-            continue
-        if var in ignore_features:
-            continue
-        synthetic = col_comb.getDataframeByColumns(columns = [var],
-                                                   wpf_values = wpf_values,
-                                                   wpf_feature = wpf_feature,
-                                                   version = 'd_')
-        values = set(target[var].unique().tolist()).union(synthetic[var].unique().tolist())
-        values = sorted(values)
-        val_df = pd.DataFrame(values, columns=[var])
-
-        s_counts_df = synthetic.groupby(by=var)[var].size().reset_index(name=COUNT)
-        t_counts_df = target.groupby(by=var)[var].size().reset_index(name=COUNT)
-
-        s_counts_df = pd.merge(left=val_df, right=s_counts_df, on=var, how='left', sort=True)\
-            .fillna(0)
-        t_counts_df = pd.merge(left=val_df, right=t_counts_df, on=var, how='left', sort=True)\
-            .fillna(0)
-
-        div = l1(pk=s_counts_df[COUNT], qk=t_counts_df[COUNT])
-        div_data.append([var, div])
+    features = [var for var in schema
+                if var in tfeats and var in sfeats and var not in ignore_features]
+    if counts is None:
+        counts = UnivariateCounts(target, features, col_comb, wpf_values, wpf_feature)
+    div_data = [[var, counts.divergence(var)] for var in features]  # divergence data
 
     return pd.DataFrame(div_data, columns=[FEATURE, DIVERGENCE])\
         .sort_values(by=DIVERGENCE, ascending=False)
@@ -31,6 +31,7 @@ class AttachmentType(Enum):
     ImageLinksHorizontal = "image_links_horizontal"
     String = 'string'
     ParaAndImage = 'para_and_image'
+    ChartData = 'chart_data'
 
 
 
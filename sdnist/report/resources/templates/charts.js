@@ -0,0 +1,125 @@
+// Draws the charts of 'chart_data' attachments as inline SVG. Each chart
+// is a div with class "chart-div" whose data-chart attribute holds the
+// chart data written by the report generator.
+(function () {
+    var SVG_NS = 'http://www.w3.org/2000/svg';
+    var TARGET_COLOR = '#4c72b0';
+    var DEID_COLOR = '#dd8452';
+
+    function el(name, attrs, parent, text) {
+        var e = document.createElementNS(SVG_NS, name);
+        for (var k in attrs) {
+            e.setAttribute(k, attrs[k]);
+        }
+        if (text !== undefined) {
+            e.textContent = text;
+        }
+        if (parent) {
+            parent.appendChild(e);
+        }
+        return e;
+    }
+
+    function svg(width, height) {
+        return el('svg', {width: width, height: height,
+                          viewBox: '0 0 ' + width + ' ' + height,
+                          'font-family': 'sans-serif'});
+    }
+
+    function title(s, text, width) {
+        el('text', {x: width / 2, y: 16, 'text-anchor': 'middle',
+                    'font-size': 14}, s, text);
+    }
+
+    // grouped bars of target and deidentified record counts per feature value
+    function bars(c) {
+        var width = 800, height = 320;
+        var left = 60, right = 10, top = 30, bottom = 70;
+        var s = svg(width, height);
+        title(s, c.title, width);
+        var n = c.labels.length;
+        var maxCount = Math.max.apply(null, c.target.concat(c.deidentified).concat([1]));
+        var plotW = width - left - right, plotH = height - top - bottom;
+        var step = plotW / Math.max(n, 1);
+        var barW = step * 0.4;
+        var y = function (v) { return top + plotH - v / maxCount * plotH; };
+
+        for (var t = 0; t <= 4; t++) {
+            var v = Math.round(maxCount * t / 4);
+            el('line', {x1: left, x2: width - right, y1: y(v), y2: y(v),
+                        stroke: '#dddddd'}, s);
+            el('text', {x: left - 5, y: y(v) + 4, 'text-anchor': 'end',
+                        'font-size': 10}, s, v);
+        }
+        for (var i = 0; i < n; i++) {
+            var x = left + i * step + step / 2;
+            var tv = c.target[i], dv = c.deidentified[i];
+            el('rect', {x: x - barW, y: y(tv), width: barW, height: y(0) - y(tv),
+                        fill: TARGET_COLOR}, s);
+            el('rect', {x: x, y: y(dv), width: barW, height: y(0) - y(dv),
+                        fill: DEID_COLOR}, s);
+            el('title', {}, s.lastChild, c.labels[i] + ': ' + tv + ' target, ' +
+               dv + ' deidentified');
+            el('text', {x: x, y: top + plotH + 12, 'font-size': n > 30 ? 6 : 9,
+                        'text-anchor': 'end',
+                        transform: 'rotate(-45 ' + x + ' ' + (top + plotH + 12) + ')'},
+               s, c.labels[i]);
+        }
+        el('text', {x: left + plotW / 2, y: height - 5, 'text-anchor': 'middle',
+                    'font-size': 11}, s, 'Feature Values');
+        el('text', {x: 12, y: top + plotH / 2, 'text-anchor': 'middle', 'font-size': 11,
+                    transform: 'rotate(-90 12 ' + (top + plotH / 2) + ')'},
+           s, 'Record Counts');
+        var legend = [['Target', TARGET_COLOR], ['Deidentified', DEID_COLOR]];
+        for (var j = 0; j < legend.length; j++) {
+            el('rect', {x: width - 120, y: top + j * 16, width: 10, height: 10,
+                        fill: legend[j][1]}, s);
+            el('text', {x: width - 105, y: top + j * 16 + 9, 'font-size': 11},
+               s, legend[j][0]);
+        }
+        return s;
+    }
+
+    // matrix of values in [0, vmax], white to blue
+    function heatmap(c) {
+        var n = c.columns.length, m = c.index.length;
+        var cell = Math.max(12, Math.min(30, Math.floor(420 / Math.max(n, m, 1))));
+        var left = 120, top = 30, bottom = 120;
+        var width = left + n * cell + 20, height = top + m * cell + bottom;
+        var s = svg(width, height);
+        title(s, c.title, width);
+        for (var i = 0; i < m; i++) {
+            el('text', {x: left - 4, y: top + i * cell + cell / 2 + 4,
+                        'text-anchor': 'end', 'font-size': 10}, s, c.index[i]);
+            for (var j = 0; j < n; j++) {
+                var v = c.values[i][j];
+                var f = v === null ? 0 : Math.min(1, Math.max(0, v / c.vmax));
+                var fill = v === null ? '#ffffff' :
+                    'rgb(' + Math.round(247 - 239 * f) + ',' + Math.round(251 - 203 * f) +
+                    ',' + Math.round(255 - 148 * f) + ')';
+                el('rect', {x: left + j * cell, y: top + i * cell, width: cell,
+                            height: cell, fill: fill}, s);
+                el('title', {}, s.lastChild, c.index[i] + ', ' + c.columns[j] + ': ' +
+                   (v === null ? 'N/A' : v.toFixed(4)));
+            }
+        }
+        for (var k = 0; k < n; k++) {
+            var x = left + k * cell + cell / 2, y0 = top + m * cell + 6;
+            el('text', {x: x, y: y0, 'text-anchor': 'end', 'font-size': 10,
+                        transform: 'rotate(-90 ' + x + ' ' + y0 + ')'}, s, c.columns[k]);
+        }
+        return s;
+    }
+
+    var kinds = {bars: bars, heatmap: heatmap};
+
+    document.addEventListener('DOMContentLoaded', function () {
+        var divs = document.querySelectorAll('.chart-div');
+        for (var i = 0; i < divs.length; i++) {
+            var c = JSON.parse(divs[i].getAttribute('data-chart'));
+            if (c.kind in kinds) {
+                divs[i].appendChild(kinds[c.kind](c));
+            }
+        }
+    });
+})();
@@ -113,4 +113,18 @@ unique_exact_match_para_4 = "The Target Data Properties below provides an estima
                             "of those uniquely identifiable individuals that are still " \
                             "present in the deidentified data. " \
                             "Because they are unique, real records, they are " \
-                            "potentially vulnerable to reidentification."
\ No newline at end of file
+                            "potentially vulnerable to reidentification."
+dcr_para = "How close is each deidentified record to a real record? For every deidentified record we find " \
+           "the closest target data record, measuring the distance over all features scaled to the [0, 1] range " \
+           "of the target data. A distance of 0 means the deidentified record is an exact copy of a target record. " \
+           "Many very small distances suggest the deidentified data reproduces real individuals, while larger " \
+           "distances mean deidentified records are not close to any single target record."
+
+dcr_puma_para = "Distance to closest record distribution of the deidentified records in each PUMA."
+
+query_tables_para = "The query based attack above is repeated on every deidentified data table that contains " \
+                    "all quasi-identifiers. For each table, an attacker finds the deidentified records that are " \
+                    "unique on the quasi-identifiers and also unique among target records, and infers all other " \
+                    "features of the table at once. Matches are the records whose inferred features all equal " \
+                    "the target record's features, and the mean feature match percent is the percent of equal " \
+                    "values averaged over the inferred features."
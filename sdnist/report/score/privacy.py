@@ -1,9 +1,10 @@
-from typing import Tuple
+from typing import Dict, Tuple
 from pathlib import Path
 
 from sdnist.report import Dataset, ReportData, ReportUIData
 from sdnist.report.plots import ApparentMatchDistributionPlot
 from sdnist.metrics.unique_exact_matches import unique_exact_matches
+from sdnist.metrics.dcr import DCR
 from sdnist.report.report_data import \
     PrivacyScorePacket, Attachment, AttachmentType
 from sdnist.report.column_combs.column_combs import ColumnCombs
@@ -80,7 +81,9 @@ def privacy_score(dataset: Dataset,
                                                  r_ui_d.output_directory,
                                                  quasi_idf,
                                                  excluded,
-                                                 col_comb = col_comb)
+                                                 col_comb = col_comb,
+                                                 n_workers=ds.config.get(QUERY_ATTACK, dict())
+                                                 .get(N_WORKERS, None))
         amd_plot_paths = amd_plot.save()
         rd.add('apparent_match_distribution', amd_plot.report_data)
     else:
@@ -119,6 +122,13 @@ def privacy_score(dataset: Dataset,
                      _data=[{IMAGE_NAME: Path(p).stem, PATH: p}
                             for p in rel_cdp_saved_file_paths],
                      _type=AttachmentType.ImageLinks)
+    # Query based attack on every deidentified table with the quasi-identifiers
+    qt_para_a = Attachment(name='Query Matches by Deidentified Table',
+                           _data=query_tables_para,
+                           _type=AttachmentType.String)
+    qt_table = Attachment(name=None,
+                          _data=amd_plot.table_matches.round(4).to_dict(orient='records'),
+                          _type=AttachmentType.Table)
     r_ui_d.add(PrivacyScorePacket("Apparent Match Distribution",
                               None,
                               [amd_para_a,
@@ -127,8 +137,55 @@ def privacy_score(dataset: Dataset,
                                rec_mat_para_a,
                                total_quasi_matched,
                                adp_para_a,
-                               adp]))
+                               adp,
+                               qt_para_a,
+                               qt_table]))
+    log.end_msg()
+
+    log.msg('Distance to Closest Record', level=3)
+    dcr_pkt, dcr_rd = distance_to_closest_record(ds, r_ui_d)
+    r_ui_d.add(dcr_pkt)
+    rd.add('distance_to_closest_record', dcr_rd)
     log.end_msg()
 
 
     return r_ui_d, rd
+
+
+def distance_to_closest_record(dataset: Dataset,
+                               ui_data: ReportUIData) \
+        -> Tuple[PrivacyScorePacket, Dict[str, any]]:
+    ds = dataset
+    config = ds.config.get(DCR, dict())
+    o_path = Path(ui_data.output_directory, 'distance_to_closest_record')
+    create_path(o_path)
+
+    groups = None
+    if 'PUMA' in ds.c_synthetic_data.columns:
+        groups = ds.c_synthetic_data['PUMA']
+    dcr = DCR(ds.t_target_data, ds.t_synthetic_data, groups,
+              block_size=config.get(BLOCK_SIZE, 10000),
+              n_workers=config.get(N_WORKERS, None))
+    dcr.compute()
+
+    summary = dcr.summary.round(4)
+    attachments = [Attachment(name=None,
+                              _data=dcr_para,
+                              _type=AttachmentType.String),
+                   Attachment(name=None,
+                              _data=summary.to_dict(orient='records'),
+                              _type=AttachmentType.Table)]
+    report_data = {"summary": summary.to_dict(orient='records')[0]}
+    if dcr.group_summary is not None:
+        group_summary = dcr.group_summary.round(4)
+        attachments.append(Attachment(name='Distance to Closest Record by PUMA',
+                                      _data=dcr_puma_para,
+                                      _type=AttachmentType.String))
+        attachments.append(Attachment(name=None,
+                                      _data=group_summary.reset_index()
+                                      .rename(columns={'group': 'PUMA'})
+                                      .to_dict(orient='records'),
+                                      _type=AttachmentType.Table))
+        report_data["puma_summary"] = \
+            relative_path(save_data_frame(group_summary, o_path, 'puma_summary'))
+    return PrivacyScorePacket(DCR.NAME, None, attachments), report_data
@@ -11,7 +11,8 @@ from sdnist.metrics.hoc import \
 from sdnist.metrics.graph_edge_map import \
     TaxiGraphEdgeMapScore
 from sdnist.metrics.propensity import \
-    PropensityMSE
+    PropensityMSE, PropensityCache, propensity_mse_scores, \
+    COMBINATION_SCORE_COLUMNS, CACHED_COLUMN
 from sdnist.metrics.pearson_correlation import \
     PearsonCorrelationDifference
 
@@ -22,6 +23,7 @@ from sdnist.report.score.utility.inconsistency import \
     InconsistenciesReport
 from sdnist.report.score.utility.pca import PCAReport
 from sdnist.report import Dataset
+from sdnist.report.dataset.codec import FeatureCodec
 from sdnist.report.column_combs.column_combs import ColumnCombs
 from sdnist.report.report_data import \
     ReportData, ReportUIData, UtilityScorePacket, Attachment, AttachmentType, \
@@ -34,11 +36,18 @@ import sdnist.strs as strs
 from sdnist.utils import *
 
 
+def ci_column(alpha: float) -> str:
+    # column name of k-marginal bootstrap confidence intervals in report tables
+    return f'{(1 - alpha) * 100:g}% Bias-Corrected Bootstrap Confidence Interval'
+
+
 def best_worst_performing(scores: pd.Series,
                           subsample_group_scores: pd.DataFrame,
                           dataset: Dataset,
                           group_features: List[str],
-                          feature_values: Dict[str, Dict]) -> Tuple[List, List]:
+                          feature_values: Dict[str, Dict],
+                          scores_ci: Optional[pd.DataFrame] = None,
+                          ci_alpha: Optional[float] = None) -> Tuple[List, List]:
 
     def feat_name_value(feature, feature_val):
         feature_val = str(feature_val)
@@ -80,6 +89,9 @@ def best_worst_performing(scores: pd.Series,
             "40% Target Subsample Baseline": int(ss.loc[wf, 1]),
             'Deidentified Data ' + strs.SCORE.capitalize(): int(ss.loc[wf, 0])
         })
+        if scores_ci is not None:
+            worst_scores[-1][ci_column(ci_alpha)] = \
+                f"[{int(scores_ci.loc[wf, 'lower'])}, {int(scores_ci.loc[wf, 'upper'])}]"
 
     ss = ss.sort_values(by=[0], ascending=False)
 
@@ -95,6 +107,9 @@ def best_worst_performing(scores: pd.Series,
             "40% Target Subsample Baseline": int(ss.loc[bf, 1]),
             strs.SCORE.capitalize(): int(ss.loc[bf, 0])
         })
+        if scores_ci is not None:
+            best_scores[-1][ci_column(ci_alpha)] = \
+                f"[{int(scores_ci.loc[bf, 'lower'])}, {int(scores_ci.loc[bf, 'upper'])}]"
 
     return worst_scores, best_scores
 
@@ -116,19 +131,18 @@ def worst_score_breakdown(worst_scores: List,
         wsh[feature] = wsh[feature].apply(lambda x: list(x)[0])
 
     wpf = wsh[feature].unique().tolist()[:5]  # worst performing feature values
-    t = dataset.d_target_data.copy()
-    s = dataset.d_synthetic_data.copy()
-
-    t = t[dataset.target_data[feature].isin(wpf)]
-    s = s[dataset.synthetic_data[feature].isin(wpf)]
+    t = dataset.target_group_index[feature].take(dataset.d_target_data, wpf)
+    s = dataset.synthetic_group_index[feature].take(dataset.d_synthetic_data, wpf)
 
     out_dir = Path(r_ui_d.output_directory, 'k_marginal_breakdown')
     if not out_dir.exists():
         os.mkdir(out_dir)
 
+    chart_data = ds.config.get(strs.CHART_DATA, False)
     up = UnivariatePlots(s, t,
                          ds, out_dir, ds.challenge, worst_univariates_to_display=3,
-                         col_comb=col_comb, wpf_values=wpf, wpf_feature=feature)
+                         col_comb=col_comb, wpf_values=wpf, wpf_feature=feature,
+                         chart_data=chart_data)
     u_feature_data = up.save(level=3)
     k_marg_break_rd[f'worst_{len(wpf)}_puma_univariate'] = up.report_data(level=3)
     k_marg_break_rd[f'worst_{len(wpf)}_puma_k_marginal_scores'] = \
@@ -147,10 +161,10 @@ def worst_score_breakdown(worst_scores: List,
                            _type=AttachmentType.String))
 
     for k, v in u_feature_data.items():
-        u_path = v['path']
-        if len(str(u_path)) == 0:
+        # features shown as chart data have no image path
+        u_path = v.get('path', '')
+        if len(str(u_path)) == 0 and 'chart' not in v:
             continue
-        u_rel_path = relative_path(u_path, level=3)
         name = k
         a = Attachment(name=None,
                        _data=f'h4{name}',
@@ -183,10 +197,16 @@ def worst_score_breakdown(worst_scores: List,
                            _type=AttachmentType.String)
             u_as.append(a)
 
-        a = Attachment(name=None,
-                       _data=[{strs.IMAGE_NAME: Path(u_rel_path).stem,
-                               strs.PATH: u_rel_path}],
-                       _type=AttachmentType.ImageLinks)
+        if 'chart' in v:
+            a = Attachment(name=None,
+                           _data=v['chart'],
+                           _type=AttachmentType.ChartData)
+        else:
+            u_rel_path = relative_path(u_path, level=3)
+            a = Attachment(name=None,
+                           _data=[{strs.IMAGE_NAME: Path(u_rel_path).stem,
+                                   strs.PATH: u_rel_path}],
+                           _type=AttachmentType.ImageLinks)
         u_as.append(a)
     corr_features = ds.config[strs.CORRELATION_FEATURES]
     corr_features = [f for f in ds.data_dict.keys() if f in corr_features]
@@ -196,7 +216,7 @@ def worst_score_breakdown(worst_scores: List,
                                        wpf_values=wpf,
                                        wpf_feature=feature)
     pcd.compute()
-    pcp = PearsonCorrelationPlot(pcd.pp_corr_diff, out_dir)
+    pcp = PearsonCorrelationPlot(pcd.pp_corr_diff, out_dir, chart_data=chart_data)
     pcp_saved_file_paths = pcp.save(path_level=3)
     k_marg_break_rd['correlation_difference'] = {
         "pearson_correlation_difference": pcp.report_data
@@ -231,10 +251,15 @@ def worst_score_breakdown(worst_scores: List,
                            + feature,
                            _data=pear_corr_worst_para,
                            _type=AttachmentType.String)
-    a_pc = Attachment(name=None,
-                      _data=[{strs.IMAGE_NAME: Path(p).stem, strs.PATH: p}
-                             for p in rel_pcp_saved_file_paths],
-                      _type=AttachmentType.ImageLinks)
+    if pcp.chart:
+        a_pc = Attachment(name=None,
+                          _data=pcp.chart,
+                          _type=AttachmentType.ChartData)
+    else:
+        a_pc = Attachment(name=None,
+                          _data=[{strs.IMAGE_NAME: Path(p).stem, strs.PATH: p}
+                                 for p in rel_pcp_saved_file_paths],
+                          _type=AttachmentType.ImageLinks)
 
     return [a_para_rt, a_rt] + u_as + [a_para_pc, a_pc], k_marg_break_rd
 
@@ -295,7 +320,10 @@ def kmarginal_score_packet(k_marginal_score: int,
                            worst_breakdown_feature: str,
                            group_features: List[str],
                            group_scores: Optional[pd.DataFrame] = None,
-                           col_comb: Optional[ColumnCombs] = None) \
+                           col_comb: Optional[ColumnCombs] = None,
+                           score_ci: Optional[Tuple[float, float]] = None,
+                           group_scores_ci: Optional[pd.DataFrame] = None,
+                           ci_alpha: Optional[float] = None) \
         -> Tuple[UtilityScorePacket, UtilityScorePacket]:
 
     def min_index(data_list: List[float]):
@@ -356,6 +384,8 @@ def kmarginal_score_packet(k_marginal_score: int,
         relative_path(save_data_frame(sedf_df, k_marg_synopsys_path, 'subsample_error_comparison'))
     k_marg_synop_rd['sub_sampling_equivalent'] = int(min_frac * 100)
     k_marg_synop_rd['k_marginal_score'] = k_marginal_score
+    if score_ci is not None:
+        k_marg_synop_rd['k_marginal_score_ci'] = [int(score_ci[0]), int(score_ci[1])]
 
     report_data.add('k_marginal', {
         "k_marginal_synopsys": k_marg_synop_rd
@@ -370,7 +400,14 @@ def kmarginal_score_packet(k_marginal_score: int,
     kms_a = Attachment(name=None,
                        _data=f"Highlight-K-Marginal Score: {k_marginal_score}",
                        _type=AttachmentType.String)
-    attachments = [kmp_a, kms_a, ss_para_a, ssf_a, sed_a]
+    attachments = [kmp_a, kms_a]
+    if score_ci is not None:
+        # k marg score confidence interval attachment
+        kmci_a = Attachment(name=None,
+                            _data=f"{ci_column(ci_alpha)}: [{int(score_ci[0])}, {int(score_ci[1])}]",
+                            _type=AttachmentType.String)
+        attachments.append(kmci_a)
+    attachments.extend([ss_para_a, ssf_a, sed_a])
 
     kmarg_sum_pkt = UtilityScorePacket('K-Marginal Synopsys',
                                        None,
@@ -382,7 +419,9 @@ def kmarginal_score_packet(k_marginal_score: int,
                                                           subsample_group_scores,
                                                           dataset,
                                                           group_features,
-                                                          feature_values)
+                                                          feature_values,
+                                                          group_scores_ci,
+                                                          ci_alpha)
         all_scores = worst_scores
         # target pumas
         t_pumas = dataset.target_data['PUMA'].unique()
@@ -492,19 +531,20 @@ def utility_score(dataset: Dataset, ui_data: ReportUIData, report_data: ReportDa
     # selected challenge type: census or taxi
     if ds.challenge == strs.CENSUS:
         log.msg('Univariates', level=3)
+        chart_data = ds.config.get(strs.CHART_DATA, False)
         up = UnivariatePlots(ds.d_synthetic_data, ds.d_target_data,
                              ds, r_ui_d.output_directory, ds.challenge,
-                             col_comb=col_comb)
+                             col_comb=col_comb, chart_data=chart_data)
         u_feature_data = up.save()  # univariate features data
         rd.add('Univariate', up.report_data())
 
         u_as = []  # univariate attachments
 
         for k, v in u_feature_data.items():
-            u_path = v['path']
-            if len(str(u_path)) == 0:
+            # features shown as chart data have no image path
+            u_path = v.get('path', '')
+            if len(str(u_path)) == 0 and 'chart' not in v:
                 continue
-            u_rel_path = "/".join(list(u_path.parts)[-2:])
             name = k
             a = Attachment(name=None,
                            _data=f'h4{name}',
@@ -539,10 +579,16 @@ def utility_score(dataset: Dataset, ui_data: ReportUIData, report_data: ReportDa
                                _type=AttachmentType.String)
                 u_as.append(a)
 
-            a = Attachment(name=None,
-                           _data=[{strs.IMAGE_NAME: Path(u_rel_path).stem,
-                                  strs.PATH: u_rel_path}],
-                           _type=AttachmentType.ImageLinks)
+            if 'chart' in v:
+                a = Attachment(name=None,
+                               _data=v['chart'],
+                               _type=AttachmentType.ChartData)
+            else:
+                u_rel_path = "/".join(list(u_path.parts)[-2:])
+                a = Attachment(name=None,
+                               _data=[{strs.IMAGE_NAME: Path(u_rel_path).stem,
+                                      strs.PATH: u_rel_path}],
+                               _type=AttachmentType.ImageLinks)
             u_as.append(a)
 
 
@@ -551,21 +597,27 @@ def utility_score(dataset: Dataset, ui_data: ReportUIData, report_data: ReportDa
         log.msg('Correlations', level=3)
         cdp_saved_file_paths = []
         pcp_saved_file_paths = []
+        cdp_chart, pcp_chart = None, None  # chart data if images are not saved
         if len(corr_features) > 1:
             cdp = CorrelationDifferencePlot(ds.t_synthetic_data,
                                             ds.t_target_data,
                                             r_ui_d.output_directory,
                                             corr_features,
-                                            col_comb=col_comb)
+                                            col_comb=col_comb,
+                                            chart_data=chart_data)
             cdp_saved_file_paths = cdp.save()
+            cdp_chart = cdp.chart
 
             pcd = PearsonCorrelationDifference(ds.t_target_data,
                                                ds.t_synthetic_data,
                                                corr_features,
-                                               col_comb=col_comb)
+                                               col_comb=col_comb,
+                                               group_feature='PUMA')
             pcd.compute()
-            pcp = PearsonCorrelationPlot(pcd.pp_corr_diff, r_ui_d.output_directory)
+            pcp = PearsonCorrelationPlot(pcd.pp_corr_diff, r_ui_d.output_directory,
+                                         chart_data=chart_data)
             pcp_saved_file_paths = pcp.save()
+            pcp_chart = pcp.chart
 
             rd.add('Correlations', {"kendall correlation difference": cdp.report_data,
                                     "pearson correlation difference": pcp.report_data})
@@ -591,6 +643,9 @@ def utility_score(dataset: Dataset, ui_data: ReportUIData, report_data: ReportDa
                   col_comb=col_comb)
 
     s.compute_score()
+    n_replicates = ds.config[strs.K_MARGINAL].get(strs.BOOTSTRAP_REPLICATES, 0)
+    if n_replicates:
+        s.compute_ci(n_replicates, random_state=0)
     metric_name = s.NAME
 
     metric_score = int(s.score)
@@ -611,29 +666,73 @@ def utility_score(dataset: Dataset, ui_data: ReportUIData, report_data: ReportDa
                                                               'PUMA',
                                                               group_features,
                                                               group_scores,
-                                                              col_comb=col_comb)
+                                                              col_comb=col_comb,
+                                                              score_ci=s.score_ci,
+                                                              group_scores_ci=s.scores_ci,
+                                                              ci_alpha=s.ci_alpha)
     log.end_msg()
 
     log.msg('PropensityMSE', level=3)
     # Compute a propensity score for each combination except the
     # full combination
-    score_sums = []
+    prop_config = ds.config.get(strs.PROPENSITY, dict())
+    random_state = prop_config.get(strs.RANDOM_STATE, None)
     all_combs = col_comb.getAllColumnCombinations()
-    for columns in all_combs:
-        data = col_comb.getDataframeByColumns(columns, version = 't_')
-        s = PropensityMSE(ds.t_target_data[columns],
-                          data,
-                          r_ui_d.output_directory,
-                          columns)
-        score_sums.append(s.compute_score())
+    # reuse scores of combinations whose data did not change, within this
+    # run and since previous runs. A relative cache path is in the directory
+    # of the report directories of all runs, a null one turns the file off.
+    cache_path = prop_config.get(strs.CACHE_PATH, None)
+    if cache_path is not None:
+        cache_path = Path(Path(r_ui_d.output_directory).parent, cache_path)
+    prop_cache = PropensityCache(cache_path, prop_config.get(strs.CACHE_SIZE, 10000))
+    # codes of the union of target and synthetic values, codes are order
+    # preserving so the propensity trees make the same splits
+    codec = FeatureCodec([ds.t_target_data, ds.t_synthetic_data] +
+                         [c.t_synthetic_data for c in col_comb.comb_dataframes.values()])
+    comb_keys = []  # cache key of each combination
+    cached = []  # cached scores of each combination, None if not cached
+
+    def new_comb_data():
+        # target and synthetic code matrices of each combination not in the
+        # cache, built one at a time as the process pool takes them
+        for columns in all_combs:
+            t = ds.t_target_data[columns]
+            s = col_comb.getDataframeByColumns(columns, version='t_')[columns]
+            comb_keys.append(PropensityCache.key(t, s, random_state))
+            cached.append(prop_cache.get(comb_keys[-1]))
+            if cached[-1] is None:
+                yield codec.encode(t, columns), codec.encode(s, columns)
+
+    new_scores = propensity_mse_scores(new_comb_data(),
+                                       n_workers=prop_config.get(strs.N_WORKERS, None),
+                                       random_state=random_state)
+    new_combs = [i for i, c in enumerate(cached) if c is None]
+    for i, scores in zip(new_combs, new_scores.values.tolist()):
+        prop_cache.put(comb_keys[i], scores)
+    prop_cache.save()
+    comb_scores = pd.DataFrame([prop_cache.scores[k] for k in comb_keys],
+                               columns=COMBINATION_SCORE_COLUMNS)
+    # no tree was fit in this run for cached scores
+    comb_scores[CACHED_COLUMN] = [c is not None for c in cached]
+    comb_scores.loc[comb_scores[CACHED_COLUMN], 'fit_time'] = 0.0
+    comb_scores.insert(0, 'columns', ['.'.join(columns) for columns in all_combs])
+    score_sums = comb_scores['pmse'].tolist()
     # Then compute propensity score for the complete set, this time
     # saving the results in a backwards compatible way
-    s = PropensityMSE(ds.t_target_data,
-                      ds.t_synthetic_data,
+    s = PropensityMSE(codec.encode(ds.t_target_data, features),
+                      codec.encode(ds.t_synthetic_data, features),
                       r_ui_d.output_directory,
-                      features)
-    score_sums.append(s.compute_score())
-    s.save_score(sum(score_sums)/len(score_sums))
+                      features,
+                      random_state=random_state,
+                      sample_size=prop_config.get(strs.SAMPLE_SIZE, None),
+                      n_replicates=prop_config.get(strs.REPLICATES, 5))
+    s.compute_score()
+    # a sampled score is larger than scores of all records, it is reported
+    # separately instead of averaged with the combination scores
+    if not s.sampled:
+        score_sums.append(s.pmse_score)
+    s.save_score(sum(score_sums)/len(score_sums) if len(score_sums) else s.pmse_score,
+                 comb_scores)
     metric_name = s.NAME
 
     metric_score = int(s.score) if s.score > 100 else round(s.score, 3)
@@ -664,9 +763,20 @@ def utility_score(dataset: Dataset, ui_data: ReportUIData, report_data: ReportDa
                              for p in rel_pd_path],
                       _type=AttachmentType.ImageLinks)
 
+    prop_attachments = [pd_para_a, pd_score_a]
+    if s.sampled:
+        prop_attachments.append(
+            Attachment(name=None,
+                       _data=f"All features pMSE of {s.n_replicates} samples of "
+                             f"{s.sample_size} records: {round(s.pmse_score, 4)}, "
+                             f"95% CI [{round(s.pmse_ci[0], 4)}, {round(s.pmse_ci[1], 4)}]. "
+                             f"pMSE of samples is larger than pMSE of all records, "
+                             f"so it is not included in the score.",
+                       _type=AttachmentType.String))
+    prop_attachments.append(pd_a)
     prop_pkt = UtilityScorePacket(metric_name,
                                   None,
-                                  [pd_para_a, pd_score_a, pd_a])
+                                  prop_attachments)
 
     log.end_msg()
 
@@ -678,29 +788,39 @@ def utility_score(dataset: Dataset, ui_data: ReportUIData, report_data: ReportDa
     corr_metric_a.append(Attachment(name=None,
                                     _data=corr_para,
                                     _type=AttachmentType.String))
-    if len(cdp_saved_file_paths):
+    if len(cdp_saved_file_paths) or cdp_chart:
         rel_cdp_saved_file_paths = ["/".join(list(p.parts)[-2:])
                                     for p in cdp_saved_file_paths]
         ktc_p_a = Attachment(name="Kendall Tau Correlation Coefficient Difference",
                                _data=kend_corr_para,
                                _type=AttachmentType.String)
-        ktc_a = Attachment(name=None,
-                           _data=[{strs.IMAGE_NAME: Path(p).stem, strs.PATH: p}
-                                  for p in rel_cdp_saved_file_paths],
-                           _type=AttachmentType.ImageLinks)
+        if cdp_chart:
+            ktc_a = Attachment(name=None,
+                               _data=cdp_chart,
+                               _type=AttachmentType.ChartData)
+        else:
+            ktc_a = Attachment(name=None,
+                               _data=[{strs.IMAGE_NAME: Path(p).stem, strs.PATH: p}
+                                      for p in rel_cdp_saved_file_paths],
+                               _type=AttachmentType.ImageLinks)
         corr_metric_a.append(ktc_p_a)
         corr_metric_a.append(ktc_a)
 
-    if len(pcp_saved_file_paths):
+    if len(pcp_saved_file_paths) or pcp_chart:
         rel_pcp_saved_file_paths = ["/".join(list(p.parts)[-2:])
                                     for p in pcp_saved_file_paths]
         pc_para_a = Attachment(name="Pearson Correlation Coefficient Difference",
                                _data=pear_corr_para,
                                _type=AttachmentType.String)
-        pc_a = Attachment(name=None,
-                          _data=[{strs.IMAGE_NAME: Path(p).stem, strs.PATH: p}
-                                 for p in rel_pcp_saved_file_paths],
-                          _type=AttachmentType.ImageLinks)
+        if pcp_chart:
+            pc_a = Attachment(name=None,
+                              _data=pcp_chart,
+                              _type=AttachmentType.ChartData)
+        else:
+            pc_a = Attachment(name=None,
+                              _data=[{strs.IMAGE_NAME: Path(p).stem, strs.PATH: p}
+                                     for p in rel_pcp_saved_file_paths],
+                              _type=AttachmentType.ImageLinks)
         corr_metric_a.append(pc_para_a)
         corr_metric_a.append(pc_a)
 
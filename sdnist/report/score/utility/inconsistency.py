@@ -9,6 +9,7 @@ from sdnist.report.report_data import \
     ReportData, ReportUIData, UtilityScorePacket, Attachment, AttachmentType
 
 from sdnist.utils import *
+import sdnist.strs as strs
 
 ic_paragraphs = [
     "In real world tabular data, it's common for record features to have "
@@ -39,6 +40,8 @@ class InconsistenciesReport:
                  report_data: ReportData,
                  col_comb: Optional[ColumnCombs] = None):
         self.s = dataset.c_synthetic_data
+        # json file of custom inconsistency rules, default rules if None
+        self.rules_path = dataset.config.get(strs.INCONSISTENCY_RULES, None)
         self.r_ui_d = ui_data
         self.rd = report_data
         self.col_comb = col_comb
@@ -58,7 +61,8 @@ class InconsistenciesReport:
         create_path(o_path)  # create path if does not already exist
 
         # initialize an instance of inconsistencies metric
-        self.ic = Inconsistencies(self.s, o_path, col_comb=self.col_comb)
+        self.ic = Inconsistencies(self.s, o_path, col_comb=self.col_comb,
+                                  rules_path=self.rules_path)
         self.ic.compute()  # compute inconsistencies in deidentified data
 
         # add inconsistencies stats and data to json report data
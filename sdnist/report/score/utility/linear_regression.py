@@ -10,12 +10,14 @@ from sdnist.report.report_data import \
 import sdnist.strs as strs
 from sdnist.utils import *
 from sdnist.report.column_combs.column_combs import ColumnCombs
+from sdnist.report.plots.render import render
 
 
 def compute_linear_regression(target: pd.DataFrame,
                               synthetic: pd.DataFrame,
                               output_dir: Path,
-                              data_dictionary: Dict):
+                              data_dictionary: Dict,
+                              render_plots: bool = True):
     tar = target
     syn = synthetic
     o_dir = output_dir
@@ -23,7 +25,7 @@ def compute_linear_regression(target: pd.DataFrame,
     reg_m = LinearRegressionMetric(tar, syn, data_dictionary, o_dir)
 
     reg_m.compute()
-    reg_m_paths = reg_m.plots()
+    reg_m_paths = reg_m.plots(render_plots)
 
     return reg_m, reg_m_paths
 
@@ -131,8 +133,11 @@ class LinearRegressionReport:
             ss = df_filter(self.s, v[1])
             reg, image_path = compute_linear_regression(ts, ss, k_o_path,
                                                         {k: self.d_dict[k]
-                                                            for k in self.REQUIRED_FEATURES})
+                                                            for k in self.REQUIRED_FEATURES},
+                                                        render_plots=False)
             self.eval_data[k] = [reg, image_path]
+        # density plots of all groups are rendered together
+        render([v[0].plot_spec for v in self.eval_data.values() if len(v)])
 
         # create report attachments
         for p in lr_paragraphs:
@@ -1,16 +1,22 @@
 ALL_COMPONENTS_PAIR_PLOT = 'all_components_pair_plot'
 BIAS_PENALTY_CUTOFF = 'bias_penalty_cutoff'
 BINS = 'bins'
+BLOCK_SIZE = 'block_size'
+BOOTSTRAP_REPLICATES = 'bootstrap_replicates'
+CACHE_PATH = 'cache_path'
+CACHE_SIZE = 'cache_size'
 CENSUS = 'census'
 CONFIG = 'config'
 COUNT = 'count'
 CHALLENGE = 'challenge'
+CHART_DATA = 'chart_data'
 CORRELATION = 'correlation'
 CORRELATION_DIFFERENCE = 'correlation_difference'
 CORRELATION_FEATURES = 'correlation_features'
 DATA = 'data'
 DATA_DESCRIPTION = 'data_description'
 DATA_ROOT = 'data_root'
+DCR = 'dcr'
 DATASET_NAME = 'dataset_name'
 DIVERGENCE = 'divergence'
 DOWNLOAD = 'download'
@@ -23,11 +29,18 @@ GROUP_FEATURES = 'group_features'
 HIGHLIGHTED = 'highlighted'
 IGNORE_FEATURES = 'ignore_features'
 IMAGE_NAME = 'image_name'
+INCONSISTENCY_RULES = 'inconsistency_rules'
 K_MARGINAL = 'k_marginal'
 LABELS_DICT = 'labels_dict'
+N_WORKERS = 'n_workers'
 OUTPUT_DIRECTORY = 'output_directory'
 PATH = 'path'
+PROPENSITY = 'propensity'
 PUBLIC = 'public'
+QUERY_ATTACK = 'query_attack'
+RANDOM_STATE = 'random_state'
+REPLICATES = 'replicates'
+SAMPLE_SIZE = 'sample_size'
 SCHEMA = 'schema'
 SCORE = 'score'
 SYNTHETIC = 'synthetic'
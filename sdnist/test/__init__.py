@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# sdnist.report first: metrics modules import its submodules, which run
+# sdnist.report and its scores, which import the metrics modules back
+import sdnist.report  # noqa: F401
+from sdnist.report.column_combs.column_combs import ColumnCombs, _makeColumnsKey
+from sdnist.report.dataset.group_index import GroupIndex
+
+
+def column_combs(tables: List[pd.DataFrame], group_feature: str = 'PUMA') -> ColumnCombs:
+    """
+    ColumnCombs of in memory synthetic tables, each table is used as all
+    versions of its data. The table with most columns is the default one.
+    """
+    cc = object.__new__(ColumnCombs)
+    cc.exact_matches_only = False
+    cc.encountered_combs = []
+    cc.missing_combs = []
+    cc.comb_dataframes = dict()
+    cc.comb_counts = dict()
+    cc.comb_moments = dict()
+    for t in sorted(tables, key=lambda t: t.shape[1]):
+        group_index = {group_feature: GroupIndex(t[group_feature])} \
+            if group_feature in t.columns else dict()
+        cc.default_col_key = _makeColumnsKey(t.columns.tolist())
+        cc.comb_dataframes[cc.default_col_key] = \
+            SimpleNamespace(synthetic_data=t, c_synthetic_data=t, t_synthetic_data=t,
+                            d_synthetic_data=t, synthetic_group_index=group_index)
+    return cc
+
+
+def census_data(n: int, seed: int, n_pumas: int = 3) -> pd.DataFrame:
+    """Random binned census records, MSP is N for some records"""
+    rng = np.random.default_rng(seed)
+    age = rng.integers(0, 20, n)
+    return pd.DataFrame({'PUMA': rng.integers(0, n_pumas, n),
+                         'YEAR': rng.integers(0, 2, n),
+                         'AGEP': age,
+                         'SEX': rng.integers(1, 3, n),
+                         'MSP': rng.choice([1, 2, 'N'], n).astype(object),
+                         'PINCP': age * 1000 + rng.integers(0, 20000, n),
+                         'NOC': rng.integers(0, 5, n),
+                         'INDP': rng.integers(0, 5, n)})
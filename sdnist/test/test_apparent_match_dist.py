@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from sdnist.metrics.apparent_match_dist import cellchange
+
+
+def _cellchange_frames(df1, df2, quasi, exclude_cols):
+    # merge based cellchange the encoded matrices must agree with
+    uniques1 = df1.drop_duplicates(subset=quasi, keep=False)
+    uniques2 = df2.drop_duplicates(subset=quasi, keep=False)
+    matcheduniq = uniques1.merge(uniques2, how='inner', on=quasi)
+    cols = set(df1.columns).intersection(set(df2.columns)) - set(quasi) - set(exclude_cols)
+    S = pd.Series(data=0, index=matcheduniq.index)
+    for c in cols:
+        S = S + (matcheduniq[c + '_x'] == matcheduniq[c + '_y']).astype(int)
+    return (S / len(cols)) * 100, uniques1, uniques2, matcheduniq
+
+
+def _data(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'PUMA': rng.integers(0, 3, n),
+                         'AGEP': rng.integers(0, 8, n),
+                         'SEX': rng.integers(1, 3, n),
+                         'MSP': rng.choice(['N', '1', '2'], n),
+                         'PINCP': rng.choice([0.0, 5.0, np.nan], n),
+                         'HISP': rng.integers(0, 2, n)})
+
+
+def test_cellchange():
+    target = _data(30, 0)
+    # records of the target data with some values changed, and new records
+    deid = pd.concat([target.iloc[:20].where(_data(20, 1) != 0, _data(20, 2)),
+                      _data(20, 3)], ignore_index=True)
+    deid.index = deid.index + 1000
+    quasi, exclude = ['PUMA', 'AGEP', 'SEX'], ['HISP']
+    percents, u1, u2, matched = cellchange(target, deid, quasi, exclude)
+    e_percents, e_u1, e_u2, e_matched = _cellchange_frames(target, deid, quasi, exclude)
+
+    # partial matches, and missing values that are never equal
+    assert {0, 50, 100} <= set(percents)
+    assert matched[['PINCP_x', 'PINCP_y']].isna().all(axis=1).any()
+    pd.testing.assert_frame_equal(u1, e_u1)
+    pd.testing.assert_frame_equal(u2, e_u2)
+    pd.testing.assert_frame_equal(matched, e_matched)
+    np.testing.assert_allclose(percents.to_numpy(), e_percents.to_numpy())
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from sdnist.metrics.pearson_correlation import PearsonCorrelationDifference
+from sdnist.report.column_combs.column_combs import _joint_counts
+from sdnist.report.dataset.group_index import GroupIndex
+from sdnist.test import census_data, column_combs
+
+FEATURES = ['PUMA', 'AGEP', 'PINCP', 'NOC']
+
+
+def test_group_moments_correlations():
+    table = census_data(400, 0, n_pumas=4)[FEATURES]
+    features = ['AGEP', 'PINCP', 'NOC']
+    cc = column_combs([table])
+    pcd = PearsonCorrelationDifference(table, table, features, col_comb=cc,
+                                       group_feature='PUMA')
+
+    for group_feature in ['PUMA', None]:
+        pcd.group_feature = group_feature
+        corr = pcd.pair_wise_correlations(table, col_comb=cc)
+        pd.testing.assert_frame_equal(corr, table[features].astype(float).corr(),
+                                      check_exact=False, rtol=0, atol=1e-12)
+    # 5 is not a PUMA of the table
+    for wpf in [[1], [0, 3], [2, 5]]:
+        corr = pcd.pair_wise_correlations(table, col_comb=cc,
+                                          wpf_values=wpf, wpf_feature='PUMA')
+        expected = table[table['PUMA'].isin(wpf)][features].astype(float).corr()
+        pd.testing.assert_frame_equal(corr, expected,
+                                      check_exact=False, rtol=0, atol=1e-12)
+    # moments of each PUMA are computed once, and the moments of all records
+    # of the table without groups
+    assert sorted(k[2] for k in cc.comb_moments if k[2]) == ['PUMA']
+    assert len(cc.comb_moments) == 2
+
+
+def test_wpf_rows():
+    table = census_data(300, 1, n_pumas=4)[FEATURES]
+    pair = table[['AGEP', 'PUMA']].iloc[::3]
+    cc = column_combs([table, pair])
+    for t in [table, pair]:
+        # binned data, records are selected by the PUMA of the initial data
+        key = '.'.join(sorted(t.columns))
+        cc.comb_dataframes[key].d_synthetic_data = t // 10
+
+    # 7 is not a PUMA of the tables
+    for wpf in [[2], [0, 3], [1, 7], [7]]:
+        for columns in [['AGEP'], ['NOC']]:
+            requested = list(columns)
+            selected = cc.getDataframeByColumns(requested, wpf_values=wpf,
+                                                wpf_feature='PUMA', version='d_')
+            assert requested == columns
+            initial = pair if columns == ['AGEP'] else table
+            expected = (initial // 10)[initial['PUMA'].isin(wpf)]
+            pd.testing.assert_frame_equal(selected, expected)
+
+        # rows of a subset of the indexed data
+        index = GroupIndex(table['PUMA'])
+        subset = table.iloc[::2]
+        pd.testing.assert_frame_equal(index.take(table, wpf), table[table['PUMA'].isin(wpf)])
+        pd.testing.assert_frame_equal(index.take(subset, wpf), subset[subset['PUMA'].isin(wpf)])
+
+
+def _counts(rows: pd.DataFrame, counts: np.ndarray) -> dict:
+    return dict(zip(rows.itertuples(index=False, name=None), counts.tolist()))
+
+
+def _group_sizes(data: pd.DataFrame, columns: list) -> dict:
+    sizes = data.groupby(columns).size()
+    return {k if isinstance(k, tuple) else (k,): v for k, v in sizes.items()}
+
+
+def test_counts_by_columns():
+    table = census_data(300, 2, n_pumas=4)[FEATURES]
+    c_table = table.astype(object)
+    c_table.loc[table['NOC'] == 0, 'NOC'] = 'N'
+    cc = column_combs([table])
+    key = cc.default_col_key
+    cc.comb_dataframes[key].c_synthetic_data = c_table
+    cc.comb_dataframes[key].d_synthetic_data = table // 10
+    cc.comb_counts[key] = _joint_counts(table // 10)
+
+    for version, data in [('t_', table), ('c_', c_table), ('d_', table // 10)]:
+        # all columns of the table and projections on subsets of them
+        for columns in [['AGEP', 'NOC', 'PINCP', 'PUMA'], ['PUMA', 'NOC'], ['AGEP']]:
+            rows, counts = cc.getCountsByColumns(columns, version=version)
+            assert rows.columns.tolist() == columns
+            assert _counts(rows, counts) == _group_sizes(data, columns)
+
+    col_key, rows, counts = cc.getJointCountsByColumns(['AGEP'])
+    assert col_key == key
+    assert _counts(rows, counts) == _group_sizes(table // 10, rows.columns.tolist())
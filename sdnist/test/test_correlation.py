@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import kendalltau
+
+from sdnist.test import census_data
+from sdnist.report.plots.correlation import \
+    correlations, _contingency_table, _kendall_tau_b
+
+
+def _binned(data: pd.DataFrame) -> pd.DataFrame:
+    # binned incomes, correlated with AGEP and with many ties
+    return data[['PUMA', 'AGEP', 'SEX', 'NOC']].assign(PINCP=data['PINCP'] // 5000)
+
+
+def test_kendall_tau_b():
+    data = _binned(census_data(500, 0))
+    features = data.columns.tolist()
+    corr = correlations(data, features)
+    for f_a in features:
+        for f_b in features:
+            expected = kendalltau(data[f_a], data[f_b]).statistic
+            assert np.isclose(corr.loc[f_a, f_b], expected, rtol=0, atol=1e-12)
+
+
+def test_kendall_tau_b_counts():
+    data = _binned(census_data(300, 1))
+    # a constant feature has no correlation
+    data['ONE'] = 1
+    rows = data[['AGEP', 'ONE']].value_counts().reset_index()
+    table = _contingency_table(rows['AGEP'].values, rows['ONE'].values, rows['count'].values)
+    assert np.isnan(_kendall_tau_b(table)).all()
+
+    # counts of the distinct rows give the correlation of all rows
+    rows = data[['AGEP', 'PINCP']].value_counts().reset_index()
+    table = _contingency_table(rows['AGEP'].values, rows['PINCP'].values, rows['count'].values)
+    expected = kendalltau(data['AGEP'], data['PINCP']).statistic
+    assert np.allclose(_kendall_tau_b(table), expected, rtol=0, atol=1e-12)
@@ -0,0 +1,209 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from sdnist.metrics.inconsistency import \
+    load_rules, get_ic_checks, _one_compute_pass
+
+
+def test_custom_rules(tmp_path):
+    rules = [{"group": "a", "name": "child_MSP",
+              "description": "Children (< 15) can't be married",
+              "features": ["AGEP", "MSP"],
+              "checks": [{"predicate": "AGEP_num < 15 & ~MSP_N"}]},
+             {"group": "h", "name": "too_many_children",
+              "description": "Family size must be greater than number of children",
+              "features": ["NOC", "NPF"],
+              "checks": [{"predicate": "~NOC_N & ~NPF_N & ~(NOC_int < NPF_int)"}]}]
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps(rules))
+    checks = get_ic_checks(load_rules(path))
+
+    data = pd.DataFrame({"AGEP": [3, 40, 10, 12],
+                         "MSP": ['N', 1, 2, 'N']}, index=[5, 6, 7, 8])
+    ic_dict = {r["name"]: [] for r in rules}
+    _one_compute_pass(data, ic_dict, checks)
+    # NOC and NPF are not in the table, their rule is not evaluated
+    assert ic_dict == {"child_MSP": [7], "too_many_children": []}
+
+
+def _row_loop(data, ic_dict):
+    # baseline row by row engine the column masks must agree with
+    # look through records, register violations for each row
+    # i = record id, r = record values
+    fl = list(data.columns)
+    for i, r in data.iterrows():
+        # -------------------age related inconsistencies---------------
+        if "AGEP" in fl and r["AGEP"] < 15:
+            if "DVET" in fl and not (r["DVET"] == 'N'):
+                ic_dict["child_DVET"].append(i)
+            if "MSP" in fl and not (r["MSP"] == 'N'):
+                ic_dict["child_MSP"].append(i)
+            if "PINCP" in fl and not (r["PINCP"] == 'N'):
+                ic_dict["child_PINCP"].append(i)
+            if "PINCP_DECILE" in fl and not (r["PINCP_DECILE"] == 'N'):
+                ic_dict["child_PINCP_DECILE"].append(i)
+            if "INDP" in fl and not (r["INDP"] == 'N'):
+                ic_dict["child_INDP"].append(i)
+            if "INDP_CAT" in fl and not (r["INDP_CAT"] == 'N'):
+                ic_dict["child_INDP_CAT"].append(i)
+            if "EDU" in fl and not (r["EDU"] == 'N') and not (int(r["EDU"]) < 12):
+                ic_dict["child_phd"].append(i)
+
+            if r["AGEP"] < 10:
+                # if "NOC" in fl and not (r["NOC"] == 'N'):
+                #     ic_dict["child_NOC"].append(i)
+
+                if r["AGEP"] < 5:
+                    if "DPHY" in fl and not (r["DPHY"] == 'N'):
+                        ic_dict["toddler_DPHY"].append(i)
+                    if "DREM" in fl and not (r["DREM"] == 'N'):
+                        ic_dict["toddler_DREM"].append(i)
+                    if "EDU" in fl and not (r["EDU"] == 'N') and not (int(r["EDU"]) < 5):
+                        ic_dict["toddler_diploma"].append(i)
+
+                    if r["AGEP"] < 3:
+                        if "EDU" in fl and not (r["EDU"] == 'N'):
+                            ic_dict["infant_EDU"].append(i)
+
+        if not ("AGEP" in fl):
+            # This forces agreement on MSP, PINCP and PINCP_DECILE if at least 2 exist.
+            if ("MSP" in fl and (r["MSP"] == 'N')) and (
+                    ("PINCP" in fl and not (r["PINCP"] == 'N')) or (
+                    "PINCP_DECILE" in fl and not (r["PINCP_DECILE"] == 'N'))):
+                ic_dict["adult_child"].append(i)
+            if ("MSP" in fl and not (r["MSP"] == 'N')) and (
+                    ("PINCP" in fl and (r["PINCP"] == 'N')) or (
+                    "PINCP_DECILE" in fl and (r["PINCP_DECILE"] == 'N'))):
+                ic_dict["adult_child"].append(i)
+            if not ("MSP" in fl) and ("PINCP" in fl) and ("PINCP_DECILE" in fl):
+                if ((r["PINCP"] == 'N') and not (r["PINCP_DECILE"] == 'N')) or (
+                        not (r["PINCP"] == 'N') and (r["PINCP_DECILE"] == 'N')):
+                    ic_dict["adult_child"].append(i)
+
+        # this catches adults who still have the child 'N' for their features.
+        if "AGEP" in fl and r["AGEP"] > 15:
+            if "MSP" in fl and (r["MSP"] == 'N'):
+                ic_dict["adult_N_MSP"].append(i)
+            if "PINCP" in fl and (r["PINCP"] == 'N'):
+                ic_dict["adult_N_PINCP"].append(i)
+            if "PINCP_DECILE" in fl and (r["PINCP_DECILE"] == 'N'):
+                ic_dict["adult_N_PINCP_DECILE"].append(i)
+            if "EDU" in fl and (r["EDU"] == 'N'):
+                ic_dict["adult_N_EDU"].append(i)
+            if "DPHY" in fl and (r["DPHY"] == 'N'):
+                ic_dict["adult_N_DPHY"].append(i)
+            if "DREM" in fl and (r["DREM"] == 'N'):
+                ic_dict["adult_N_DREM"].append(i)
+
+
+        # -------------------work and finance related inconsistencies---------------
+        # income > 300K
+        if "PINCP" in fl and not (r["PINCP"] == 'N') and float(r["PINCP"]) > 3000000:
+            if "POVPIP" in fl and not (r["POVPIP"] == "501"):
+                ic_dict["wealthy_poor_POVPIP"].append(i)
+            if "PINCP_DECILE" in fl and not (int(r["PINCP_DECILE"]) > 1):
+                ic_dict["wealthy_poor_POVPIP"].append(i)
+
+        # this currently just checks null value agreement,
+        # if one is null the other should be too
+        if "INDP" in fl and "INDP_CAT" in fl:
+            if ((r["INDP"] == "N") and (r["INDP_CAT"] != "N") or (r["INDP"] != "N") and (
+                    r["INDP_CAT"] == "N")):
+                ic_dict["invalid_INDP_CAT"].append(i)
+                # TODO: add INDP CAT and INDP code agreement checks
+
+        # -------------------housing and family related inconsistencies---------------
+        if ("NOC" in fl) and ("NPF" in fl) and (r["NOC"] != "N") and (r["NPF"] != "N"):
+            if not (int(r["NOC"]) < int(r["NPF"])):
+                ic_dict["too_many_children"].append(i)
+
+        # if group quarters (according to HOUSING_TYPE)
+        if ("HOUSING_TYPE" in fl) and (r["HOUSING_TYPE"] > 1):
+            if "NOC" in fl and not (r["NOC"] == 'N'):
+                ic_dict["gq_h_family_NOC"].append(i)
+
+            if "NPF" in fl and not (r["NPF"] == 'N'):
+                ic_dict["gq_h_family_NPF"].append(i)
+
+            if "OWN_RENT" in fl and (r["OWN_RENT"] == 2):
+                ic_dict["gq_own_jail"].append(i)
+
+            if (r["HOUSING_TYPE"] == 2) and "OWN_RENT" in fl and (r["OWN_RENT"] == 1):
+                ic_dict["gq_own_jail"].append(i)
+
+            if (r["HOUSING_TYPE"] == 3) and "OWN_RENT" in fl and (r["OWN_RENT"] == 1):
+                ic_dict["gq_own_dorm"].append(i)
+
+        # if house (according to HOUSING_TYPE)
+        if ("HOUSING_TYPE" in fl) and (int(r["HOUSING_TYPE"]) == 1):
+            if "OWN_RENT" in fl and (r["OWN_RENT"] == 0):
+                ic_dict["house_OWN_RENT"].append(i)
+
+            if "NOC" in fl and (r["NOC"] == 'N'):
+                ic_dict["house_NOC"].append(i)
+
+        # if group quarters (according to RENT_OWN)
+        if ("RENT_OWN" in fl) and (int(r["RENT_OWN"]) == 0):
+            if "NOC" in fl and not (r["NOC"] == 'N'):
+                ic_dict["gq_ro_family_NOC"].append(i)
+
+            if "NPF" in fl and not (r["NPF"] == 'N'):
+                ic_dict["gq_ro_family_NPF"].append(i)
+
+
+def _records(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+
+    def with_n(values):
+        # values of features that are N for children and group quarters
+        values = values.astype(object)
+        values[rng.random(n) < 0.3] = 'N'
+        return values
+
+    data = pd.DataFrame({'AGEP': rng.integers(0, 30, n),
+                         'DVET': with_n(rng.integers(1, 5, n)),
+                         'MSP': with_n(rng.integers(1, 6, n)),
+                         'PINCP': with_n(rng.choice([0, 20000, 3000000, 4000000], n)),
+                         'PINCP_DECILE': with_n(rng.integers(0, 3, n)),
+                         'INDP': with_n(rng.integers(100, 200, n)),
+                         'INDP_CAT': with_n(rng.integers(0, 3, n)),
+                         'EDU': with_n(rng.integers(1, 16, n)),
+                         'DPHY': with_n(rng.integers(1, 3, n)),
+                         'DREM': with_n(rng.integers(1, 3, n)),
+                         'NOC': with_n(rng.integers(0, 4, n)),
+                         'NPF': with_n(rng.integers(1, 5, n)),
+                         'POVPIP': with_n(rng.choice([100, 501, '501'], n)),
+                         'HOUSING_TYPE': rng.integers(1, 4, n),
+                         'OWN_RENT': rng.integers(0, 3, n),
+                         'RENT_OWN': rng.integers(0, 3, n)},
+                        index=rng.permutation(np.arange(1000, 1000 + n)))
+    # the row loop expects an income decile of top incomes
+    wealthy = data['PINCP'].isin([3000000, 4000000])
+    data.loc[wealthy & (data['PINCP_DECILE'] == 'N'), 'PINCP_DECILE'] = 1
+    return data
+
+
+def test_row_loop_agreement():
+    rules = load_rules()
+    checks = get_ic_checks(rules)
+    data = _records(400, 0)
+    feature_sets = [r["features"] for r in rules]
+    # tables without AGEP where the adult_child checks apply, a table where
+    # wealthy_poor_POVPIP is registered by both of its checks, and all features
+    feature_sets += [['MSP', 'PINCP'], ['MSP', 'PINCP_DECILE'],
+                     ['PINCP', 'PINCP_DECILE', 'POVPIP'], ['HOUSING_TYPE', 'NOC', 'RENT_OWN'],
+                     data.columns.tolist()]
+    for features in feature_sets:
+        ic_dict = {r["name"]: [] for r in rules}
+        expected = {r["name"]: [] for r in rules}
+        _one_compute_pass(data[features], ic_dict, checks)
+        _row_loop(data[features], expected)
+        assert ic_dict == expected, features
+    # records are registered once for each check they violate
+    assert len(expected["wealthy_poor_POVPIP"]) > len(set(expected["wealthy_poor_POVPIP"]))
+    assert len(expected["adult_child"]) == 0
+    ic_dict = {r["name"]: [] for r in rules}
+    _one_compute_pass(data[['MSP', 'PINCP', 'PINCP_DECILE']], ic_dict, checks)
+    assert len(ic_dict["adult_child"]) > 0
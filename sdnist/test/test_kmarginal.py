@@ -0,0 +1,76 @@
+import numpy as np
+
+from sdnist.test import census_data
+from sdnist.metrics.kmarginal import KMarginal
+from sdnist.report.score.utility import ci_column
+
+FEATURES = ["PUMA", "AGEP", "SEX", "MSP", "INDP"]
+
+
+def test_kmarginal_from_stream():
+    target, deid = census_data(1000, 0)[FEATURES], census_data(700, 1)[FEATURES]
+    for group_features in [None, ["PUMA"]]:
+        km = KMarginal(target, deid, group_features)
+        km.compute_score()
+        chunks = (deid.iloc[i: i + 100] for i in range(0, deid.shape[0], 100))
+        s_km = KMarginal.from_stream(target, chunks, group_features)
+        s_km.compute_score()
+
+        assert np.isclose(km.score, s_km.score)
+        if group_features:
+            assert np.allclose(km.scores, s_km.scores)
+
+
+def test_kmarginal_identical_data():
+    target = census_data(1000, 0)[FEATURES]
+    km = KMarginal(target, target.copy(), ["PUMA"])
+    assert np.isclose(km.compute_score(), 1000)
+    assert np.allclose(km.scores, 1000)
+
+
+def test_kmarginal_k_way():
+    target, deid = census_data(1000, 0)[FEATURES], census_data(700, 1)[FEATURES]
+    km = KMarginal(target, deid, k=3)
+    assert all(len(m) == 3 for m in km.marginal_sets())
+
+    # mean over 3-marginals of the sum of density differences
+    tdds = []
+    for marg in km.marginal_sets():
+        t_den = target.groupby(marg).size() / len(target)
+        s_den = deid.groupby(marg).size() / len(deid)
+        tdds.append(t_den.subtract(s_den, fill_value=0).abs().sum())
+    assert np.isclose(km.compute_score(), (2 - np.mean(tdds)) * 500)
+
+    km = KMarginal(target, target.copy(), ["PUMA"], k=3)
+    assert np.isclose(km.compute_score(), 1000)
+    assert np.allclose(km.scores, 1000)
+
+
+def test_kmarginal_ci_contains_score():
+    target, deid = census_data(1000, 0)[FEATURES], census_data(800, 1)[FEATURES]
+    for group_features in [None, ["PUMA"]]:
+        km = KMarginal(target, deid, group_features)
+        lower, upper = km.compute_ci(200, random_state=0)
+        assert lower <= km.score <= upper
+        if group_features:
+            assert (km.scores_ci['lower'] <= km.scores).all()
+            assert (km.scores <= km.scores_ci['upper']).all()
+
+
+def test_kmarginal_ci_reuses_score():
+    target, deid = census_data(300, 0)[FEATURES], census_data(200, 1)[FEATURES]
+    km = KMarginal(target, deid, ["PUMA"])
+    km.compute_score()
+    n_calls = []
+    km.compute_score = lambda: n_calls.append(1)
+    lower, upper = km.compute_ci(20, alpha=0.1, random_state=0)
+    assert n_calls == [] and km.ci_alpha == 0.1
+    assert ci_column(km.ci_alpha).startswith('90% ')
+
+
+if __name__ == "__main__":
+    test_kmarginal_from_stream()
+    test_kmarginal_identical_data()
+    test_kmarginal_k_way()
+    test_kmarginal_ci_contains_score()
+    test_kmarginal_ci_reuses_score()
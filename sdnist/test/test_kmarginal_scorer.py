@@ -0,0 +1,26 @@
+import numpy as np
+
+from sdnist.test import census_data
+from sdnist.metrics.kmarg_old import CensusKMarginalScore, KMarginalScorer
+
+FEATURES = ["PUMA", "YEAR", "AGEP", "SEX", "MSP", "INDP"]
+
+
+def test_kmarginal_scorer():
+    # the synthetic data has one more PUMA than the private data
+    private = census_data(2000, 0)[FEATURES]
+    synthetic = census_data(1500, 1, n_pumas=4)[FEATURES]
+    for group_features in [None, ["PUMA", "YEAR"]]:
+        for cutoff in [None, 100]:
+            kwargs = dict(seed=7, group_features=group_features,
+                          bias_penalty_cutoff=cutoff)
+            scorer = KMarginalScorer(private, {}, score_cls=CensusKMarginalScore, **kwargs)
+            s = scorer.score(synthetic)
+            expected = CensusKMarginalScore(private, synthetic, {}, **kwargs)
+
+            assert np.isclose(s.score, expected.compute_score())
+            if group_features:
+                assert np.allclose(s.scores.sort_index(), expected.scores.sort_index())
+                if cutoff is not None:
+                    assert s.bias_mask.any()
+                    assert s.bias_mask.sort_index().equals(expected.bias_mask.sort_index())
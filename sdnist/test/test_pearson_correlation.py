@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from sdnist.test import census_data
+from sdnist.metrics.pearson_correlation import \
+    PearsonCorrelationDifference, cross_product_correlations
+
+# with a constant feature
+FEATURES = ['AGEP', 'PINCP', 'NOC', 'ONE']
+
+
+def test_cross_product_correlations():
+    X = census_data(400, 0).assign(ONE=1)[FEATURES].to_numpy(dtype=np.float64)
+    Xc = X - X.mean(axis=0)
+    corr = cross_product_correlations(Xc.T @ Xc)
+    # the constant feature has no correlation, not even with itself
+    assert np.isnan(corr[:, -1]).all() and np.isnan(corr[-1]).all()
+    assert np.allclose(corr[:-1, :-1], np.corrcoef(X[:, :-1], rowvar=False),
+                       rtol=0, atol=1e-12)
+
+
+def test_pearson_correlation_difference():
+    target, synthetic = census_data(400, 0).assign(ONE=1)[FEATURES], census_data(300, 1).assign(ONE=1)[FEATURES]
+    pcd = PearsonCorrelationDifference(target, synthetic)
+    pcd.compute()
+    pd.testing.assert_frame_equal(pcd.target_corr, target.astype(float).corr(),
+                                  check_exact=False, rtol=0, atol=1e-12)
+    pd.testing.assert_frame_equal(pcd.synthetic_corr, synthetic.astype(float).corr(),
+                                  check_exact=False, rtol=0, atol=1e-12)
+    pd.testing.assert_frame_equal(pcd.pp_corr_diff,
+                                  synthetic.astype(float).corr() - target.astype(float).corr(),
+                                  check_exact=False, rtol=0, atol=1e-12)
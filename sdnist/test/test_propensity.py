@@ -0,0 +1,109 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+from sdnist.metrics.propensity import \
+    PropensityCache, PropensityMSE, propensity_bins, propensity_mse_scores
+from sdnist.report.dataset.codec import FeatureCodec
+
+
+def _codes(n: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return np.stack([rng.integers(0, 5, n),  # PUMA
+                     rng.integers(0, 20, n),
+                     rng.integers(0, 3, n)], axis=1)
+
+
+def test_propensity_cache(tmp_path):
+    path = tmp_path / 'propensity.json'
+    c1, c2 = PropensityCache(path, max_entries=3), PropensityCache(path, max_entries=3)
+    for k in ['a', 'b', 'c']:
+        c1.put(k, [0.1, 0.2, 1.0])
+    c1.save()
+    # entries saved by another run are kept, least recently used are evicted
+    c2.put('d', [0.3, 0.4, 2.0])
+    c2.save()
+    assert list(json.loads(path.read_text())) == ['b', 'c', 'd']
+
+    c3 = PropensityCache(path, max_entries=3)
+    assert c3.get('b') == [0.1, 0.2, 1.0]
+    c3.put('e', [0.5, 0.6, 3.0])
+    c3.save()
+    assert list(json.loads(path.read_text())) == ['d', 'b', 'e']
+    assert [p.name for p in tmp_path.iterdir()] == ['propensity.json']
+
+    # cache of a single run is not saved
+    run_cache = PropensityCache()
+    run_cache.put('a', [0.1, 0.2, 1.0])
+    run_cache.save()
+    assert run_cache.get('a') == [0.1, 0.2, 1.0]
+
+
+def test_sampled_pmse(tmp_path):
+    target, deid = _codes(3000, 0), _codes(2500, 1)
+    features = ['PUMA', 'AGEP', 'SEX']
+    s = PropensityMSE(target, deid, tmp_path, features, random_state=0,
+                      sample_size=1000, n_replicates=4)
+    s.compute_score()
+    assert s.sampled
+    lower, upper = s.pmse_ci
+    assert lower <= s.pmse_score <= upper
+    assert 0 < s.ks_score < 1
+    # integer counts of the records of all replicates
+    counts = s.prob_dist.to_numpy()
+    assert counts.dtype.kind == 'i'
+    assert 4 * 990 <= counts[:, 0].sum() <= 4 * 1000
+    assert 4 * 990 <= counts[:, 1].sum() <= 4 * 1000
+
+    s.save_score(0.01)
+    assert s.report_data['pmse_score'] == 0.01
+    assert 'full_pmse_score' not in s.report_data
+    assert s.report_data['sampled_pmse']['pmse'] == s.pmse_score
+
+    # data smaller than the sample size is not sampled
+    s = PropensityMSE(target, deid, tmp_path, features, random_state=0, sample_size=5000)
+    s.compute_score()
+    assert not s.sampled and s.pmse_ci is None
+
+
+def test_codes_match_dataframes(tmp_path):
+    features = ['PUMA', 'AGEP', 'SEX']
+    # sparse values, codes of the union of both tables keep their order
+    target = pd.DataFrame(_codes(2000, 0) * [100, 3, 7], columns=features)
+    deid = pd.DataFrame(_codes(1500, 1) * [100, 3, 7] + [0, 1, 0], columns=features)
+    codec = FeatureCodec([target, deid])
+    t_codes, s_codes = codec.encode(target, features), codec.encode(deid, features)
+
+    d = PropensityMSE(target, deid, tmp_path, features, random_state=0)
+    c = PropensityMSE(t_codes, s_codes, tmp_path, features, random_state=0)
+    d.compute_score()
+    c.compute_score()
+    assert d.pmse_score == c.pmse_score
+    assert d.ks_score == c.ks_score
+    pd.testing.assert_frame_equal(d.prob_dist, c.prob_dist)
+
+    # lazily built pairs scored in a pool give the same scores as in process
+    def pairs():
+        for columns in [features[:2], features[1:], features]:
+            yield codec.encode(target, columns), codec.encode(deid, columns)
+    serial = propensity_mse_scores(pairs(), n_workers=1, random_state=0)
+    pooled = propensity_mse_scores(pairs(), n_workers=2, random_state=0)
+    pd.testing.assert_frame_equal(serial.drop(columns='fit_time'),
+                                  pooled.drop(columns='fit_time'))
+    assert serial['pmse'].iloc[-1] == d.pmse_score
+
+
+def test_propensity_bins():
+    rng = np.random.default_rng(0)
+    prob = np.concatenate([[0.0, 0.005, 0.015, 0.125, 0.475, 0.995, 1.0],
+                           rng.integers(0, 200, 500) / 200,
+                           rng.random(500)])
+    # bins of the records as numpy float probabilities were binned one at a time
+    expected = []
+    for p in prob:
+        pi = math.floor(round(p, 2) * 100)
+        expected.append(pi - 1 if pi == 100 else pi)
+    assert propensity_bins(prob).tolist() == expected
+    assert propensity_bins(np.array([0.475]))[0] == 48
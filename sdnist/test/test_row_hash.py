@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from sdnist.test import census_data
+import sdnist.metrics.row_hash as row_hash
+from sdnist.metrics.row_hash import encode_rows, RowHashIndex
+
+FEATURES = ["AGEP", "SEX", "MSP"]
+
+
+def _check(target: pd.DataFrame, deid: pd.DataFrame):
+    cols = target.columns.tolist()
+    t_codes, d_codes = encode_rows([target, deid], cols)
+    t_index = RowHashIndex(t_codes)
+
+    counts = target.groupby(cols)[cols[0]].transform('count').to_numpy()
+    assert np.array_equal(t_index.unique_rows(), counts == 1)
+
+    d_rows = set(deid.itertuples(index=False, name=None))
+    expected = np.array([r in d_rows for r in target.itertuples(index=False, name=None)])
+    assert np.array_equal(t_index.isin(RowHashIndex(d_codes)), expected)
+
+
+def test_row_hash_index(monkeypatch):
+    target, deid = census_data(1000, 0)[FEATURES], census_data(700, 1)[FEATURES]
+    _check(target, deid)
+
+    # a weak hash makes most distinct rows collide
+    hashes = row_hash.row_hashes
+    monkeypatch.setattr(row_hash, 'row_hashes', lambda c: hashes(c) % np.uint64(7))
+    _check(target, deid)